@@ -13,95 +13,480 @@
 
 import os
 import threading
+import time
 import cmd
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO, emit
-from config_loader import load_config
-from browser import BrowserManager
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from flask import Flask, render_template, jsonify, request, Response, url_for
+from flask_socketio import SocketIO
+from config_loader import load_config, ConfigWatcher, BASE_DIR
+from browser import create_browser_manager
+from metrics import LatencyMetrics, new_trace, stamp
+from outbox import StatusOutbox
+from scheduler import stats_to_prometheus
+from watchdog import report_to_prometheus
+from journal import CommandJournal
+from payloads import check_batch, check_command
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
+# The grid template loops over groups x systems x actions; drop the whitespace its tags leave
+app.jinja_env.trim_blocks = True
+app.jinja_env.lstrip_blocks = True
 socketio = SocketIO(app, async_mode='threading')
 
-# Load Configuration
-config = load_config()
-if not config:
-    print("Failed to load configuration. Exiting.")
-    exit(1)
+# The config and the services built from it are created by create_services(), in the
+# serving process only. Shard processes are spawned, so they import this file again as
+# __mp_main__; they must not load the config, start an outbox or open the journal too.
+config = None
+status_outbox = None
+browser_manager = None
+command_journal = None
+command_pool = None
 
-# Initialize Browser Manager
+# Emits an event to every UI, or to one client with to=sid. Swapped for the
+# ASGI server's own when serving in production mode.
+emitter = socketio.emit
+
+# Status and device state changes are coalesced and broadcast as numbered batches
+# from the outbox's own thread, so a burst or a slow client never holds up the worker
+def emit_status_batch(batch):
+    emitter('status_batch', batch)
+
+# Browser Manager callbacks
 # We need to broadcast status updates to UI
 def on_browser_status_change(sys_id, status):
     print(f"[App] Status update: {sys_id} -> {status}")
-    socketio.emit('status_update', {'system_id': sys_id, 'status': status})
+    status_outbox.put('status', sys_id, status)
+
+def on_device_state_change(sys_id, state):
+    status_outbox.put('state', sys_id, state)
+
+def on_config_reload(new_config):
+    """Applies an edited config.yaml/types.yaml and pushes the re-rendered grid to every UI"""
+    global config_version
+    result = browser_manager.apply_config(new_config)
+    if not result.get('success'):
+        print(f"Config reload failed: {result.get('message')}")
+        return
+    status_outbox.forget(result['removed'])
+    config_version += 1
+    rendered.clear()
+    with app.app_context():
+        grid = render_cached('grid.html')
+    emitter('grid_update', {'html': grid, 'title': config.get('page_title')})
+
+# Pages only change with the config, so each is rendered once per config version
+config_version = 0
+rendered = {} # template -> html, for config_version
+server_run = uuid.uuid4().hex[:12] # part of the page ETag, so a restart invalidates it
 
-browser_manager = BrowserManager(config, status_callback=on_browser_status_change)
+# socket.io client: served from static/vendor when present, so the UI works without internet
+SOCKETIO_CLIENT = 'vendor/socket.io.min.js'
+SOCKETIO_CDN = 'https://cdnjs.cloudflare.com/ajax/libs/socket.io/4.8.1/socket.io.min.js'
+
+def socketio_client_url():
+    if os.path.exists(os.path.join(app.static_folder, SOCKETIO_CLIENT)):
+        return url_for('static', filename=SOCKETIO_CLIENT)
+    return SOCKETIO_CDN
+
+def render_cached(template, **context):
+    html = rendered.get(template)
+    if html is None:
+        html = rendered[template] = render_template(template, config=config, **context)
+    return html
+
+# Rolling per-command latency, fed from the socket handlers
+latency_metrics = LatencyMetrics()
+
+def journal_command(sys_id, abstract_action, status, message, trace=None, flags=None, batch=None, idempotency_key=None):
+    """Journals a finished command with its stage timestamps (epoch s) and end-to-end latency"""
+    trace = trace or {}
+    command_journal.record({
+        'at': trace.get('received', time.time()),
+        'system': sys_id,
+        'action': abstract_action,
+        'status': status,
+        'message': message,
+        'latency_ms': round((trace['emitted'] - trace['received']) * 1000, 3) if 'emitted' in trace else None,
+        'stages': trace,
+        'batch': batch,
+        'idempotency_key': idempotency_key,
+        **(flags or {})
+    })
 
 # Global start removed to prevent double-start with reloader checks in main
 
 @app.route('/')
 def index():
-    return render_template('index.html', config=config)
+    """The dashboard, rendered once per config version and revalidated by ETag"""
+    etag = f'"{server_run}-{config_version}"'
+    if request.headers.get('If-None-Match') == etag:
+        return Response(status=304, headers={'ETag': etag})
+    response = Response(render_cached('index.html', socketio_client=socketio_client_url()), mimetype='text/html')
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'no-cache' # always revalidated, so a reload picks up config edits
+    return response
 
-@socketio.on('request_status')
-def handle_request_status():
+# Socket.IO events: name -> handler(sid, data). Registered with Flask-SocketIO here,
+# and with the ASGI server in production mode.
+socket_events = {}
+
+def socket_event(name):
+    def register(handler):
+        socket_events[name] = handler
+        socketio.on_event(name, lambda data=None: handler(request.sid, data))
+        return handler
+    return register
+
+def reply_later(sid, handler, data, error_reply):
+    """
+    Runs handler(data) -> (event, payload, finish) on the command pool and emits the
+    reply to the client once it is done, then calls finish() (if any) to record it.
+    If the handler raises, error_reply(data, message) -> (event, payload) is sent
+    instead, so the client isn't left waiting on the command.
+    """
+    data = data or {}
+    def done(future):
+        try:
+            event, payload, finish = future.result()
+        except Exception as e:
+            print(f"Error handling command: {e}")
+            event, payload = error_reply(data, f'Internal error: {e}')
+            finish = None
+        emitter(event, payload, to=sid)
+        if finish:
+            finish()
+    command_pool.submit(handler, data).add_done_callback(done)
+
+@socket_event('resync')
+def handle_resync(sid, data):
+    """
+    UI catches up on connect: { 'epoch': ..., 'seq': last batch seen } gets the changes
+    since then, anything else gets every current value. Answered from the outbox, not the worker.
+    """
+    data = data if isinstance(data, dict) else {}
+    emitter('status_sync', status_outbox.sync(data.get('epoch'), data.get('seq')), to=sid)
+
+@socket_event('request_status')
+def handle_request_status(sid, data):
     """UI requests full status snapshot on connect"""
     status = browser_manager.get_status()
-    socketio.emit('full_status_update', status)
+    emitter('full_status_update', status)
+    emitter('full_device_state', browser_manager.get_device_states())
+
+def resolve_action(sys_id, abstract_action):
+    """
+    Resolves an abstract action from config.yaml to the system specific action.
+    Returns (target_action, None) or (None, error_message).
+    """
+    # Precomputed at load time; the misses only need telling apart for the message
+    dispatch = config['compiled'].dispatch.get((sys_id, abstract_action))
+    if dispatch:
+        return dispatch.target_action, None
 
-@socketio.on('execute_command')
-def handle_execution(data):
+    if sys_id not in config['compiled'].systems:
+        return None, 'System not found'
+    if abstract_action not in config['actions']:
+        return None, 'Unknown action'
+    return None, 'Action not supported'
+
+@socket_event('execute_command')
+def handle_execution(sid, data):
     """
-    Received data: { 'system_id': 'camera1', 'action_id': 'record_toggle' }
+    Received data: { 'system_id': 'camera1', 'action_id': 'record_toggle', 'idempotency_key': optional }
     """
+    trace = new_trace() # stamped on arrival, so the wait for a pool thread is counted
+    error = check_command(data)
+    if error:
+        emitter(*command_error(data, error), to=sid)
+        return
+    reply_later(sid, lambda data: run_command(data, trace), data, command_error)
+
+def command_error(data, message):
+    data = data if isinstance(data, dict) else {}
+    return 'command_result', {
+        'system_id': data.get('system_id'), 'action_id': data.get('action_id'), 'status': 'error',
+        'message': message, 'idempotency_key': data.get('idempotency_key')
+    }
+
+def run_command(data, trace=None):
+    """Runs one execute_command request. Returns ('command_result', reply, finish)"""
+    trace = trace or new_trace()
     sys_id = data.get('system_id')
     abstract_action = data.get('action_id')
+    idempotency_key = data.get('idempotency_key')
     
     print(f"Request: {abstract_action} on {sys_id}")
     
-    # Resolve the abstract action from config.yaml to the specific system action
-    # 1. Find the system type
-    sys_config = browser_manager._get_system_config(sys_id)
-    if not sys_config:
-        emit('command_result', {'system_id': sys_id, 'status': 'error', 'message': 'System not found'})
-        return
-
-    sys_type = sys_config.get('type')
-    
-    # 2. Look up the mapping in config['actions']
-    action_config = config['actions'].get(abstract_action)
-    if not action_config:
-         emit('command_result', {'system_id': sys_id, 'status': 'error', 'message': 'Unknown action'})
-         return
-         
-    mappings = action_config.get('mappings', {})
-    target_action = mappings.get(sys_type)
-    
-    if not target_action:
-        # Not mapped for this system type, maybe ignore or error?
-        # If the button exists on UI, it should probably be mapped.
-        emit('command_result', {'system_id': sys_id, 'status': 'error', 'message': 'Action not supported'})
-        return
+    target_action, error = resolve_action(sys_id, abstract_action)
+    if error:
+        def finish_error():
+            stamp(trace, 'emitted')
+            journal_command(sys_id, abstract_action, 'error', error, trace, idempotency_key=idempotency_key)
+        return 'command_result', {
+            'system_id': sys_id, 'action_id': abstract_action, 'status': 'error', 'message': error,
+            'idempotency_key': idempotency_key
+        }, finish_error
 
     # 3. Execute
-    result = browser_manager.execute_command(sys_id, target_action)
+    result = browser_manager.execute_command(sys_id, target_action, trace=trace, idempotency_key=idempotency_key)
     
     status = 'success' if result['success'] else 'error'
-    emit('command_result', {
+
+    def finish():
+        stamp(trace, 'emitted')
+        latency_metrics.record(sys_id, abstract_action, trace)
+        journal_command(sys_id, abstract_action, status, result['message'], trace, result_flags(result), idempotency_key=idempotency_key)
+    return 'command_result', {
         'system_id': sys_id, 
         'action_id': abstract_action,
         'status': status, 
-        'message': result['message']
-    })
+        'message': result['message'],
+        'idempotency_key': idempotency_key,
+        **result_flags(result)
+    }, finish
+
+def result_flags(result):
+    """'skipped' (target state already reached) and 'duplicate' (repeated key), when set"""
+    return {flag: True for flag in ('skipped', 'duplicate') if result.get(flag)}
+
+def resolve_batch(data):
+    """
+    Expands a batch request into (sys_id, abstract_action, target_action) targets.
+    Accepts { 'commands': [{ 'system_id': ..., 'action_id': ... }, ...] }
+    or { 'action_id': 'record_toggle', 'group': 'cameras' | 'all' }.
+    Returns (targets, error_results).
+    """
+    targets = []
+    errors = []
+
+    if 'commands' in data:
+        pairs = [(c.get('system_id'), c.get('action_id')) for c in data['commands']]
+        explicit = True
+    else:
+        abstract_action = data.get('action_id')
+        group = data.get('group', 'all')
+        groups = config['compiled'].groups
+        if group == 'all':
+            sys_ids = list(config['compiled'].systems)
+        elif group in groups:
+            sys_ids = groups[group]
+        else:
+            errors.append({'system_id': None, 'action_id': abstract_action, 'status': 'error', 'message': 'Unknown group'})
+            return targets, errors
+        pairs = [(sys_id, abstract_action) for sys_id in sys_ids]
+        explicit = False
+
+    seen = set()
+    for sys_id, abstract_action in pairs:
+        if sys_id in seen:
+            errors.append({'system_id': sys_id, 'action_id': abstract_action, 'status': 'error', 'message': 'Duplicate system in batch'})
+            continue
+        target_action, error = resolve_action(sys_id, abstract_action)
+        if error:
+            # Group selectors skip systems the action isn't mapped for, like the empty grid cells
+            if explicit or error != 'Action not supported':
+                errors.append({'system_id': sys_id, 'action_id': abstract_action, 'status': 'error', 'message': error})
+            continue
+        seen.add(sys_id)
+        targets.append((sys_id, abstract_action, target_action))
+
+    return targets, errors
+
+def run_batch(data, received=None):
+    """
+    Runs a batch request in a single worker pass, once check_batch has passed it.
+    received: the trace stamped on arrival.
+    Returns (aggregated_result, traces) so the caller can finish the traces after replying.
+    """
+    received = received or new_trace()
+    targets, results = resolve_batch(data)
+    traces = {sys_id: dict(received) for sys_id, _, _ in targets}
+
+    idempotency_key = data.get('idempotency_key')
+    summary = {
+        'success': False, 'results': results, 'skew_ms': 0.0, 'max_deviation_ms': None,
+        'idempotency_key': idempotency_key
+    }
+    if targets:
+        abstract_actions = {sys_id: abstract_action for sys_id, abstract_action, _ in targets}
+        pairs = [(sys_id, target_action) for sys_id, _, target_action in targets]
+        print(f"Batch request: {len(pairs)} commands")
+
+        # Batches of 'scheduled' actions are armed in every page and fired at a shared instant
+        action_configs = [config['actions'][a] for a in set(abstract_actions.values())]
+        if all(a.get('mode') == 'scheduled' for a in action_configs):
+            lead_ms = max(a.get('lead_ms', 500) for a in action_configs)
+            result = browser_manager.execute_scheduled(pairs, lead_ms=lead_ms, traces=traces, idempotency_key=idempotency_key)
+        else:
+            result = browser_manager.execute_fanout(pairs, traces=traces, idempotency_key=idempotency_key)
+
+        dispatched_at = result.get('dispatched_at', {})
+        for sys_id, sys_result in result['results'].items():
+            results.append({
+                'system_id': sys_id,
+                'action_id': abstract_actions[sys_id],
+                'status': 'success' if sys_result['success'] else 'error',
+                'message': sys_result['message'],
+                **result_flags(sys_result)
+            })
+            # When the page actually ran the action (epoch s), for the journal
+            if 'deviation_ms' in sys_result:
+                traces[sys_id]['fired'] = (result['fire_at'] + sys_result['deviation_ms']) / 1000
+            elif sys_id in dispatched_at:
+                traces[sys_id]['dispatched'] = dispatched_at[sys_id] / 1000
+        summary['skew_ms'] = result['skew_ms']
+        summary['max_deviation_ms'] = result.get('max_deviation_ms')
+
+    summary['success'] = bool(results) and all(r['status'] == 'success' for r in results)
+    return summary, traces
+
+def record_batch(summary, traces):
+    batch_id = uuid.uuid4().hex[:12]
+    for r in summary['results']:
+        trace = traces.get(r['system_id'])
+        if trace:
+            stamp(trace, 'emitted')
+            latency_metrics.record(r['system_id'], r['action_id'], trace)
+        journal_command(
+            r['system_id'], r['action_id'], r['status'], r['message'], trace, result_flags(r),
+            batch=batch_id, idempotency_key=summary['idempotency_key']
+        )
+
+@socket_event('execute_batch')
+def handle_batch(sid, data):
+    """
+    Received data: { 'action_id': 'record_toggle', 'group': 'cameras' | 'all' }
+    or { 'commands': [{ 'system_id': 'camera1', 'action_id': 'record_toggle' }, ...] },
+    either with an optional 'idempotency_key'.
+    Replies with one aggregated batch_result.
+    """
+    received = new_trace()
+    error = check_batch(data)
+    if error:
+        emitter(*batch_error(data, error), to=sid)
+        return
+    def run(data):
+        summary, traces = run_batch(data, received)
+        return 'batch_result', summary, lambda: record_batch(summary, traces)
+    reply_later(sid, run, data, batch_error)
+
+def batch_error(data, message):
+    """
+    An error result for every system the batch targets, so their cells stop loading,
+    or a single one when the batch is too malformed to tell.
+    """
+    data = data if isinstance(data, dict) else {}
+    try:
+        targets, _ = resolve_batch(data)
+    except Exception:
+        targets = []
+    results = [
+        {'system_id': sys_id, 'action_id': abstract_action, 'status': 'error', 'message': message}
+        for sys_id, abstract_action, _ in targets
+    ] or [{'system_id': None, 'action_id': data.get('action_id'), 'status': 'error', 'message': message}]
+    return 'batch_result', {
+        'success': False, 'skew_ms': 0.0, 'max_deviation_ms': None,
+        'idempotency_key': data.get('idempotency_key'), 'results': results
+    }
+
+@app.route('/api/execute', methods=['POST'])
+def api_execute():
+    """
+    Batch execution over REST. Same payload and result as the execute_batch event.
+    The idempotency key can also come in an Idempotency-Key header.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict) and request.headers.get('Idempotency-Key'):
+        data.setdefault('idempotency_key', request.headers['Idempotency-Key'])
+    error = check_batch(data)
+    if error:
+        return jsonify({'success': False, 'message': error}), 400
+    summary, traces = run_batch(data)
+    response = jsonify(summary)
+    record_batch(summary, traces)
+    return response
 
 @app.route('/api/status')
 def get_status():
     return jsonify({'status': 'running'})
 
+@app.route('/api/metrics')
+def metrics():
+    """Command latency percentiles, worker queue depths and loop lag. Prometheus text by default, JSON with ?format=json"""
+    scheduler_stats = browser_manager.get_scheduler_stats()
+    watchdog_report = browser_manager.get_watchdog_report(stacks=False)
+    if request.args.get('format') == 'json':
+        return jsonify({**latency_metrics.to_json(), 'scheduler': scheduler_stats, 'watchdog': watchdog_report})
+    text = latency_metrics.to_prometheus() + stats_to_prometheus(scheduler_stats) + report_to_prometheus(watchdog_report)
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/admin/status', methods=['GET'])
 def admin_status():
-    status = browser_manager.get_status()
-    return jsonify(status)
+    """
+    System statuses from the latest snapshot, with an ETag of its version.
+    ?detail=1 adds last change times and last errors. With If-None-Match set to
+    the current ETag, ?wait=N long-polls up to N seconds (max 30) for a change
+    and answers 304 if nothing changed.
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), 30.0)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    snapshot = browser_manager.get_status_snapshot()
+    if request.headers.get('If-None-Match') == snapshot.etag:
+        if wait > 0:
+            snapshot = browser_manager.wait_status_change(snapshot.version, wait)
+        if request.headers.get('If-None-Match') == snapshot.etag:
+            return Response(status=304, headers={'ETag': snapshot.etag})
+
+    if request.args.get('detail'):
+        response = jsonify(snapshot.to_json())
+    else:
+        response = jsonify(snapshot.statuses)
+    response.headers['ETag'] = snapshot.etag
+    return response
+
+@app.route('/api/admin/memory', methods=['GET'])
+def admin_memory():
+    """Per-context JS heap, DOM size, load time and blocked requests"""
+    return jsonify(browser_manager.get_memory_report())
+
+@app.route('/api/admin/watchdog', methods=['GET'])
+def admin_watchdog():
+    """Worker loop lag, task durations, running tasks and recent stalls. ?stacks=0 leaves out the stacks"""
+    return jsonify(browser_manager.get_watchdog_report(stacks=request.args.get('stacks') != '0'))
+
+def parse_time(value):
+    """Epoch seconds or an ISO 8601 time (local unless it has an offset) -> epoch seconds"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/api/admin/journal', methods=['GET'])
+def admin_journal():
+    """
+    Journaled commands, oldest first. Filters: ?since= and ?until= (epoch seconds or
+    ISO 8601), ?system=, ?action=. ?limit= caps the result at the most recent N (default 1000)
+    """
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        limit = int(request.args.get('limit', 1000))
+        if limit < 0:
+            raise ValueError('limit must not be negative')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    entries = command_journal.query(
+        since=since, until=until, sys_id=request.args.get('system'),
+        action=request.args.get('action'), limit=limit
+    )
+    return jsonify({'entries': entries, 'count': len(entries), 'journal': command_journal.stats()})
 
 @app.route('/api/admin/restart', methods=['POST'])
 def admin_restart():
@@ -114,6 +499,7 @@ def admin_restart():
 def admin_shutdown():
     # Helper to stop the server
     browser_manager.close()
+    command_journal.close()
     os._exit(0) # Force exit
     return 'Shutting down...'
 
@@ -123,13 +509,70 @@ class AppShell(cmd.Cmd):
 
     def do_status(self, arg):
         """Show system status"""
-        status = browser_manager.get_status()
-        print(f"\n{'SYSTEM':<20} {'STATUS':<10}")
-        print("-" * 30)
-        for sys_id, state in status.items():
-            print(f"{sys_id:<20} {state:<10}")
+        snapshot = browser_manager.get_status_snapshot()
+        now = time.time()
+        print(f"\n{'SYSTEM':<20} {'STATUS':<10} {'SINCE':>8}  {'RECONNECT':<24} LAST ERROR")
+        print("-" * 86)
+        for sys_id, state in snapshot.statuses.items():
+            since = snapshot.changed_at.get(sys_id)
+            since = f"{now - since:.0f}s" if since else '-'
+            error = snapshot.last_error.get(sys_id, {}).get('message', '')
+            reconnect = snapshot.reconnect.get(sys_id)
+            if reconnect is None:
+                retry = '-'
+            elif reconnect['next_retry_at'] is None:
+                retry = f"attempt {reconnect['attempts']} running"
+            else:
+                retry = f"#{reconnect['attempts'] + 1} in {max(0, reconnect['next_retry_at'] - now):.0f}s"
+                if reconnect['circuit'] != 'closed':
+                    retry += f" ({reconnect['circuit']})"
+            print(f"{sys_id:<20} {state:<10} {since:>8}  {retry:<24} {error}")
         print("") # Newline
 
+    def do_watchdog(self, arg):
+        """Show worker loop lag, task durations and recent stalls. Usage: watchdog [stacks]"""
+        report = browser_manager.get_watchdog_report(stacks=arg == 'stacks')
+        lag = report['loop_lag_ms']
+        print(f"\nLoop lag: p50 {lag.get('p50') or 0:.1f} ms, p99 {lag.get('p99') or 0:.1f} ms, "
+              f"last pass {report['last_beat_ago_ms'] or 0:.0f} ms ago")
+        print(f"\n{'TASK':<14} {'COUNT':>7} {'P50 MS':>9} {'P99 MS':>9}")
+        print("-" * 42)
+        for kind, summary in report['tasks_ms'].items():
+            print(f"{kind:<14} {summary['count']:>7} {summary['p50'] or 0:>9.1f} {summary['p99'] or 0:>9.1f}")
+        for running in report['running']:
+            print(f"Running: {running['kind']} on {running['system'] or ', '.join(running['sys_ids']) or '-'} for {running['running_ms']:.0f} ms")
+        print(f"\nStalls: {report['stall_count']} (threshold {report['stall_ms']:.0f} ms)")
+        for stall in report['stalls']:
+            when = time.strftime('%H:%M:%S', time.localtime(stall['started_at']))
+            finished = f"finished after {stall['finished_after_s']:.1f}s" if stall['finished_after_s'] else 'still running'
+            recycled = ', recycled' if stall['recycled'] else ''
+            print(f"  {when} {stall['kind']} on {stall['system'] or '-'}: {finished}{recycled}")
+            if 'stack' in stall:
+                print(stall['stack'])
+        print("")
+
+    def do_journal(self, arg):
+        """Show journaled commands. Usage: journal [system_id|all] [minutes, default 10]"""
+        parts = arg.split()
+        sys_id = parts[0] if parts and parts[0] != 'all' else None
+        try:
+            minutes = float(parts[1]) if len(parts) > 1 else 10
+        except ValueError:
+            print("Usage: journal [system_id|all] [minutes, default 10]")
+            return
+        entries = command_journal.query(since=time.time() - minutes * 60, sys_id=sys_id, limit=200)
+        print(f"\n{'TIME':<13} {'SYSTEM':<16} {'ACTION':<16} {'STATUS':<8} {'LATENCY':>9}  RAN AT")
+        print("-" * 80)
+        for entry in entries:
+            at = datetime.fromtimestamp(entry['at']).strftime('%H:%M:%S.%f')[:-3]
+            latency = f"{entry['latency_ms']:.1f}ms" if entry['latency_ms'] is not None else '-'
+            stages = entry['stages']
+            ran = stages.get('fired') or stages.get('dispatched') or stages.get('eval_start')
+            ran = datetime.fromtimestamp(ran).strftime('%H:%M:%S.%f')[:-3] if ran else '-'
+            print(f"{at:<13} {entry['system'] or '-':<16} {entry['action'] or '-':<16} {entry['status']:<8} {latency:>9}  {ran}")
+        stats = command_journal.stats()
+        print(f"\n{len(entries)} commands; journal: {stats['written']} written, {stats['dropped']} dropped, {stats['segments']} files\n")
+
     def do_restart(self, arg):
         """Restart sessions. Usage: restart [all|system_id]"""
         target = arg if arg else 'all'
@@ -147,6 +590,7 @@ class AppShell(cmd.Cmd):
         """Shutdown the server"""
         print("Shutting down...")
         browser_manager.close()
+        command_journal.close()
         os._exit(0)
 
     def do_quit(self, arg):
@@ -160,17 +604,65 @@ def run_shell():
     except Exception as e:
         print(f"Shell error: {e}")
 
+def create_services():
+    """Loads the config and builds the services from it. Once per serving process."""
+    global config, status_outbox, browser_manager, command_journal, command_pool
+    config = load_config()
+    if not config:
+        print("Failed to load configuration. Exiting.")
+        exit(1)
+
+    status_outbox = StatusOutbox(emit_status_batch, window=config.get('status_batch_ms', 50) / 1000)
+    browser_manager = create_browser_manager(
+        config,
+        status_callback=on_browser_status_change,
+        state_callback=on_device_state_change
+    )
+    # Every command, written to disk by a background thread for after-the-fact queries
+    command_journal = CommandJournal(
+        os.path.join(BASE_DIR, config.get('journal_dir', 'journal')),
+        max_bytes=config.get('journal_max_mb', 10) * 1024 * 1024,
+        max_segments=config.get('journal_segments', 10)
+    )
+    # Commands wait on the browser for up to seconds; they wait here, on a bounded pool,
+    # rather than in the server thread (or event loop) that received them
+    command_pool = ThreadPoolExecutor(max_workers=config.get('command_workers', 32), thread_name_prefix='command')
+
+def start_services():
+    """Starts the browser, the journal, the config watcher and the CLI. Once per serving process."""
+    browser_manager.start()
+    command_journal.start()
+
+    # Pick up edits to config.yaml/types.yaml without restarting
+    if config.get('hot_reload', True):
+        ConfigWatcher(on_config_reload, interval=config.get('reload_interval', 1.0)).start()
+
+    # Start CLI Thread
+    t = threading.Thread(target=run_shell, daemon=True)
+    t.start()
+
 if __name__ == '__main__':
+    create_services()
     port = config.get('port', 5000)
-    print(f"Starting server on port {port}")
-    
-    # Check if we are in the reloader child process (or if reloader is disabled)
-    # WERKZEUG_RUN_MAIN is 'true' in the child process
-    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
-        browser_manager.start()
-        
-        # Start CLI Thread
-        t = threading.Thread(target=run_shell, daemon=True)
-        t.start()
-        
-    socketio.run(app, host='0.0.0.0', port=port, debug=True)
+
+    if config.get('server', 'development') == 'production':
+        # One process, no reloader: uvicorn serves Socket.IO and Flask on an event loop
+        try:
+            from asgi_server import AsgiServer
+        except ImportError as e:
+            print(f"Production mode needs uvicorn and a2wsgi ({e}). Install them with: pip install uvicorn a2wsgi")
+            exit(1)
+        print(f"Starting production server on port {port}")
+        server = AsgiServer(app, socket_events, http_workers=config.get('http_workers', 16))
+        emitter = server.emit
+        start_services()
+        server.run('0.0.0.0', port)
+        browser_manager.close()
+        command_journal.close()
+    else:
+        print(f"Starting server on port {port}")
+        # Check if we are in the reloader child process (or if reloader is disabled)
+        # WERKZEUG_RUN_MAIN is 'true' in the child process
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_services()
+        socketio.run(app, host='0.0.0.0', port=port, debug=True)
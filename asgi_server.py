@@ -0,0 +1,39 @@
+import asyncio
+import socketio
+import uvicorn
+from a2wsgi import WSGIMiddleware
+
+class AsgiServer:
+    """
+    Production server: Socket.IO and the Flask app on one asyncio loop under uvicorn,
+    instead of Werkzeug's debug server with a thread per connection. Socket events
+    are handled on the loop, so their handlers must hand anything slow to a thread pool.
+    """
+
+    def __init__(self, wsgi_app, events, http_workers=16):
+        self.loop = None
+        self.sio = socketio.AsyncServer(async_mode='asgi')
+        # Plain HTTP (pages, static files, REST) still goes to Flask, on a pool of
+        # http_workers threads, so one slow REST call doesn't hold up the others
+        self.app = socketio.ASGIApp(self.sio, other_asgi_app=WSGIMiddleware(wsgi_app, workers=http_workers))
+        self.sio.on('connect', self._on_connect)
+        for name, handler in events.items():
+            self.sio.on(name, self._wrap(handler))
+
+    async def _on_connect(self, sid, environ, auth=None):
+        self.loop = asyncio.get_running_loop()
+
+    def _wrap(self, handler):
+        async def on_event(sid, data=None):
+            handler(sid, data)
+        return on_event
+
+    def emit(self, event, data, to=None):
+        """Emits from any thread (outbox, command pool, config watcher) without waiting for it to be sent."""
+        if self.loop is None:
+            return # Nobody has connected yet
+        asyncio.run_coroutine_threadsafe(self.sio.emit(event, data, to=to), self.loop)
+
+    def run(self, host, port):
+        """Serves until interrupted."""
+        uvicorn.run(self.app, host=host, port=port, log_level='warning')
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import yaml
+from config_loader import load_config
+from browser import create_browser_manager
+from metrics import RollingHistogram, new_trace, stamp
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BASE_DIR, 'test-endpoints'))
+from virtual_device import start_fleet, wait_ready
+
+# Benchmarks the browser manager against a fleet of virtual cameras:
+#
+#   python bench.py --count 20 --engine async --output results.json
+#   python bench.py --count 20 --compare results.json
+#
+# Every phase records latency percentiles (ms), throughput and, for batches, the
+# skew between cameras. RSS of this process and its Chromium children is sampled
+# after each phase. Results are written as JSON so runs of different versions
+# can be compared with --compare.
+
+ACTION = 'toggle_record'
+
+def generate_config(devices, args, path):
+    """Writes a config.yaml with one venice2 system per device."""
+    config = {
+        'port': 5000,
+        'page_title': 'MultiBrowserTool Benchmark',
+        'headless': not args.headed,
+        'engine': args.engine,
+        'shards': args.shards,
+        'max_concurrent_inits': args.max_concurrent_inits,
+        'standby_contexts': 0,
+        'hot_reload': False,
+        'systems': {
+            'bench': {
+                'name': 'Benchmark',
+                'systems': {
+                    f'cam{i + 1}': {'type': 'venice2', 'name': f'Cam {i + 1}', 'url': device.url}
+                    for i, device in enumerate(devices)
+                }
+            }
+        },
+        'actions': {
+            'record_toggle': {'name': 'Record Toggle', 'mode': 'fanout', 'mappings': {'venice2': ACTION}}
+        }
+    }
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+def tree_rss_bytes(pid=None):
+    """RSS of a process and all of its descendants (Chromium, shards). Linux only; None elsewhere."""
+    if not os.path.isdir('/proc'):
+        return None
+    pid = pid or os.getpid()
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name can contain spaces, so split after its closing paren
+                fields = f.read().rsplit(')', 1)[1].split()
+            parents[int(entry)] = int(fields[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+    tree = {pid}
+    grew = True
+    while grew:
+        children = {child for child, parent in parents.items() if parent in tree}
+        grew = not children.issubset(tree)
+        tree |= children
+
+    total = 0
+    for member in tree:
+        try:
+            with open(f'/proc/{member}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+def summarize_ms(histogram):
+    """RollingHistogram of seconds -> summary in ms."""
+    summary = histogram.summary()
+    return {
+        key: (round(value * 1000, 3) if value is not None and key != 'count' else value)
+        for key, value in summary.items()
+    }
+
+def summarize_values(values):
+    """Percentiles of values that are already in ms."""
+    histogram = RollingHistogram(window=max(1, len(values)))
+    for value in values:
+        histogram.add(value)
+    return {key: (round(value, 3) if isinstance(value, float) else value) for key, value in histogram.summary().items()}
+
+def wait_online(manager, sys_ids, timeout):
+    """Waits on the status snapshot until every system is ONLINE. Returns False on timeout."""
+    deadline = time.time() + timeout
+    snapshot = manager.get_status_snapshot()
+    while not all(snapshot.statuses.get(sys_id) == 'ONLINE' for sys_id in sys_ids):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        snapshot = manager.wait_status_change(snapshot.version, remaining)
+    return True
+
+def run_single(manager, sys_ids, rounds):
+    """One command at a time, round-robin over the systems."""
+    latency = RollingHistogram(window=rounds * len(sys_ids))
+    errors = 0
+    started = time.time()
+    for _ in range(rounds):
+        for sys_id in sys_ids:
+            trace = new_trace()
+            result = manager.execute_command(sys_id, ACTION, trace=trace)
+            stamp(trace, 'emitted')
+            latency.add(trace['emitted'] - trace['received'])
+            errors += not result['success']
+    elapsed = time.time() - started
+    return {
+        'commands': rounds * len(sys_ids),
+        'errors': errors,
+        'throughput_per_s': round(rounds * len(sys_ids) / elapsed, 2),
+        'latency_ms': summarize_ms(latency),
+    }
+
+def run_batches(manager, sys_ids, rounds, scheduled, lead_ms):
+    """Fan-out (or scheduled) batches to every system."""
+    targets = [(sys_id, ACTION) for sys_id in sys_ids]
+    latency = RollingHistogram(window=rounds)
+    skews = []
+    deviations = []
+    errors = 0
+    started = time.time()
+    for _ in range(rounds):
+        call_started = time.time()
+        if scheduled:
+            result = manager.execute_scheduled(targets, lead_ms=lead_ms)
+            deviations.append(result['max_deviation_ms'])
+        else:
+            result = manager.execute_fanout(targets)
+        latency.add(time.time() - call_started)
+        skews.append(result['skew_ms'])
+        errors += sum(not r['success'] for r in result['results'].values())
+    elapsed = time.time() - started
+    phase = {
+        'batches': rounds,
+        'errors': errors,
+        'commands_per_s': round(rounds * len(targets) / elapsed, 2),
+        'latency_ms': summarize_ms(latency),
+        'skew_ms': summarize_values(skews),
+    }
+    if scheduled:
+        phase['max_deviation_ms'] = summarize_values(deviations)
+    return phase
+
+def run_restart_storm(manager, sys_ids, storms, timeout):
+    """Restarts every system, back to back, and times how long each storm takes to settle."""
+    durations = RollingHistogram(window=max(1, storms))
+    failures = 0
+    for _ in range(storms):
+        started = time.time()
+        result = manager.restart_system('all')
+        if not result.get('success') or not wait_online(manager, sys_ids, timeout):
+            failures += 1
+        durations.add(time.time() - started)
+    return {'storms': storms, 'failures': failures, 'duration_ms': summarize_ms(durations)}
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+# Metrics --compare prints, as paths into the results; lower is better for all of them
+COMPARED = [
+    ('startup', 'duration_ms'),
+    ('single', 'latency_ms', 'p50'),
+    ('single', 'latency_ms', 'p99'),
+    ('fanout', 'latency_ms', 'p50'),
+    ('fanout', 'skew_ms', 'p50'),
+    ('fanout', 'skew_ms', 'p99'),
+    ('scheduled', 'max_deviation_ms', 'p50'),
+    ('scheduled', 'max_deviation_ms', 'p99'),
+    ('restart', 'duration_ms', 'p50'),
+    ('rss_bytes', 'peak'),
+]
+
+def lookup(results, path):
+    value = results
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+def compare(previous, current):
+    print(f"\n{'METRIC':<36} {'BEFORE':>14} {'AFTER':>14} {'CHANGE':>9}")
+    print("-" * 76)
+    for path in COMPARED:
+        before = lookup(previous['phases'], path)
+        after = lookup(current['phases'], path)
+        if before is None or after is None:
+            continue
+        change = f"{(after - before) / before * 100:+.1f}%" if before else '-'
+        print(f"{'.'.join(path):<36} {before:>14.3f} {after:>14.3f} {change:>9}")
+    print("")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MultiBrowserTool against virtual cameras.')
+    parser.add_argument('--count', type=int, default=10, help='virtual cameras to start')
+    parser.add_argument('--base-port', type=int, default=9100, help='port of the first camera; the rest follow')
+    parser.add_argument('--engine', default='sync', choices=['sync', 'async'])
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--max-concurrent-inits', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=20, help='rounds of each command phase')
+    parser.add_argument('--storms', type=int, default=3, help='restart storms')
+    parser.add_argument('--lead-ms', type=int, default=500, help='lead time of scheduled batches')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds to wait for systems to come online')
+    parser.add_argument('--headed', action='store_true', help='show the browser')
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    args = parser.parse_args()
+
+    devices = start_fleet(args.base_port, args.count)
+    not_ready = wait_ready([device.url for device in devices])
+    if not_ready:
+        print(f"Virtual cameras not ready: {', '.join(not_ready)}")
+        sys.exit(1)
+    print(f"Started {args.count} virtual cameras on ports {args.base_port}-{args.base_port + args.count - 1}")
+
+    config_path = os.path.splitext(args.output)[0] + '.config.yaml'
+    generate_config(devices, args, config_path)
+    config = load_config(config_path=config_path)
+    sys_ids = list(config['compiled'].systems)
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': vars(args),
+        'phases': {},
+    }
+    phases = results['phases']
+    rss = {'idle': tree_rss_bytes()}
+
+    manager = create_browser_manager(config)
+    try:
+        print("Phase: startup")
+        started = time.time()
+        manager.start()
+        online = wait_online(manager, sys_ids, args.timeout)
+        phases['startup'] = {'online': online, 'duration_ms': round((time.time() - started) * 1000, 1)}
+        rss['startup'] = tree_rss_bytes()
+        if not online:
+            print(f"Not every system came online: {manager.get_status()}")
+
+        print("Phase: single commands")
+        phases['single'] = run_single(manager, sys_ids, args.rounds)
+        print("Phase: fan-out batches")
+        phases['fanout'] = run_batches(manager, sys_ids, args.rounds, False, args.lead_ms)
+        print("Phase: scheduled batches")
+        phases['scheduled'] = run_batches(manager, sys_ids, args.rounds, True, args.lead_ms)
+        rss['commands'] = tree_rss_bytes()
+
+        print("Phase: restart storms")
+        phases['restart'] = run_restart_storm(manager, sys_ids, args.storms, args.timeout)
+        rss['restart'] = tree_rss_bytes()
+    finally:
+        manager.close()
+        for device in devices:
+            device.stop()
+
+    samples = [value for value in rss.values() if value is not None]
+    rss['peak'] = max(samples) if samples else None
+    phases['rss_bytes'] = rss
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    print(json.dumps(phases, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,146 @@ from playwright.sync_api import sync_playwright
 import threading
 import queue
 import time
+from collections import deque
+from metrics import stamp
+import profiles
+import probes
+import injections
+from http_driver import HttpDriver
+from config_loader import diff_configs, replace_config
+from snapshot import StatusBoard
+from scheduler import CommandScheduler, FireTime
+from idempotency import DedupWindow, duplicate_result
+from watchdog import Watchdog
+from reconnect import ReconnectTracker
+
+# How long a target-state action counts as having reached its state after it ran,
+# while the state probe catches up, so a quick second "ensure" doesn't toggle it back.
+TARGET_SETTLE_S = 2.0
+
+# Fan-out trigger: stamps the dispatch time in the page clock and defers the
+# injection to the next task, so evaluate returns without waiting on the click.
+FANOUT_DISPATCH_JS = """(() => {
+    const dispatchedAt = performance.timeOrigin + performance.now();
+    window.__mbtFanoutError = null;
+    setTimeout(() => {
+        try { %s } catch (e) { window.__mbtFanoutError = String(e); }
+    }, 0);
+    return dispatchedAt;
+})()"""
+
+# Resolves after the deferred trigger above has run (timers fire in order).
+FANOUT_RESULT_JS = "new Promise(r => setTimeout(() => r(window.__mbtFanoutError), 0))"
+
+# Scheduled trigger: page wall clock in epoch ms, sampled to estimate the page-to-host offset.
+PAGE_CLOCK_JS = "performance.timeOrigin + performance.now()"
+CLOCK_SAMPLES = 5
+
+# Arms the injection to fire at fire_at (already converted to the page clock).
+# A coarse timer wakes the page shortly before the deadline, then it spins the rest.
+SCHEDULE_ARM_JS = """(() => {
+    const fireAt = %(fire_at)r;
+    const now = () => performance.timeOrigin + performance.now();
+    const state = window.__mbtScheduled = {firedAt: null, error: null};
+    setTimeout(() => {
+        while (now() < fireAt) {}
+        state.firedAt = now();
+        try { %(code)s } catch (e) { state.error = String(e); }
+    }, Math.max(0, fireAt - now() - 4));
+})()"""
+
+# Resolves once the armed injection has fired, or fails if it hasn't within 10 s.
+SCHEDULE_RESULT_JS = """new Promise((r, reject) => {
+    const giveUpAt = Date.now() + 10000;
+    const check = () => {
+        const state = window.__mbtScheduled;
+        if (state && state.firedAt !== null) r(state);
+        else if (Date.now() > giveUpAt) reject(new Error('Armed action never fired'));
+        else setTimeout(check, 5);
+    };
+    check();
+})"""
+
+def task_systems(cmd_type, data):
+    """The systems a worker task works on, for the watchdog."""
+    if cmd_type == 'execute':
+        return [data[0]]
+    if cmd_type == 'fanout':
+        return [sys_id for sys_id, _ in data]
+    if cmd_type == 'schedule':
+        return [sys_id for sys_id, _ in data[0]]
+    return []
+
+def clock_offset(samples):
+    """
+    Estimates page clock minus host clock (ms) from (host_before, page_now, host_after)
+    samples, trusting the sample with the shortest round trip.
+    """
+    host_before, page_now, host_after = min(samples, key=lambda s: s[2] - s[0])
+    return page_now - (host_before + host_after) / 2
+
+def schedule_report(fire_at, offsets, fired, results):
+    """Builds the scheduled trigger result from each page's fire record."""
+    fired_host = {}
+    for sys_id, state in fired.items():
+        fired_host[sys_id] = state['firedAt'] - offsets[sys_id]
+        results[sys_id] = {
+            'success': not state['error'],
+            'message': state['error'] or 'Executed',
+            'offset_ms': offsets[sys_id],
+            'deviation_ms': fired_host[sys_id] - fire_at
+        }
+
+    skew_ms = 0.0
+    max_deviation_ms = 0.0
+    if fired_host:
+        skew_ms = max(fired_host.values()) - min(fired_host.values())
+        max_deviation_ms = max(abs(t - fire_at) for t in fired_host.values())
+    print(f"Scheduled trigger on {len(fired_host)} systems, skew {skew_ms:.1f} ms, max deviation {max_deviation_ms:.1f} ms")
+    return {
+        'success': bool(results) and all(r['success'] for r in results.values()),
+        'results': results,
+        'fire_at': fire_at,
+        'skew_ms': skew_ms,
+        'max_deviation_ms': max_deviation_ms
+    }
 
 class BrowserManager:
-    def __init__(self, config, status_callback=None):
+    # Whether a stalled system can be recycled while the call stuck on it is still running
+    recycles_mid_call = False
+
+    def __init__(self, config, status_callback=None, state_callback=None):
         self.config = config
         self.status_callback = status_callback
-        self.command_queue = queue.Queue()
+        # Device states (e.g. RECORDING/STANDBY) pushed by in-page state probes
+        self.state_callback = state_callback
+        self.device_states = {}
+        # Target states just requested by actions, until the probe confirms: sys_id -> (state, until)
+        self.pending_states = {}
+        # Commands already run under an idempotency key, answered again instead of re-run
+        self.dedup = DedupWindow(config.get('dedup_window_ms', 5000) / 1000)
+        # Latest status snapshot, readable from any thread without going through the worker
+        self.status_board = StatusBoard(config['compiled'].systems)
+        # Actions declaring an 'http' driver skip the browser entirely
+        self.http_driver = HttpDriver()
+        # Worker tasks by priority class, with deadlines and per-system holding
+        self.scheduler = CommandScheduler()
+        # Times the worker's loop and tasks, and captures its stack when one stalls
+        self.watchdog = Watchdog(stall_s=config.get('watchdog_stall_ms', 5000) / 1000, on_stall=self._on_stall)
+        self.watchdog_recycle = config.get('watchdog_recycle', False)
+        if self.watchdog_recycle and not self.recycles_mid_call:
+            print("Warning: watchdog_recycle with the sync engine only recycles a system once the call "
+                  "stuck on it returns, which a hung renderer never does. Use engine: async for that.")
+        # Systems whose page stalled the worker, recycled by the worker once it is free again
+        self.recycle_requests = deque()
+        # Retries dropped systems with jittered backoff, behind a circuit breaker
+        self.reconnect = ReconnectTracker(
+            enabled=config.get('auto_reconnect', True),
+            base_s=config.get('reconnect_base_ms', 1000) / 1000,
+            max_s=config.get('reconnect_max_ms', 30000) / 1000,
+            circuit_after=config.get('reconnect_circuit_after', 8),
+            circuit_open_s=config.get('reconnect_circuit_open_s', 300)
+        )
         self.thread = threading.Thread(target=self._run_loop, daemon=True)
         self.started = False
         
@@ -15,16 +149,63 @@ class BrowserManager:
         """Starts the browser worker thread."""
         if not self.started:
             self.thread.start()
+            self.watchdog.watch(self.thread)
             self.started = True
 
-    def _update_status(self, sys_id, status, statuses_dict):
-        """Helper to update status dict and notify callback."""
+    def _on_stall(self, stall):
+        """Called from the watchdog's thread when a task or the loop has stalled."""
+        where = f" on {stall['system']}" if stall['system'] else ''
+        print(f"Watchdog: worker stalled {stall['stalled_for_s']:.1f}s in {stall['kind']}{where}\n{stall['stack']}")
+        if not stall['system']:
+            return
+        sys_id = stall['system']
+        # Shown as the system's last error, without waiting for the worker to report it
+        message = f"Worker stalled {stall['stalled_for_s']:.1f}s in {stall['kind']}"
+        self.status_board.publish(lambda snapshot: snapshot.updated(sys_id, snapshot.statuses.get(sys_id, 'STOPPED'), message))
+        if self.watchdog_recycle:
+            stall['recycled'] = True
+            self._recycle(sys_id)
+
+    def _recycle(self, sys_id):
+        """
+        Replaces a stalled system's page and context. The sync API can't be used from
+        the watchdog's thread, so the worker does it as soon as the stuck call returns.
+        """
+        self.recycle_requests.append(sys_id)
+
+    def _update_status(self, sys_id, status, statuses_dict, error=None, dropped=False):
+        """
+        Helper to update status dict, publish the snapshot and notify callback.
+        dropped: the page itself failed (crashed, closed, didn't load), so the system is
+        retried. An action that merely threw leaves it to the operator.
+        """
         # statuses_dict is reference to the dict inside the thread
-        if statuses_dict.get(sys_id) != status:
+        changed = statuses_dict.get(sys_id) != status
+        if changed:
             statuses_dict[sys_id] = status
+        if dropped or (changed and status == 'ONLINE'):
+            self.reconnect.observe(sys_id, status)
+        if changed or error:
+            # Published before the callback runs, so the callback already sees it
+            reconnect = self.reconnect.info(sys_id)
+            self.status_board.publish(lambda snapshot: snapshot.updated(sys_id, status, error).with_reconnect(sys_id, reconnect))
+        if changed:
             print(f"Status Change: {sys_id} -> {status}")
             if self.status_callback:
                 self.status_callback(sys_id, status)
+
+    def _update_device_state(self, sys_id, state):
+        """Called from a page's state probe binding. Notifies the state callback on change."""
+        if self.device_states.get(sys_id) != state:
+            self.device_states[sys_id] = state
+            self.pending_states.pop(sys_id, None)
+            print(f"Device State: {sys_id} -> {state}")
+            if self.state_callback:
+                self.state_callback(sys_id, state)
+
+    def get_device_states(self):
+        """Last state reported by each system's state probe."""
+        return dict(self.device_states)
             
     def _run_loop(self):
         """The main loop running in a separate thread."""
@@ -41,7 +222,66 @@ class BrowserManager:
             pages = {}
             contexts = {}
 
+            # Systems waiting for a navigation slot, and navigations in flight (sys_id -> deadline)
+            init_backlog = deque()
+            navigating = {}
+            max_concurrent_inits = self.config.get('max_concurrent_inits', 4)
+            # Restarts waiting on their systems: [pending sys_ids, restarted, result_queue]
+            restart_waiters = []
+
+            # Pre-warmed standby pages per system, swapped in when the live page dies
+            standby_count = self.config.get('standby_contexts', 0)
+            standbys = {}       # sys_id -> [(context, page)], loaded and ready
+            warming = {}        # sys_id -> [(context, page, deadline)], still loading
+            stale_contexts = [] # failed standbys, closed by the loop
+            # Live pages reported closed/crashed by page events: (sys_id, page, status).
+            # Handled by the loop rather than inside the event callback.
+            lost_pages = []
+
+            def page_ready(sys_id):
+                return sys_id in pages and sys_id not in navigating and not pages[sys_id].is_closed()
+
+            # Per-system page profile stats for the memory report
+            page_stats = {} # sys_id -> {'load_ms': ..., 'blocked_requests': ...}
+            nav_started = {}
+
+            def open_page(sys_id, sys_data):
+                """New authenticated context and page for a system, set up per its type's profile. Returns (context, page, full_url)."""
+                context = browser.new_context(**profiles.context_options(sys_data))
+                stats = page_stats.setdefault(sys_id, {'load_ms': None, 'blocked_requests': 0})
+
+                if profiles.needs_routing(sys_data):
+                    def on_route(route):
+                        request = route.request
+                        if profiles.should_block(sys_data, request.resource_type, request.url):
+                            stats['blocked_requests'] += 1
+                            route.abort()
+                        else:
+                            route.continue_()
+                    context.route("**/*", on_route)
+                if profiles.get_profile(sys_data).get('disable_animations'):
+                    context.add_init_script(profiles.DISABLE_ANIMATIONS_JS)
+
+                probe = probes.get_probe(sys_data)
+                if probe:
+                    # Standbys report too; they show the same device
+                    context.expose_binding(probes.BINDING_NAME, lambda source, state: self._update_device_state(sys_id, state))
+                    context.add_init_script(probes.observer_script(probe))
+
+                # Actions are compiled once per document and then called by name
+                context.add_init_script(injections.registry_script(sys_data.get('actions', {})))
+
+                page = context.new_page()
+                url = sys_data.get('url')
+                path = sys_data.get('path', '')
+                return context, page, f"{url}{path}"
+
+            def watch_live_page(sys_id, page):
+                page.on("close", lambda: lost_pages.append((sys_id, page, 'OFFLINE')))
+                page.on("crash", lambda: lost_pages.append((sys_id, page, 'ERROR')))
+
             def init_system(sys_id, sys_data):
+                """Opens a fresh context and page and starts navigating without waiting for the load."""
                 nonlocal current_statuses
                 
                 try:
@@ -58,103 +298,489 @@ class BrowserManager:
                     self._update_status(sys_id, 'CONNECTING', current_statuses)
                     print(f"Initializing {sys_data['name']} ({sys_id})...")
                     
-                    context = browser.new_context(
-                        viewport={'width': 1280, 'height': 720},
-                        http_credentials=sys_data.get('browser_auth')
-                    )
-                    page = context.new_page()
+                    context, page, full_url = open_page(sys_id, sys_data)
                     
+                    def on_request_failed(request):
+                        if request.is_navigation_request() and request.frame == page.main_frame:
+                            finish_navigation(sys_id, 'ERROR', request.failure)
+
                     # Attach listeners
-                    page.on("close", lambda: self._update_status(sys_id, 'OFFLINE', current_statuses))
-                    page.on("crash", lambda: self._update_status(sys_id, 'ERROR', current_statuses))
-                    
-                    url = sys_data.get('url')
-                    path = sys_data.get('path', '')
-                    full_url = f"{url}{path}"
-                    
-                    try:
-                        page.goto(full_url, timeout=5000)
-                        print(f"Loaded {full_url}")
-                        self._update_status(sys_id, 'ONLINE', current_statuses)
-                    except Exception as e:
-                        print(f"Failed to load {full_url}: {e}")
-                        self._update_status(sys_id, 'ERROR', current_statuses)
+                    watch_live_page(sys_id, page)
+                    page.on("load", lambda: finish_navigation(sys_id, 'ONLINE'))
+                    page.on("requestfailed", on_request_failed)
                     
                     pages[sys_id] = page
                     contexts[sys_id] = context
+
+                    # Kick off the navigation; load/requestfailed events (or the deadline) finish it
+                    nav_started[sys_id] = time.time()
+                    navigating[sys_id] = nav_started[sys_id] + 5.0
+                    page.evaluate("url => { window.location.href = url; }", full_url)
                     return True
                 except Exception as e:
                     print(f"Error initializing system {sys_id}: {e}")
-                    self._update_status(sys_id, 'ERROR', current_statuses)
+                    navigating.pop(sys_id, None)
+                    self._update_status(sys_id, 'ERROR', current_statuses, error=e, dropped=True)
                     return False
+
+            def warm_standby(sys_id, sys_data):
+                """Starts loading a standby page for a system in its own context."""
+                context, page, full_url = open_page(sys_id, sys_data)
+
+                def on_load():
+                    if page.url != 'about:blank':
+                        finish_warming(sys_id, page, True)
+
+                def on_request_failed(request):
+                    if request.is_navigation_request() and request.frame == page.main_frame:
+                        finish_warming(sys_id, page, False)
+
+                page.on("load", on_load)
+                page.on("requestfailed", on_request_failed)
+                page.on("close", lambda: drop_standby(sys_id, page))
+                page.on("crash", lambda: drop_standby(sys_id, page))
+
+                warming.setdefault(sys_id, []).append((context, page, time.time() + 5.0))
+                page.evaluate("url => { window.location.href = url; }", full_url)
+
+            def finish_warming(sys_id, page, ok):
+                for entry in warming.get(sys_id, []):
+                    context, warming_page, _ = entry
+                    if warming_page is page:
+                        warming[sys_id].remove(entry)
+                        if ok:
+                            standbys.setdefault(sys_id, []).append((context, page))
+                            print(f"Standby ready for {sys_id}")
+                        else:
+                            stale_contexts.append(context)
+                        return
+
+            def drop_standby(sys_id, page):
+                finish_warming(sys_id, page, False)
+                for entry in standbys.get(sys_id, []):
+                    if entry[1] is page:
+                        standbys[sys_id].remove(entry)
+                        stale_contexts.append(entry[0])
+                        return
+
+            def promote_standby(sys_id):
+                """Swaps a ready standby in as the live page. Returns False if none is ready."""
+                pool = standbys.get(sys_id, [])
+                while pool:
+                    context, page = pool.pop(0)
+                    if page.is_closed():
+                        stale_contexts.append(context)
+                        continue
+                    old_context = contexts.get(sys_id)
+                    pages[sys_id] = page
+                    contexts[sys_id] = context
+                    watch_live_page(sys_id, page)
+                    if old_context:
+                        stale_contexts.append(old_context)
+                    print(f"Swapped in standby for {sys_id}")
+                    self._update_status(sys_id, 'ONLINE', current_statuses)
+                    return True
+                return False
+
+            def handle_lost_pages():
+                while lost_pages:
+                    sys_id, page, status = lost_pages.pop(0)
+                    if pages.get(sys_id) is not page:
+                        continue # Already replaced by a re-init or swap
+                    if not promote_standby(sys_id):
+                        self._update_status(sys_id, status, current_statuses, error='Page crashed' if status == 'ERROR' else None, dropped=True)
+
+            def refill_standbys():
+                """Tops up the standby pool of online systems, sharing the navigation slots."""
+                while stale_contexts:
+                    try: stale_contexts.pop().close()
+                    except: pass
+                if not standby_count:
+                    return
+
+                now = time.time()
+                for sys_id, entries in warming.items():
+                    for context, page, deadline in list(entries):
+                        if now > deadline:
+                            finish_warming(sys_id, page, False)
+
+                for group in systems.values():
+                    for sys_id, sys_data in group['systems'].items():
+                        if current_statuses.get(sys_id) != 'ONLINE':
+                            continue
+                        have = len(standbys.get(sys_id, [])) + len(warming.get(sys_id, []))
+                        while have < standby_count:
+                            in_flight = len(navigating) + sum(len(w) for w in warming.values())
+                            if in_flight >= max_concurrent_inits:
+                                return
+                            try:
+                                warm_standby(sys_id, sys_data)
+                            except Exception as e:
+                                print(f"Error warming standby for {sys_id}: {e}")
+                                break
+                            have += 1
+
+            def finish_navigation(sys_id, status, reason=None):
+                if sys_id not in navigating:
+                    return
+                if status == 'ONLINE' and pages[sys_id].url == 'about:blank':
+                    return # Load of the blank page the navigation started from
+                del navigating[sys_id]
+                if status == 'ONLINE':
+                    page_stats[sys_id]['load_ms'] = (time.time() - nav_started[sys_id]) * 1000
+                    print(f"Loaded {pages[sys_id].url} in {page_stats[sys_id]['load_ms']:.0f} ms")
+                else:
+                    print(f"Failed to load {sys_id}: {reason}")
+                self._update_status(sys_id, status, current_statuses, error=reason, dropped=status != 'ONLINE')
+                settle_restart(sys_id)
+
+            def memory_report():
+                """Heap and DOM size per live context, read over CDP, plus load time and blocked requests."""
+                report = {}
+                for sys_id, page in pages.items():
+                    if page.is_closed():
+                        continue
+                    self.watchdog.at(task_token, sys_id)
+                    try:
+                        cdp = page.context.new_cdp_session(page)
+                        cdp.send('Performance.enable')
+                        report[sys_id] = profiles.summarize_metrics(cdp.send('Performance.getMetrics'))
+                        cdp.detach()
+                    except Exception as e:
+                        report[sys_id] = {'error': str(e)}
+                    report[sys_id].update(page_stats.get(sys_id, {}))
+                    report[sys_id]['standby_contexts'] = len(standbys.get(sys_id, []))
+                return report
+
+            def settle_restart(sys_id):
+                """Answers restart requests once all of their systems have finished loading."""
+                if any(queued == sys_id for queued, _ in init_backlog):
+                    return
+                for waiter in list(restart_waiters):
+                    pending, restarted, result_queue = waiter
+                    pending.discard(sys_id)
+                    if not pending:
+                        restart_waiters.remove(waiter)
+                        result_queue.put({'success': True, 'restarted': restarted})
+
+            def queue_init(sys_id, sys_data):
+                if not any(queued == sys_id for queued, _ in init_backlog):
+                    init_backlog.append((sys_id, sys_data))
+
+            def start_pending_inits():
+                """Starts queued inits while there are free navigation slots."""
+                while init_backlog and len(navigating) < max_concurrent_inits:
+                    sys_id, sys_data = init_backlog.popleft()
+                    started = init_system(sys_id, sys_data)
+                    for pending, restarted, _ in restart_waiters:
+                        if started and sys_id in pending:
+                            restarted.append(sys_id)
+                    if not started:
+                        settle_restart(sys_id)
+
+            def forget_system(sys_id):
+                """Drops a system's queued init and its standbys, so it can be set up afresh."""
+                for entry in [e for e in init_backlog if e[0] == sys_id]:
+                    init_backlog.remove(entry)
+                for context, _ in standbys.pop(sys_id, []):
+                    stale_contexts.append(context)
+                for context, _, _ in warming.pop(sys_id, []):
+                    stale_contexts.append(context)
+
+            def navigate_system(sys_id, sys_data):
+                """Points a live page at a system's new URL, keeping its context."""
+                page = pages[sys_id]
+                self._update_status(sys_id, 'CONNECTING', current_statuses)
+                # A swapped in standby has no load listener of its own
+                page.once("load", lambda: finish_navigation(sys_id, 'ONLINE'))
+                nav_started[sys_id] = time.time()
+                navigating[sys_id] = nav_started[sys_id] + 5.0
+                page.evaluate("url => { window.location.href = url; }", f"{sys_data.get('url')}{sys_data.get('path', '')}")
+
+            def reconfigure(changes):
+                """Applies a config diff, leaving the pages of unchanged systems alone."""
+                for sys_id in changes['removed']:
+                    forget_system(sys_id)
+                    navigating.pop(sys_id, None)
+                    pages.pop(sys_id, None)
+                    if sys_id in contexts:
+                        stale_contexts.append(contexts.pop(sys_id))
+                    current_statuses.pop(sys_id, None)
+                    self.reconnect.forget(sys_id)
+                    self.status_board.publish(lambda snapshot: snapshot.without({sys_id}))
+                    page_stats.pop(sys_id, None)
+                    self.device_states.pop(sys_id, None)
+                    settle_restart(sys_id)
+                    print(f"Removed {sys_id}")
+
+                for sys_id, sys_data in changes['navigate'].items():
+                    forget_system(sys_id)
+                    try:
+                        if page_ready(sys_id):
+                            navigate_system(sys_id, sys_data)
+                            continue
+                    except Exception as e:
+                        print(f"Error re-navigating {sys_id}: {e}")
+                        navigating.pop(sys_id, None)
+                    queue_init(sys_id, sys_data)
+
+                for sys_id, sys_data in changes['reinit'].items():
+                    forget_system(sys_id)
+                    queue_init(sys_id, sys_data)
+
+                for sys_id, sys_data in changes['added'].items():
+                    current_statuses[sys_id] = 'STOPPED'
+                    self.status_board.publish(lambda snapshot: snapshot.updated(sys_id, 'STOPPED'))
+                    queue_init(sys_id, sys_data)
+
+                start_pending_inits()
+                return {'success': True}
+
+            def system_loading(sys_id):
+                """True while a system is loading or queued to."""
+                return sys_id in navigating or any(queued == sys_id for queued, _ in init_backlog)
+
+            def system_busy(sys_id):
+                """True while a system is loading, or has commands held before it that must run first."""
+                return system_loading(sys_id) or self.scheduler.is_holding(sys_id)
+
+            def check_navigation_deadlines():
+                now = time.time()
+                for sys_id, deadline in list(navigating.items()):
+                    if now > deadline:
+                        finish_navigation(sys_id, 'ERROR', 'Timeout 5000ms exceeded')
+
+            def recycle_stalled():
+                """Re-initializes systems the watchdog caught stalling the worker, in a fresh context."""
+                while self.recycle_requests:
+                    sys_id = self.recycle_requests.popleft()
+                    sys_data = self._get_system_config(sys_id)
+                    if not sys_data:
+                        continue
+                    print(f"Recycling stalled system {sys_id}")
+                    forget_system(sys_id)
+                    navigating.pop(sys_id, None)
+                    queue_init(sys_id, sys_data)
+
+            def start_reconnects():
+                """
+                Queues inits for dropped systems whose retry is due. Only runs while no
+                task is waiting, and an init only starts the navigation, so reconnects
+                never hold up commands to systems that are up.
+                """
+                if not self.scheduler.empty():
+                    return
+                for sys_id in self.reconnect.due():
+                    if system_busy(sys_id):
+                        continue # Already (re)loading, e.g. a manual restart
+                    sys_data = self._get_system_config(sys_id)
+                    if not sys_data:
+                        self.reconnect.forget(sys_id)
+                        continue
+                    self.reconnect.attempt(sys_id)
+                    print(f"Reconnecting {sys_id} (attempt {self.reconnect.info(sys_id)['attempts']})")
+                    queue_init(sys_id, sys_data)
+                start_pending_inits()
             
-            # Initial Startup
+            def run_scheduled(commands, lead_ms, fire_time, traces):
+                results = {}
+                live = []
+                for sys_id, js_code in commands:
+                    if page_ready(sys_id):
+                        live.append((sys_id, js_code))
+                    else:
+                        results[sys_id] = {'success': False, 'message': 'System not found or offline'}
+
+                # 1. Measure each page's clock against ours
+                offsets = {}
+                for sys_id, js_code in live:
+                    self.watchdog.at(task_token, sys_id)
+                    try:
+                        samples = []
+                        for _ in range(CLOCK_SAMPLES):
+                            host_before = time.time() * 1000
+                            page_now = pages[sys_id].evaluate(PAGE_CLOCK_JS)
+                            samples.append((host_before, page_now, time.time() * 1000))
+                        offsets[sys_id] = clock_offset(samples)
+                    except Exception as e:
+                        results[sys_id] = {'success': False, 'message': str(e)}
+
+                # 2. Arm every page for the same host instant, in its own clock, chosen
+                #    only now so the measuring above doesn't eat into lead_ms
+                fire_at = fire_time.choose(lead_ms)
+                armed = []
+                for sys_id, js_code in live:
+                    if sys_id not in offsets:
+                        continue
+                    self.watchdog.at(task_token, sys_id)
+                    try:
+                        stamp(traces.get(sys_id), 'eval_start')
+                        pages[sys_id].evaluate(SCHEDULE_ARM_JS % {'fire_at': fire_at + offsets[sys_id], 'code': js_code})
+                        stamp(traces.get(sys_id), 'eval_end')
+                        armed.append(sys_id)
+                    except Exception as e:
+                        results[sys_id] = {'success': False, 'message': str(e)}
+
+                # 3. Collect when each one actually fired
+                fired = {}
+                for sys_id in armed:
+                    self.watchdog.at(task_token, sys_id)
+                    try:
+                        fired[sys_id] = pages[sys_id].evaluate(SCHEDULE_RESULT_JS)
+                    except Exception as e:
+                        results[sys_id] = {'success': False, 'message': str(e)}
+
+                return schedule_report(fire_at, offsets, fired, results)
+
+            # Initial Startup: queued, so commands are served while systems connect
             systems = self.config.get('resolved_systems', {})
             for group in systems.values():
                 for sys_id, sys_data in group['systems'].items():
                     # Set initial status to STOPPED if not in loop yet
                     current_statuses[sys_id] = 'STOPPED' 
-                    init_system(sys_id, sys_data)
+                    queue_init(sys_id, sys_data)
 
             # Message Loop
             last_poll_time = 0
+            task_token = None # watchdog token of the task running now
             while True:
-                # 1. Process all pending commands in queue first
-                try:
-                    while True: # Drain queue
-                        task = self.command_queue.get_nowait()
-                        
+                self.watchdog.beat()
+                # 0. Recycle stalled systems, start queued inits and time out stuck navigations
+                recycle_stalled()
+                start_pending_inits()
+                check_navigation_deadlines()
+
+                # 1. Process held commands whose system is free again and everything queued,
+                #    triggers first. Repeats until nothing is left, so late arrivals don't wait for the pump.
+                while True:
+                    ready = self.scheduler.release(system_loading)
+                    try:
+                        while True: # Drain queue
+                            ready.append(self.scheduler.get_nowait())
+                    except queue.Empty:
+                        pass
+                    if not ready:
+                        break
+
+                    for item in sorted(ready):
+                        task = item[3]
                         if task is None: # Sentinel to exit
                             browser.close()
                             print("Browser thread closed.")
                             return
 
-                        cmd_type, data, result_queue = task
+                        cmd_type, data, result_queue, traces = task
+                        if self.scheduler.expired(item):
+                            # The caller has already timed out; a late trigger is worse than none
+                            print(f"Dropped {cmd_type} task: deadline passed")
+                            result_queue.put({'success': False, 'message': 'Dropped: deadline passed'})
+                            continue
+                        if cmd_type == 'execute' and system_busy(data[0]):
+                            # Runs once the system has finished (re)loading, in order
+                            self.scheduler.hold(data[0], item)
+                            continue
+
+                        for trace in traces.values():
+                            stamp(trace, 'dequeued')
 
+                        task_token = self.watchdog.begin(cmd_type, task_systems(cmd_type, data))
                         try:
                             if cmd_type == 'execute':
                                 sys_id, js_code = data
-                                if sys_id in pages and not pages[sys_id].is_closed():
+                                if page_ready(sys_id):
                                     print(f"Executing on {sys_id}: {js_code}")
                                     try:
+                                        stamp(traces.get(sys_id), 'eval_start')
                                         pages[sys_id].evaluate(js_code)
+                                        stamp(traces.get(sys_id), 'eval_end')
                                         result_queue.put({'success': True, 'message': 'Executed'})
                                     except Exception as e:
                                         result_queue.put({'success': False, 'message': str(e)})
-                                        self._update_status(sys_id, 'ERROR', current_statuses)
+                                        self._update_status(sys_id, 'ERROR', current_statuses, error=e)
                                 else:
                                     result_queue.put({'success': False, 'message': 'System not found or offline'})
+
+                            elif cmd_type == 'fanout':
+                                # Pass 1: dispatch to every page back to back.
+                                results = {}
+                                dispatched = {}
+                                for sys_id, js_code in data:
+                                    if not page_ready(sys_id):
+                                        results[sys_id] = {'success': False, 'message': 'System not found or offline'}
+                                        continue
+                                    self.watchdog.at(task_token, sys_id)
+                                    try:
+                                        stamp(traces.get(sys_id), 'eval_start')
+                                        dispatched[sys_id] = pages[sys_id].evaluate(FANOUT_DISPATCH_JS % js_code)
+                                        stamp(traces.get(sys_id), 'eval_end')
+                                    except Exception as e:
+                                        results[sys_id] = {'success': False, 'message': str(e)}
+                                        self._update_status(sys_id, 'ERROR', current_statuses, error=e)
+
+                                # Pass 2: collect errors raised by the deferred injections.
+                                for sys_id in dispatched:
+                                    self.watchdog.at(task_token, sys_id)
+                                    try:
+                                        error = pages[sys_id].evaluate(FANOUT_RESULT_JS)
+                                    except Exception as e:
+                                        error = str(e)
+                                    if error:
+                                        results[sys_id] = {'success': False, 'message': error}
+                                    else:
+                                        results[sys_id] = {'success': True, 'message': 'Executed'}
+
+                                skew_ms = 0.0
+                                if dispatched:
+                                    skew_ms = max(dispatched.values()) - min(dispatched.values())
+                                print(f"Fan-out to {len(dispatched)} systems, skew {skew_ms:.1f} ms")
+                                result_queue.put({
+                                    'success': all(r['success'] for r in results.values()),
+                                    'results': results,
+                                    'dispatched_at': dispatched,
+                                    'skew_ms': skew_ms
+                                })
                             
+                            elif cmd_type == 'schedule':
+                                commands, lead_ms, fire_time = data
+                                result_queue.put(run_scheduled(commands, lead_ms, fire_time, traces))
+
                             elif cmd_type == 'restart':
+                                # Queued like startup; answered once every target has loaded
                                 target_id = data
-                                restarted = []
+                                targets = []
                                 if target_id == 'all':
                                     for group in systems.values():
-                                        for sys_id, sys_data in group['systems'].items():
-                                            if init_system(sys_id, sys_data):
-                                                restarted.append(sys_id)
+                                        targets.extend(group['systems'].items())
                                 else:
-                                     found = False
                                      for group in systems.values():
                                          if target_id in group['systems']:
-                                             if init_system(target_id, group['systems'][target_id]):
-                                                 restarted.append(target_id)
-                                             found = True
+                                             targets.append((target_id, group['systems'][target_id]))
                                              break
-                                     if not found:
+                                     if not targets:
                                          result_queue.put({'success': False, 'message': 'System not found'})
                                          continue
-                                result_queue.put({'success': True, 'restarted': restarted})
+                                restart_waiters.append([{sys_id for sys_id, _ in targets}, [], result_queue])
+                                for sys_id, sys_data in targets:
+                                    queue_init(sys_id, sys_data)
+                                start_pending_inits()
+
+                            elif cmd_type == 'reconfigure':
+                                # The config was swapped in place; pick up its systems
+                                systems = self.config.get('resolved_systems', {})
+                                result_queue.put(reconfigure(data))
 
-                            elif cmd_type == 'status':
-                                result_queue.put(current_statuses.copy())
+                            elif cmd_type == 'memory':
+                                result_queue.put(memory_report())
 
                         except Exception as e:
                             print(f"Error processing task {cmd_type}: {e}")
                             result_queue.put({'success': False, 'message': str(e)})
+                        finally:
+                            self.watchdog.end(task_token)
+                            recycle_stalled()
 
-                except queue.Empty:
-                    pass
+                # Dropped systems are retried between tasks, never ahead of them
+                start_reconnects()
 
                 # 2. Pump Playwright Events (Idle)
                 # Sync Playwright needs API calls to process events.
@@ -174,77 +800,363 @@ class BrowserManager:
                 if not pumped:
                     time.sleep(0.1)
 
+                # Swap standbys in for pages that died during the pump
+                handle_lost_pages()
+
                 # 3. Throttled Polling Check (every 2 seconds)
                 if time.time() - last_poll_time > 2.0:
                     last_poll_time = time.time()
+                    refill_standbys()
                     for group in systems.values():
                         for sys_id in group['systems']:
                             if sys_id in pages:
                                 try:
                                     if pages[sys_id].is_closed():
-                                        self._update_status(sys_id, 'CLOSED', current_statuses)
+                                        self._update_status(sys_id, 'CLOSED', current_statuses, dropped=True)
                                 except Exception as e:
                                     if current_statuses.get(sys_id) not in ['ERROR', 'CLOSED']:
                                         print(f"Polling error for {sys_id}: {e}")
-                                        self._update_status(sys_id, 'ERROR', current_statuses)
+                                        self._update_status(sys_id, 'ERROR', current_statuses, error=e, dropped=True)
                             else:
                                 if current_statuses.get(sys_id) != 'STOPPED':
                                     self._update_status(sys_id, 'STOPPED', current_statuses)
 
 
-    def execute_command(self, sys_id, action_name):
-        """Public API called from Flask thread."""
-        
-        # 1. Resolve JS code (safe to do here)
-        system_config = self._get_system_config(sys_id)
-        if not system_config:
-             return {'success': False, 'message': 'System config not found'}
-
-        actions = system_config.get('actions', {})
-        if action_name not in actions:
-             return {'success': False, 'message': f'Action {action_name} not supported by this system'}
-        
-        js_code = actions[action_name].get('js_injection')
-        if not js_code:
-            return {'success': False, 'message': 'No JS code defined'}
-
-        # 2. Send to worker thread
+    def _submit(self, cmd_type, data, timeout, traces=None):
+        """
+        Hands a task to the worker and waits for its result. Returns None on timeout.
+        traces: optional {sys_id: trace} dicts the worker stamps as the task progresses.
+        """
+        traces = traces or {}
+        for trace in traces.values():
+            stamp(trace, 'enqueued')
         result_queue = queue.Queue()
-        self.command_queue.put(('execute', (sys_id, js_code), result_queue))
-        
+        self.scheduler.put(cmd_type, (cmd_type, data, result_queue, traces), timeout)
         try:
-            return result_queue.get(timeout=10)
+            return result_queue.get(timeout=timeout)
         except queue.Empty:
+            return None
+
+    def _dispatch(self, sys_id, action_name):
+        """
+        Returns (dispatch, None) or (None, error_message), from the table compiled at load
+        time. dispatch.js_code calls the action registered in the page rather than
+        carrying its js_injection.
+        """
+        compiled = self.config['compiled']
+        dispatch = compiled.actions.get((sys_id, action_name))
+        if dispatch is None:
+            if sys_id not in compiled.systems:
+                return None, 'System config not found'
+            return None, f'Action {action_name} not supported by this system'
+        return dispatch, None
+
+    def _reached_state(self, sys_id, dispatch):
+        """
+        The state a target-state action wants if the system is already in it (or was
+        just sent there), else None. Systems without a state probe, or whose probe only
+        reads its default, never count as there.
+        """
+        target = dispatch.target_state
+        if not target:
+            return None
+        pending = self.pending_states.get(sys_id)
+        if pending and pending[1] > time.time():
+            return target if pending[0] == target else None
+        state = self.device_states.get(sys_id)
+        probe = probes.get_probe(self._get_system_config(sys_id) or {})
+        return target if state == target and probes.confirms(probe, state) else None
+
+    def _note_target_states(self, targets, results):
+        """Remembers the states successful target-state actions are heading to."""
+        for sys_id, action_name in targets:
+            result = results.get(sys_id)
+            if not result or not result['success'] or result.get('skipped'):
+                continue
+            dispatch, _ = self._dispatch(sys_id, action_name)
+            if dispatch and dispatch.target_state:
+                self.pending_states[sys_id] = (dispatch.target_state, time.time() + TARGET_SETTLE_S)
+
+    def _run_deduplicated(self, targets, idempotency_key, run, timeout):
+        """
+        Calls run(targets) -> batch result with only the targets not already run under
+        idempotency_key within the dedup window. The others get the first run's result,
+        marked 'duplicate'.
+        """
+        if not idempotency_key:
+            return run(targets)
+
+        fresh = []
+        first_runs = {}
+        repeats = {}
+        for target in targets:
+            entry, first = self.dedup.claim((idempotency_key, target[0]))
+            if first:
+                fresh.append(target)
+                first_runs[target[0]] = entry
+            else:
+                repeats[target[0]] = entry
+
+        result = None
+        try:
+            result = run(fresh)
+        finally:
+            results = result['results'] if result else {}
+            for sys_id, entry in first_runs.items():
+                entry.resolve(results.get(sys_id, {'success': False, 'message': 'Command failed'}))
+
+        for sys_id, entry in repeats.items():
+            result['results'][sys_id] = duplicate_result(entry, timeout)
+        if repeats:
+            print(f"Answered {len(repeats)} duplicate commands for key {idempotency_key}")
+            result['success'] = all(r['success'] for r in result['results'].values())
+        return result
+
+    def _plan(self, targets):
+        """
+        Splits (sys_id, action_name) targets by driver, skipping target-state actions
+        whose state is already reached.
+        Returns (browser_commands, http_commands, error_results).
+        """
+        results = {}
+        browser_commands = []
+        http_commands = []
+        for sys_id, action_name in targets:
+            dispatch, error = self._dispatch(sys_id, action_name)
+            if error:
+                results[sys_id] = {'success': False, 'message': error}
+                continue
+            reached = self._reached_state(sys_id, dispatch)
+            if reached:
+                results[sys_id] = {'success': True, 'message': f'Already {reached}', 'skipped': True}
+            elif dispatch.http:
+                http_commands.append((sys_id, self._get_system_config(sys_id), dispatch.http))
+            elif dispatch.js_code:
+                browser_commands.append((sys_id, dispatch.js_code))
+            else:
+                results[sys_id] = {'success': False, 'message': 'No js_injection or valid http driver defined'}
+        return browser_commands, http_commands, results
+
+    def execute_command(self, sys_id, action_name, trace=None, idempotency_key=None):
+        """
+        Public API called from Flask thread.
+        trace: optional metrics trace, stamped at each stage the command passes.
+        idempotency_key: optional; repeating a key within the dedup window returns the
+        first command's result instead of running it again.
+        """
+        if not idempotency_key:
+            return self._execute_command(sys_id, action_name, trace)
+
+        entry, first = self.dedup.claim((idempotency_key, sys_id))
+        if not first:
+            print(f"Duplicate command for {sys_id} (key {idempotency_key})")
+            return duplicate_result(entry, timeout=10)
+        result = {'success': False, 'message': 'Command failed'}
+        try:
+            result = self._execute_command(sys_id, action_name, trace)
+        finally:
+            entry.resolve(result)
+        return result
+
+    def _execute_command(self, sys_id, action_name, trace):
+        # 0. Resolved at load time; nothing to do if a target-state action's state is already reached
+        dispatch, error = self._dispatch(sys_id, action_name)
+        if error:
+            return {'success': False, 'message': error}
+        reached = self._reached_state(sys_id, dispatch)
+        if reached:
+            return {'success': True, 'message': f'Already {reached}', 'skipped': True}
+
+        # 1. HTTP driven actions go straight to the device
+        if dispatch.http:
+            result = self.http_driver.execute(sys_id, self._get_system_config(sys_id), dispatch.http, trace)
+            self._note_target_states([(sys_id, action_name)], {sys_id: result})
+            return result
+        if not dispatch.js_code:
+            return {'success': False, 'message': 'No js_injection or valid http driver defined'}
+
+        # 2. Send to worker thread
+        traces = {sys_id: trace} if trace is not None else None
+        result = self._submit('execute', (sys_id, dispatch.js_code), timeout=10, traces=traces)
+        if result is None:
             return {'success': False, 'message': 'Timeout waiting for browser thread'}
+        self._note_target_states([(sys_id, action_name)], {sys_id: result})
+        return result
+
+    def execute_fanout(self, targets, traces=None, idempotency_key=None):
+        """
+        Executes actions on several systems in one worker pass.
+        targets: list of (sys_id, action_name) pairs.
+        traces: optional {sys_id: trace} metrics traces.
+        idempotency_key: optional; systems already run under it in the dedup window aren't run again.
+        Returns per-system results plus the measured start skew in ms.
+        """
+        return self._run_deduplicated(targets, idempotency_key, lambda fresh: self._execute_fanout(fresh, traces), timeout=10)
+
+    def _execute_fanout(self, targets, traces):
+        commands, http_commands, results = self._plan(targets)
+        http_futures = self.http_driver.submit(http_commands, traces)
+
+        dispatched = {}
+        if commands:
+            worker_result = self._submit('fanout', commands, timeout=10, traces=traces)
+            if worker_result is None:
+                for sys_id, _ in commands:
+                    results[sys_id] = {'success': False, 'message': 'Timeout waiting for browser thread'}
+            else:
+                results.update(worker_result['results'])
+                dispatched.update(worker_result['dispatched_at'])
+
+        for sys_id, future in http_futures.items():
+            results[sys_id] = future.result()
+            dispatched[sys_id] = results[sys_id]['sent_at']
+
+        self._note_target_states(targets, results)
+        skew_ms = 0.0
+        if dispatched:
+            skew_ms = max(dispatched.values()) - min(dispatched.values())
+        return {
+            'success': bool(results) and all(r['success'] for r in results.values()),
+            'results': results,
+            'dispatched_at': dispatched,
+            'skew_ms': skew_ms
+        }
+
+    def execute_scheduled(self, targets, lead_ms=500, traces=None, fire_at=None, idempotency_key=None):
+        """
+        Arms actions on several systems and fires them at one shared instant,
+        lead_ms after the page clocks have been measured.
+        targets: list of (sys_id, action_name) pairs.
+        traces: optional {sys_id: trace} metrics traces.
+        fire_at: optional absolute host time (epoch ms) to fire at instead of lead_ms,
+        or a FireTime whose arbiter picks it once the clocks are measured.
+        idempotency_key: optional; systems already run under it in the dedup window aren't run again.
+        Returns per-system results with how far each fired from the target time.
+        """
+        return self._run_deduplicated(
+            targets, idempotency_key,
+            lambda fresh: self._execute_scheduled(fresh, lead_ms, traces, fire_at),
+            timeout=10 + lead_ms / 1000
+        )
+
+    def _execute_scheduled(self, targets, lead_ms, traces, fire_at):
+        commands, http_commands, results = self._plan(targets)
+        fire_time = fire_at if isinstance(fire_at, FireTime) else FireTime(fire_at)
+
+        # HTTP requests are held until the instant the worker arms the pages for
+        http_futures = self.http_driver.submit(http_commands, traces, fire_time=fire_time, timeout=10)
+
+        if commands:
+            worker_result = self._submit('schedule', (commands, lead_ms, fire_time), timeout=10 + lead_ms / 1000, traces=traces)
+            if worker_result is None:
+                for sys_id, _ in commands:
+                    results[sys_id] = {'success': False, 'message': 'Timeout waiting for browser thread'}
+            else:
+                results.update(worker_result['results'])
+        # Nothing to measure (HTTP only), or the worker never got to it
+        fire_at = fire_time.choose(lead_ms)
+
+        for sys_id, future in http_futures.items():
+            results[sys_id] = future.result()
+
+        self._note_target_states(targets, results)
+        deviations = [r['deviation_ms'] for r in results.values() if 'deviation_ms' in r]
+        return {
+            'success': bool(results) and all(r['success'] for r in results.values()),
+            'results': results,
+            'fire_at': fire_at,
+            'skew_ms': max(deviations) - min(deviations) if deviations else 0.0,
+            'max_deviation_ms': max(abs(d) for d in deviations) if deviations else 0.0
+        }
 
     def restart_system(self, sys_id):
         """Restarts a specific system or 'all'."""
-        result_queue = queue.Queue()
-        self.command_queue.put(('restart', sys_id, result_queue))
-        try:
-            return result_queue.get(timeout=30) # Longer timeout for restart
-        except queue.Empty:
+        result = self._submit('restart', sys_id, timeout=30) # Longer timeout for restart
+        if result is None:
             return {'success': False, 'message': 'Timeout waiting for browser thread'}
+        return result
+
+    def apply_config(self, new_config):
+        """
+        Switches to a reloaded config. Only systems that were added, removed or changed
+        are initialized, closed or re-navigated; every other page is left as it is.
+        The config dict is updated in place, so everything holding it sees the new one.
+        """
+        changes = diff_configs(self.config, new_config)
+        if changes['restart_keys']:
+            print(f"Warning: changes to {', '.join(changes['restart_keys'])} need a restart to take effect")
+        replace_config(self.config, new_config)
+
+        summary = {
+            'success': True,
+            'added': list(changes['added']),
+            'removed': changes['removed'],
+            'navigated': list(changes['navigate']),
+            'reinitialized': list(changes['reinit']),
+            'restart_keys': changes['restart_keys']
+        }
+        if not (changes['added'] or changes['removed'] or changes['navigate'] or changes['reinit']):
+            return summary
+
+        print(f"Applying config: {len(summary['added'])} added, {len(summary['removed'])} removed, "
+              f"{len(summary['navigated'])} re-navigated, {len(summary['reinitialized'])} re-initialized")
+        result = self._submit('reconfigure', changes, timeout=10)
+        if result is None:
+            return {'success': False, 'message': 'Timeout waiting for browser thread'}
+        return summary
 
     def get_status(self):
-        """Gets status of all systems."""
-        result_queue = queue.Queue()
-        self.command_queue.put(('status', None, result_queue))
-        try:
-            return result_queue.get(timeout=5)
-        except queue.Empty:
+        """Gets status of all systems, from the latest snapshot rather than the worker."""
+        return dict(self.status_board.current.statuses)
+
+    def get_scheduler_stats(self):
+        """Queue depth, held and dropped tasks per priority class."""
+        return self.scheduler.stats.to_json()
+
+    def get_watchdog_report(self, stacks=True):
+        """Worker loop lag, task durations, running tasks and recent stalls with their stacks."""
+        return self.watchdog.report(stacks=stacks)
+
+    def get_status_snapshot(self):
+        """The latest StatusSnapshot: versioned, with last change times and last errors."""
+        return self.status_board.current
+
+    def wait_status_change(self, version, timeout):
+        """Blocks until the snapshot moves past `version` or timeout. Returns the latest snapshot."""
+        return self.status_board.wait(version, timeout)
+
+    def get_memory_report(self):
+        """Gets JS heap, DOM size, load time and blocked requests per system context."""
+        result = self._submit('memory', None, timeout=10)
+        if result is None:
             return {}
+        return result
 
     def _get_system_config(self, target_sys_id):
-        systems = self.config.get('resolved_systems', {})
-        for group in systems.values():
-            for sys_id, data in group['systems'].items():
-                if sys_id == target_sys_id:
-                    # Return a copy to be safe, though config is treated as read-only
-                    return data
-        return None
+        # Config is treated as read-only, so the indexed entry is returned as is
+        return self.config['compiled'].systems.get(target_sys_id)
 
     def close(self):
-        self.command_queue.put(None)
+        self.http_driver.close()
+        self.watchdog.stop()
+        self.scheduler.close()
         if self.started:
             self.thread.join()
+
+
+def create_browser_manager(config, status_callback=None, state_callback=None):
+    """
+    Builds the browser engine selected by the 'engine' key in config.yaml,
+    spread over worker processes when 'shards' is more than 1.
+    """
+    if config.get('shards', 1) > 1:
+        from shards import ShardedBrowserManager
+        return ShardedBrowserManager(config, status_callback=status_callback, state_callback=state_callback)
+
+    engine = config.get('engine', 'sync')
+    if engine == 'async':
+        from browser_async import AsyncBrowserManager
+        return AsyncBrowserManager(config, status_callback=status_callback, state_callback=state_callback)
+    if engine != 'sync':
+        print(f"Warning: Unknown engine '{engine}', falling back to sync")
+    return BrowserManager(config, status_callback=status_callback, state_callback=state_callback)
@@ -0,0 +1,559 @@
+from playwright.async_api import async_playwright
+import asyncio
+import concurrent.futures
+import contextlib
+import time
+from metrics import stamp
+from scheduler import TRIGGER, priority_of
+import profiles
+import probes
+import injections
+from browser import (
+    BrowserManager, FANOUT_DISPATCH_JS, FANOUT_RESULT_JS, PAGE_CLOCK_JS, CLOCK_SAMPLES,
+    SCHEDULE_ARM_JS, SCHEDULE_RESULT_JS, clock_offset, schedule_report, task_systems
+)
+
+class AsyncBrowserManager(BrowserManager):
+    """
+    BrowserManager engine built on playwright.async_api.
+    The worker thread runs an asyncio loop, so page events are delivered as they
+    happen and callers await their task as a future instead of polling a queue.
+    """
+
+    # Closing a stalled system's context from the loop fails the call stuck on it
+    recycles_mid_call = True
+
+    def __init__(self, config, status_callback=None, state_callback=None):
+        super().__init__(config, status_callback, state_callback)
+        self.loop = asyncio.new_event_loop()
+        self.stop_event = asyncio.Event()
+        # Bounds how many systems navigate at once during startup and restarts
+        self.init_slots = asyncio.Semaphore(config.get('max_concurrent_inits', 4))
+        # Pre-warmed standby pages per system, swapped in when the live page dies
+        self.standby_count = config.get('standby_contexts', 0)
+        self.standbys = {}  # sys_id -> [(context, page)], loaded and ready
+        self.warming = {}   # sys_id -> number of standbys still loading
+        self.background_tasks = set()
+        # One lock per system: a command waits while its own system (re)loads, not others'
+        self.system_locks = {}
+        self.held_commands = 0
+        self.page_stats = {} # sys_id -> {'load_ms': ..., 'blocked_requests': ...}
+        self.browser = None
+        self.pages = {}
+        self.contexts = {}
+        self.current_statuses = {}
+
+    def _run_loop(self):
+        """The asyncio loop running in a separate thread."""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _main(self):
+        headless = self.config.get('headless', False)
+        print(f"Starting Playwright Async Loop (Headless: {headless})...")
+
+        async with async_playwright() as p:
+            self.browser = await p.chromium.launch(headless=headless, args=['--disable-infobars'])
+            self._in_background(self._heartbeat())
+            self._in_background(self._reconnector())
+
+            # Initial Startup: concurrent, and commands are served while it runs
+            systems = self.config.get('resolved_systems', {})
+            startup = []
+            for group in systems.values():
+                for sys_id, sys_data in group['systems'].items():
+                    # Set initial status to STOPPED if not in loop yet
+                    self.current_statuses[sys_id] = 'STOPPED'
+                    startup.append(self._init_system(sys_id, sys_data))
+            await asyncio.gather(*startup)
+
+            await self.stop_event.wait()
+            await self.browser.close()
+            print("Browser loop closed.")
+
+    async def _heartbeat(self):
+        """Beats the watchdog every pass; a late pass means something blocked the loop."""
+        while not self.stop_event.is_set():
+            self.watchdog.beat()
+            await asyncio.sleep(self.watchdog.beat_s)
+
+    async def _reconnector(self):
+        """
+        Starts due reconnects in the background. Each waits on its own system's lock
+        and an init slot, so commands to other systems are never held up by it.
+        """
+        while not self.stop_event.is_set():
+            for sys_id in self.reconnect.due():
+                sys_data = self._get_system_config(sys_id)
+                if not sys_data:
+                    self.reconnect.forget(sys_id)
+                    continue
+                self.reconnect.attempt(sys_id)
+                print(f"Reconnecting {sys_id} (attempt {self.reconnect.info(sys_id)['attempts']})")
+                self._in_background(self._init_system(sys_id, sys_data))
+            await asyncio.sleep(0.25)
+
+    def _recycle(self, sys_id):
+        # Closing the context fails a call stuck on its page, which frees the system's lock
+        asyncio.run_coroutine_threadsafe(self._recycle_system(sys_id), self.loop)
+
+    async def _recycle_system(self, sys_id):
+        sys_data = self._get_system_config(sys_id)
+        if not sys_data:
+            return
+        print(f"Recycling stalled system {sys_id}")
+        self._drop_standbys(sys_id)
+        context = self.contexts.get(sys_id)
+        if context:
+            try: await context.close()
+            except: pass
+        await self._init_system(sys_id, sys_data)
+
+    async def _init_system(self, sys_id, sys_data):
+        # The system's lock is taken first, so its commands also wait while it waits for a slot
+        async with self._system_lock(sys_id):
+            async with self.init_slots:
+                return await self._open_system(sys_id, sys_data)
+
+    def _system_lock(self, sys_id):
+        return self.system_locks.setdefault(sys_id, asyncio.Lock())
+
+    @contextlib.asynccontextmanager
+    async def _system_turn(self, sys_id):
+        """Waits for a system to be free before running a command on it, counting the wait as held."""
+        lock = self._system_lock(sys_id)
+        waiting = lock.locked()
+        if waiting:
+            self.held_commands += 1
+            self.scheduler.stats.set_held(TRIGGER, self.held_commands)
+        try:
+            await lock.acquire()
+        finally:
+            if waiting:
+                self.held_commands -= 1
+                self.scheduler.stats.set_held(TRIGGER, self.held_commands)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    async def _open_system(self, sys_id, sys_data):
+        try:
+            if sys_id in self.pages:
+                # Close existing
+                try: await self.pages.pop(sys_id).close()
+                except: pass
+            if sys_id in self.contexts:
+                try: await self.contexts.pop(sys_id).close()
+                except: pass
+
+            self._update_status(sys_id, 'CONNECTING', self.current_statuses)
+            print(f"Initializing {sys_data['name']} ({sys_id})...")
+
+            context, page, full_url = await self._new_page(sys_id, sys_data)
+
+            # Attach listeners, delivered as soon as the loop sees them
+            self._watch_live_page(sys_id, page)
+
+            try:
+                started = time.time()
+                await page.goto(full_url, timeout=5000)
+                self.page_stats[sys_id]['load_ms'] = (time.time() - started) * 1000
+                print(f"Loaded {full_url} in {self.page_stats[sys_id]['load_ms']:.0f} ms")
+                self._update_status(sys_id, 'ONLINE', self.current_statuses)
+            except Exception as e:
+                print(f"Failed to load {full_url}: {e}")
+                self._update_status(sys_id, 'ERROR', self.current_statuses, error=e, dropped=True)
+
+            self.pages[sys_id] = page
+            self.contexts[sys_id] = context
+            self._refill_standbys(sys_id, sys_data)
+            return True
+        except Exception as e:
+            print(f"Error initializing system {sys_id}: {e}")
+            self._update_status(sys_id, 'ERROR', self.current_statuses, error=e, dropped=True)
+            return False
+
+    async def _new_page(self, sys_id, sys_data):
+        """New authenticated context and page for a system, set up per its type's profile. Returns (context, page, full_url)."""
+        context = await self.browser.new_context(**profiles.context_options(sys_data))
+        stats = self.page_stats.setdefault(sys_id, {'load_ms': None, 'blocked_requests': 0})
+
+        if profiles.needs_routing(sys_data):
+            async def on_route(route):
+                request = route.request
+                if profiles.should_block(sys_data, request.resource_type, request.url):
+                    stats['blocked_requests'] += 1
+                    await route.abort()
+                else:
+                    await route.continue_()
+            await context.route("**/*", on_route)
+        if profiles.get_profile(sys_data).get('disable_animations'):
+            await context.add_init_script(profiles.DISABLE_ANIMATIONS_JS)
+
+        probe = probes.get_probe(sys_data)
+        if probe:
+            # Standbys report too; they show the same device
+            await context.expose_binding(probes.BINDING_NAME, lambda source, state: self._update_device_state(sys_id, state))
+            await context.add_init_script(probes.observer_script(probe))
+
+        # Actions are compiled once per document and then called by name
+        await context.add_init_script(injections.registry_script(sys_data.get('actions', {})))
+
+        page = await context.new_page()
+        url = sys_data.get('url')
+        path = sys_data.get('path', '')
+        return context, page, f"{url}{path}"
+
+    def _in_background(self, coro):
+        task = self.loop.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    def _watch_live_page(self, sys_id, page):
+        page.on("close", lambda: self._on_page_lost(sys_id, page, 'OFFLINE'))
+        page.on("crash", lambda: self._on_page_lost(sys_id, page, 'ERROR'))
+
+    def _on_page_lost(self, sys_id, page, status):
+        if self.pages.get(sys_id) is not page:
+            return # Already replaced by a re-init or swap
+        if not self._promote_standby(sys_id):
+            self._update_status(sys_id, status, self.current_statuses, error='Page crashed' if status == 'ERROR' else None, dropped=True)
+
+    def _promote_standby(self, sys_id):
+        """Swaps a ready standby in as the live page. Returns False if none is ready."""
+        pool = self.standbys.get(sys_id, [])
+        while pool:
+            context, page = pool.pop(0)
+            if page.is_closed():
+                self._in_background(context.close())
+                continue
+            old_context = self.contexts.get(sys_id)
+            self.pages[sys_id] = page
+            self.contexts[sys_id] = context
+            self._watch_live_page(sys_id, page)
+            if old_context:
+                self._in_background(old_context.close())
+            print(f"Swapped in standby for {sys_id}")
+            self._update_status(sys_id, 'ONLINE', self.current_statuses)
+            self._refill_standbys(sys_id, self._get_system_config(sys_id))
+            return True
+        return False
+
+    def _refill_standbys(self, sys_id, sys_data):
+        """Tops up a system's standby pool in the background."""
+        if not self.standby_count or self.current_statuses.get(sys_id) != 'ONLINE':
+            return
+        have = len(self.standbys.get(sys_id, [])) + self.warming.get(sys_id, 0)
+        for _ in range(self.standby_count - have):
+            self.warming[sys_id] = self.warming.get(sys_id, 0) + 1
+            self._in_background(self._warm_standby(sys_id, sys_data))
+
+    async def _warm_standby(self, sys_id, sys_data):
+        ready = False
+        try:
+            async with self.init_slots:
+                context, page, full_url = await self._new_page(sys_id, sys_data)
+                try:
+                    await page.goto(full_url, timeout=5000)
+                except Exception as e:
+                    print(f"Failed to warm standby for {sys_id}: {e}")
+                    await context.close()
+                    return
+            if self._get_system_config(sys_id) != sys_data:
+                await context.close() # The system changed or was removed while this loaded
+                return
+            entry = (context, page)
+            self.standbys.setdefault(sys_id, []).append(entry)
+            page.on("close", lambda: self._drop_standby(sys_id, entry))
+            page.on("crash", lambda: self._drop_standby(sys_id, entry))
+            ready = True
+            print(f"Standby ready for {sys_id}")
+        except Exception as e:
+            print(f"Error warming standby for {sys_id}: {e}")
+        finally:
+            self.warming[sys_id] -= 1
+            if not ready and self._get_system_config(sys_id) == sys_data:
+                # Try again shortly, like the sync engine's periodic refill
+                self.loop.call_later(2.0, self._refill_standbys, sys_id, sys_data)
+
+    def _drop_standby(self, sys_id, entry):
+        pool = self.standbys.get(sys_id, [])
+        if entry in pool:
+            pool.remove(entry)
+            self._in_background(entry[0].close())
+
+    async def _evaluate(self, page, js_code, trace):
+        """Evaluates on a page, stamping the trace around it."""
+        stamp(trace, 'eval_start')
+        result = await page.evaluate(js_code)
+        stamp(trace, 'eval_end')
+        return result
+
+    async def _handle(self, cmd_type, data, traces):
+        """Runs a single task on the loop. Mirrors the sync worker's task handling."""
+        self.scheduler.stats.dequeued(priority_of(cmd_type))
+        for trace in traces.values():
+            stamp(trace, 'dequeued')
+        token = None
+        if cmd_type not in ('execute', 'restart', 'reconfigure'):
+            # Restarts wait on navigations, which time out on their own
+            token = self.watchdog.begin(cmd_type, task_systems(cmd_type, data), task=asyncio.current_task())
+        try:
+            if cmd_type == 'execute':
+                sys_id, js_code = data
+                async with self._system_turn(sys_id):
+                    # Timed from its turn: waiting while the system loads isn't a stall
+                    token = self.watchdog.begin(cmd_type, [sys_id], task=asyncio.current_task())
+                    page = self.pages.get(sys_id)
+                    if not page or page.is_closed():
+                        return {'success': False, 'message': 'System not found or offline'}
+                    print(f"Executing on {sys_id}: {js_code}")
+                    try:
+                        await self._evaluate(page, js_code, traces.get(sys_id))
+                        return {'success': True, 'message': 'Executed'}
+                    except Exception as e:
+                        self._update_status(sys_id, 'ERROR', self.current_statuses, error=e)
+                        return {'success': False, 'message': str(e)}
+
+            elif cmd_type == 'fanout':
+                return await self._fanout(data, traces)
+
+            elif cmd_type == 'schedule':
+                commands, lead_ms, fire_time = data
+                return await self._schedule(commands, lead_ms, fire_time, traces)
+
+            elif cmd_type == 'restart':
+                return await self._restart(data)
+
+            elif cmd_type == 'reconfigure':
+                return await self._reconfigure(data)
+
+            elif cmd_type == 'memory':
+                return await self._memory_report()
+
+        except Exception as e:
+            print(f"Error processing task {cmd_type}: {e}")
+            return {'success': False, 'message': str(e)}
+        finally:
+            self.watchdog.end(token)
+
+    async def _fanout(self, commands, traces):
+        results = {}
+        live = []
+        for sys_id, js_code in commands:
+            page = self.pages.get(sys_id)
+            if not page or page.is_closed():
+                results[sys_id] = {'success': False, 'message': 'System not found or offline'}
+            else:
+                live.append((sys_id, page, js_code))
+
+        # Pass 1: dispatch to every page concurrently.
+        dispatches = await asyncio.gather(
+            *(self._evaluate(page, FANOUT_DISPATCH_JS % js_code, traces.get(sys_id)) for sys_id, page, js_code in live),
+            return_exceptions=True
+        )
+        dispatched = {}
+        for (sys_id, page, _), outcome in zip(live, dispatches):
+            if isinstance(outcome, Exception):
+                results[sys_id] = {'success': False, 'message': str(outcome)}
+                self._update_status(sys_id, 'ERROR', self.current_statuses, error=outcome)
+            else:
+                dispatched[sys_id] = outcome
+
+        # Pass 2: collect errors raised by the deferred injections.
+        errors = await asyncio.gather(
+            *(self.pages[sys_id].evaluate(FANOUT_RESULT_JS) for sys_id in dispatched),
+            return_exceptions=True
+        )
+        for sys_id, error in zip(dispatched, errors):
+            if error:
+                results[sys_id] = {'success': False, 'message': str(error)}
+            else:
+                results[sys_id] = {'success': True, 'message': 'Executed'}
+
+        skew_ms = 0.0
+        if dispatched:
+            skew_ms = max(dispatched.values()) - min(dispatched.values())
+        print(f"Fan-out to {len(dispatched)} systems, skew {skew_ms:.1f} ms")
+        return {
+            'success': all(r['success'] for r in results.values()),
+            'results': results,
+            'dispatched_at': dispatched,
+            'skew_ms': skew_ms
+        }
+
+    async def _measure_offset(self, page):
+        samples = []
+        for _ in range(CLOCK_SAMPLES):
+            host_before = time.time() * 1000
+            page_now = await page.evaluate(PAGE_CLOCK_JS)
+            samples.append((host_before, page_now, time.time() * 1000))
+        return clock_offset(samples)
+
+    async def _schedule(self, commands, lead_ms, fire_time, traces):
+        results = {}
+        live = []
+        for sys_id, js_code in commands:
+            page = self.pages.get(sys_id)
+            if not page or page.is_closed():
+                results[sys_id] = {'success': False, 'message': 'System not found or offline'}
+            else:
+                live.append((sys_id, page, js_code))
+
+        # 1. Measure each page's clock against ours (pages sampled concurrently)
+        measured = await asyncio.gather(
+            *(self._measure_offset(page) for _, page, _ in live),
+            return_exceptions=True
+        )
+        offsets = {}
+        armable = []
+        for (sys_id, page, js_code), outcome in zip(live, measured):
+            if isinstance(outcome, Exception):
+                results[sys_id] = {'success': False, 'message': str(outcome)}
+            else:
+                offsets[sys_id] = outcome
+                armable.append((sys_id, page, js_code))
+
+        # 2. Arm every page for the same host instant, in its own clock, chosen only
+        #    now; off the loop, since an arbiter may wait on the other shards
+        fire_at = await asyncio.get_running_loop().run_in_executor(None, fire_time.choose, lead_ms)
+        arms = await asyncio.gather(
+            *(self._evaluate(page, SCHEDULE_ARM_JS % {'fire_at': fire_at + offsets[sys_id], 'code': js_code}, traces.get(sys_id))
+              for sys_id, page, js_code in armable),
+            return_exceptions=True
+        )
+        armed = []
+        for (sys_id, page, _), outcome in zip(armable, arms):
+            if isinstance(outcome, Exception):
+                results[sys_id] = {'success': False, 'message': str(outcome)}
+            else:
+                armed.append((sys_id, page))
+
+        # 3. Collect when each one actually fired
+        records = await asyncio.gather(
+            *(page.evaluate(SCHEDULE_RESULT_JS) for _, page in armed),
+            return_exceptions=True
+        )
+        fired = {}
+        for (sys_id, _), outcome in zip(armed, records):
+            if isinstance(outcome, Exception):
+                results[sys_id] = {'success': False, 'message': str(outcome)}
+            else:
+                fired[sys_id] = outcome
+
+        return schedule_report(fire_at, offsets, fired, results)
+
+    async def _memory_report(self):
+        """Heap and DOM size per live context, read over CDP, plus load time and blocked requests."""
+        report = {}
+        for sys_id, page in list(self.pages.items()):
+            if page.is_closed():
+                continue
+            try:
+                cdp = await page.context.new_cdp_session(page)
+                await cdp.send('Performance.enable')
+                report[sys_id] = profiles.summarize_metrics(await cdp.send('Performance.getMetrics'))
+                await cdp.detach()
+            except Exception as e:
+                report[sys_id] = {'error': str(e)}
+            report[sys_id].update(self.page_stats.get(sys_id, {}))
+            report[sys_id]['standby_contexts'] = len(self.standbys.get(sys_id, []))
+        return report
+
+    def _drop_standbys(self, sys_id):
+        for context, _ in self.standbys.pop(sys_id, []):
+            self._in_background(context.close())
+
+    async def _navigate(self, sys_id, sys_data):
+        """Points a live page at a system's new URL, keeping its context."""
+        async with self._system_lock(sys_id):
+            page = self.pages.get(sys_id)
+            if not page:
+                return # Removed or replaced while waiting
+            full_url = f"{sys_data.get('url')}{sys_data.get('path', '')}"
+            self._update_status(sys_id, 'CONNECTING', self.current_statuses)
+            try:
+                started = time.time()
+                await page.goto(full_url, timeout=5000)
+                self.page_stats[sys_id]['load_ms'] = (time.time() - started) * 1000
+                print(f"Loaded {full_url} in {self.page_stats[sys_id]['load_ms']:.0f} ms")
+                self._update_status(sys_id, 'ONLINE', self.current_statuses)
+                self._refill_standbys(sys_id, sys_data)
+            except Exception as e:
+                print(f"Failed to load {full_url}: {e}")
+                self._update_status(sys_id, 'ERROR', self.current_statuses, error=e, dropped=True)
+
+    async def _reconfigure(self, changes):
+        """Applies a config diff, leaving the pages of unchanged systems alone."""
+        for sys_id in changes['removed']:
+            self._drop_standbys(sys_id)
+            self.pages.pop(sys_id, None)
+            if sys_id in self.contexts:
+                self._in_background(self.contexts.pop(sys_id).close())
+            self.current_statuses.pop(sys_id, None)
+            self.reconnect.forget(sys_id)
+            self.status_board.publish(lambda snapshot: snapshot.without({sys_id}))
+            self.page_stats.pop(sys_id, None)
+            self.device_states.pop(sys_id, None)
+            print(f"Removed {sys_id}")
+
+        for sys_id, sys_data in changes['navigate'].items():
+            self._drop_standbys(sys_id)
+            page = self.pages.get(sys_id)
+            if page and not page.is_closed():
+                self._in_background(self._navigate(sys_id, sys_data))
+            else:
+                self._in_background(self._init_system(sys_id, sys_data))
+
+        for sys_id, sys_data in changes['reinit'].items():
+            self._drop_standbys(sys_id)
+            self._in_background(self._init_system(sys_id, sys_data))
+
+        for sys_id, sys_data in changes['added'].items():
+            self.current_statuses[sys_id] = 'STOPPED'
+            self.status_board.publish(lambda snapshot: snapshot.updated(sys_id, 'STOPPED'))
+            self._in_background(self._init_system(sys_id, sys_data))
+
+        return {'success': True}
+
+    async def _restart(self, target_id):
+        systems = self.config.get('resolved_systems', {})
+        restarted = []
+        if target_id == 'all':
+            targets = [item for group in systems.values() for item in group['systems'].items()]
+            outcomes = await asyncio.gather(*(self._init_system(sys_id, sys_data) for sys_id, sys_data in targets))
+            restarted = [sys_id for (sys_id, _), ok in zip(targets, outcomes) if ok]
+        else:
+            sys_data = self._get_system_config(target_id)
+            if not sys_data:
+                return {'success': False, 'message': 'System not found'}
+            if await self._init_system(target_id, sys_data):
+                restarted.append(target_id)
+        return {'success': True, 'restarted': restarted}
+
+    def _submit(self, cmd_type, data, timeout, traces=None):
+        """Schedules the task on the loop and waits on its future. Returns None on timeout."""
+        traces = traces or {}
+        for trace in traces.values():
+            stamp(trace, 'enqueued')
+        priority = priority_of(cmd_type)
+        self.scheduler.stats.queued(priority)
+        future = asyncio.run_coroutine_threadsafe(self._handle(cmd_type, data, traces), self.loop)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            # Cancelling drops the task if it hasn't run yet, e.g. while held behind its system
+            future.cancel()
+            self.scheduler.stats.dropped_one(priority)
+            return None
+
+    def close(self):
+        self.http_driver.close()
+        self.watchdog.stop()
+        if self.started:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+            self.thread.join()
@@ -1,13 +1,214 @@
 import yaml
 import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from injections import invoke_js
 
-def load_config():
-    """Loads types.yaml and config.yaml and merges them."""
-    
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    types_path = os.path.join(base_dir, 'types.yaml')
-    config_path = os.path.join(base_dir, 'config.yaml')
+@dataclass(frozen=True)
+class Dispatch:
+    """What an action does on one system, resolved down to the page call or HTTP request."""
+    sys_id: str
+    target_action: str      # action of the system's type in types.yaml
+    action_id: str = None   # abstract action in config.yaml, when reached through one
+    js_code: str = None     # page call, for browser driven actions
+    http: MappingProxyType = None # request spec, for http driven actions
+    target_state: str = None # skipped when the state probe has matched it
+
+@dataclass(frozen=True)
+class CompiledConfig:
+    """
+    Indexed view of the resolved config, built once at load time so lookups on the
+    command path are single dict hits. Its tables are read-only mappings.
+    """
+    systems: MappingProxyType   # sys_id -> resolved system data
+    groups: MappingProxyType    # group key -> tuple of sys_ids
+    actions: MappingProxyType   # (sys_id, target_action) -> Dispatch, every action of every system
+    dispatch: MappingProxyType  # (sys_id, action_id) -> Dispatch, the abstract actions of config.yaml
+    warnings: tuple
+
+HTTP_METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD')
+
+def http_spec_error(spec):
+    """Why an action's http spec can't be sent, or None if it can."""
+    if not isinstance(spec, dict):
+        return "'http' must be a mapping"
+    if not isinstance(spec.get('path'), str):
+        return "'http' has no path"
+    if str(spec.get('method', 'POST')).upper() not in HTTP_METHODS:
+        return f"'http' method '{spec.get('method')}' isn't one of {', '.join(HTTP_METHODS)}"
+    return None
+
+def compile_action(sys_id, target_action, action):
+    """The Dispatch for one action of a system; without js_code or http if it has no usable driver."""
+    js_code = http = None
+    if 'http' in action:
+        if not http_spec_error(action['http']):
+            http = MappingProxyType(dict(action['http'], method=str(action['http'].get('method', 'POST')).upper()))
+    elif action.get('js_injection'):
+        js_code = invoke_js(target_action)
+    return Dispatch(sys_id, target_action, js_code=js_code, http=http, target_state=action.get('target_state'))
+
+def compile_config(config_def, warnings=()):
+    """Builds the CompiledConfig for a config whose systems are already resolved."""
+    warnings = list(warnings)
+    systems = {}
+    group_of = {}
+    groups = {}
+    for group_key, group in config_def.get('resolved_systems', {}).items():
+        groups[group_key] = tuple(group['systems'])
+        for sys_id, sys_data in group['systems'].items():
+            if sys_id in systems:
+                warnings.append(f"System '{sys_id}' appears in both '{group_of[sys_id]}' and '{group_key}'")
+            systems[sys_id] = sys_data
+            group_of[sys_id] = group_key
+
+    actions = {
+        (sys_id, target_action): compile_action(sys_id, target_action, action)
+        for sys_id, sys_data in systems.items()
+        for target_action, action in (sys_data.get('actions') or {}).items()
+    }
+
+    for sys_type, type_info in (config_def.get('types') or {}).items():
+        for target_action, action in ((type_info or {}).get('actions') or {}).items():
+            error = 'http' in action and http_spec_error(action['http'])
+            if error:
+                warnings.append(f"Action '{target_action}' of type '{sys_type}': {error}")
+
+    dispatch = {}
+    mapped_types = set()
+    for action_id, action_config in (config_def.get('actions') or {}).items():
+        mappings = action_config.get('mappings') or {}
+        mapped_types.update(mappings)
+        for sys_type, target_action in mappings.items():
+            if sys_type not in config_def.get('types', {}):
+                warnings.append(f"Action '{action_id}' maps unknown type '{sys_type}'")
+        for sys_id, sys_data in systems.items():
+            target_action = mappings.get(sys_data.get('type'))
+            if not target_action:
+                continue
+            compiled = actions.get((sys_id, target_action))
+            if compiled is None:
+                warnings.append(f"Action '{action_id}' maps to '{target_action}', which type '{sys_data.get('type')}' does not define")
+                continue
+            if compiled.js_code or compiled.http:
+                dispatch[(sys_id, action_id)] = replace(compiled, action_id=action_id)
+            else:
+                warnings.append(f"Action '{target_action}' of type '{sys_data.get('type')}' has no js_injection or http driver")
+
+    for sys_id, sys_data in systems.items():
+        if sys_data.get('type') not in mapped_types:
+            warnings.append(f"System '{sys_id}' has no actions mapped for type '{sys_data.get('type')}'")
+
+    return CompiledConfig(
+        MappingProxyType(systems), MappingProxyType(groups),
+        MappingProxyType(actions), MappingProxyType(dispatch), tuple(warnings)
+    )
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TYPES_PATH = os.path.join(BASE_DIR, 'types.yaml')
+CONFIG_PATH = os.path.join(BASE_DIR, 'config.yaml')
+
+# System keys that only change how the system is shown, not its page
+DISPLAY_KEYS = ('name',)
+# System keys that only change where its page points; the page is re-navigated in place
+NAVIGATION_KEYS = ('url', 'path')
+# Top level keys the running browser manager can't pick up without a restart
+RESTART_KEYS = ('port', 'server', 'command_workers', 'http_workers', 'headless', 'engine', 'shards', 'max_concurrent_inits', 'standby_contexts',
+                'watchdog_stall_ms', 'watchdog_recycle', 'auto_reconnect', 'reconnect_base_ms',
+                'reconnect_max_ms', 'reconnect_circuit_after', 'reconnect_circuit_open_s',
+                'journal_dir', 'journal_max_mb', 'journal_segments')
 
+def replace_config(config, new_config):
+    """
+    Makes config hold new_config's keys, in place. Keys are overwritten before stale
+    ones are removed, so a reader on another thread never finds one (e.g. 'compiled') missing.
+    """
+    config.update(new_config)
+    for key in [k for k in config if k not in new_config]:
+        config.pop(key, None)
+
+def diff_configs(old_config, new_config):
+    """
+    Compares the systems of two loaded configs.
+    Returns {'added': {sys_id: data}, 'removed': [sys_id], 'navigate': {sys_id: data},
+    'reinit': {sys_id: data}, 'restart_keys': [key]}. Systems that are equal apart
+    from DISPLAY_KEYS are left out, since their pages don't need touching.
+    """
+    old_systems = old_config['compiled'].systems
+    new_systems = new_config['compiled'].systems
+    changes = {'added': {}, 'removed': [], 'navigate': {}, 'reinit': {}, 'restart_keys': []}
+
+    for sys_id, sys_data in new_systems.items():
+        old_data = old_systems.get(sys_id)
+        if old_data is None:
+            changes['added'][sys_id] = sys_data
+            continue
+        changed = {k for k in set(old_data) | set(sys_data) if old_data.get(k) != sys_data.get(k)}
+        changed.difference_update(DISPLAY_KEYS)
+        if not changed:
+            continue
+        if changed.issubset(NAVIGATION_KEYS):
+            changes['navigate'][sys_id] = sys_data
+        else:
+            changes['reinit'][sys_id] = sys_data
+
+    changes['removed'] = [sys_id for sys_id in old_systems if sys_id not in new_systems]
+    changes['restart_keys'] = [k for k in RESTART_KEYS if old_config.get(k) != new_config.get(k)]
+    return changes
+
+class ConfigWatcher:
+    """
+    Polls types.yaml and config.yaml and calls on_reload(new_config) after either
+    one changes. A change is only picked up once the files have stopped changing
+    for one interval, so a half written save isn't loaded.
+    """
+
+    def __init__(self, on_reload, interval=1.0):
+        self.on_reload = on_reload
+        self.interval = interval
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _mtimes(self):
+        mtimes = []
+        for path in (TYPES_PATH, CONFIG_PATH):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return mtimes
+
+    def _run(self):
+        loaded = seen = self._mtimes()
+        while True:
+            time.sleep(self.interval)
+            current = self._mtimes()
+            if current != seen:
+                seen = current # Still being written, check again next time
+                continue
+            if current == loaded:
+                continue
+            loaded = current
+
+            print("Config files changed, reloading...")
+            try:
+                new_config = load_config()
+            except Exception as e:
+                print(f"Error reloading config: {e}")
+                continue
+            if not new_config:
+                continue
+            try:
+                self.on_reload(new_config)
+            except Exception as e:
+                print(f"Error applying reloaded config: {e}")
+
+def load_config(config_path=CONFIG_PATH, types_path=TYPES_PATH):
+    """Loads types.yaml and config.yaml and merges them."""
     try:
         with open(types_path, 'r') as f:
             types_def = yaml.safe_load(f)
@@ -24,6 +225,7 @@ def load_config():
         
     # Helper to resolve system configuration
     resolved_systems = {}
+    warnings = []
     
     for group_key, group_data in config_def.get('systems', {}).items():
         resolved_systems[group_key] = {
@@ -33,7 +235,7 @@ def load_config():
         for sys_key, sys_data in group_data.get('systems', {}).items():
             sys_type = sys_data.get('type')
             if sys_type not in types_def:
-                print(f"Warning: Unknown system type '{sys_type}' for '{sys_key}'")
+                warnings.append(f"Unknown system type '{sys_type}' for '{sys_key}'")
                 continue
                 
             type_info = types_def[sys_type]
@@ -51,5 +253,11 @@ def load_config():
 
     config_def['resolved_systems'] = resolved_systems
     config_def['types'] = types_def
+    config_def.setdefault('actions', {})
+
+    # Index and validate everything up front rather than per click
+    config_def['compiled'] = compile_config(config_def, warnings)
+    for warning in config_def['compiled'].warnings:
+        print(f"Warning: {warning}")
     
     return config_def
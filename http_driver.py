@@ -0,0 +1,101 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth, HTTPDigestAuth
+from metrics import stamp
+
+# Actions in types.yaml can skip the browser when the button just fires a request:
+#
+#   actions:
+#       toggle_record:
+#           name: "Toggle Record"
+#           http:
+#               method: "POST"           # default POST
+#               path: "/api/record"
+#               body: {"toggle": true}   # dict is sent as JSON, string as-is
+#               headers: {}
+#               auth: "digest"           # basic (default) or digest, using browser_auth
+#               timeout: 5
+
+class HttpDriver:
+    """Runs http actions over a pooled keep-alive session per device."""
+
+    def __init__(self, max_workers=16):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='http-driver')
+
+    def _session(self, sys_id, sys_data, spec):
+        with self.lock:
+            session = self.sessions.get(sys_id)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                creds = sys_data.get('browser_auth')
+                if creds:
+                    auth_class = HTTPDigestAuth if spec.get('auth') == 'digest' else HTTPBasicAuth
+                    session.auth = auth_class(creds['username'], creds['password'])
+                self.sessions[sys_id] = session
+            return session
+
+    def execute(self, sys_id, sys_data, spec, trace=None):
+        """Sends one action request. Returns the same result shape as the browser path."""
+        session = self._session(sys_id, sys_data, spec)
+        body = spec.get('body')
+        kwargs = {'headers': spec.get('headers'), 'timeout': spec.get('timeout', 5)}
+        if isinstance(body, (dict, list)):
+            kwargs['json'] = body
+        elif body is not None:
+            kwargs['data'] = body
+
+        try:
+            url = f"{sys_data.get('url')}{spec['path']}"
+            print(f"HTTP {spec.get('method', 'POST')} on {sys_id}: {url}")
+            stamp(trace, 'eval_start')
+            response = session.request(spec.get('method', 'POST'), url, **kwargs)
+            stamp(trace, 'eval_end')
+        except KeyError as e:
+            return {'success': False, 'message': f'HTTP action has no {e}'}
+        except Exception as e:
+            return {'success': False, 'message': str(e)}
+        return {'success': response.ok, 'message': f'HTTP {response.status_code}'}
+
+    def submit(self, commands, traces=None, fire_time=None, timeout=10):
+        """
+        Starts several action requests concurrently without waiting for them.
+        commands: list of (sys_id, sys_data, spec).
+        fire_time: optional FireTime to hold every request until, once it is chosen;
+        if it isn't within timeout seconds, the requests go straight away.
+        Returns {sys_id: future}; each result also carries 'sent_at' (epoch ms) and,
+        when scheduled, its deviation from the fire time.
+        """
+        traces = traces or {}
+
+        def send(sys_id, sys_data, spec):
+            fire_at = fire_time.wait(timeout) if fire_time else None
+            if fire_at is not None:
+                delay = fire_at / 1000 - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            sent_at = time.time() * 1000
+            result = self.execute(sys_id, sys_data, spec, traces.get(sys_id))
+            result['sent_at'] = sent_at
+            if fire_at is not None:
+                result.update({'offset_ms': 0.0, 'deviation_ms': sent_at - fire_at})
+            return result
+
+        return {
+            sys_id: self.executor.submit(send, sys_id, sys_data, spec)
+            for sys_id, sys_data, spec in commands
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+class DedupEntry:
+    """The outcome of the first command seen under a key."""
+
+    def __init__(self, expires_at):
+        self.expires_at = expires_at
+        self.result = None
+        self.done = threading.Event()
+
+    def resolve(self, result):
+        self.result = result
+        self.done.set()
+
+    def wait(self, timeout):
+        """The first command's result, or None if it is still running after timeout."""
+        if self.done.wait(timeout):
+            return self.result
+        return None
+
+class DedupWindow:
+    """
+    Remembers command keys for `window` seconds. A key seen again within the window
+    gets the first command's result instead of running a second time, which is what
+    keeps a retried or double-tapped toggle from flipping a device back.
+    """
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # key -> DedupEntry, oldest first
+
+    def claim(self, key):
+        """Returns (entry, True) for the first use of a key in the window, (entry, False) for a repeat."""
+        now = time.time()
+        with self.lock:
+            while self.entries:
+                oldest = next(iter(self.entries.values()))
+                if oldest.expires_at > now:
+                    break
+                self.entries.popitem(last=False)
+
+            entry = self.entries.get(key)
+            if entry is not None:
+                return entry, False
+            entry = self.entries[key] = DedupEntry(now + self.window)
+            return entry, True
+
+def duplicate_result(entry, timeout):
+    """Result to answer a repeated command with: the first one's, marked as a duplicate."""
+    result = entry.wait(timeout)
+    if result is None:
+        return {'success': False, 'message': 'Duplicate of a command that is still running', 'duplicate': True}
+    return {**result, 'duplicate': True}
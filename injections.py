@@ -0,0 +1,97 @@
+import json
+import re
+
+# Actions are compiled into each page once, by an init script, instead of shipping and
+# parsing their js_injection on every command. A command is then just a call by name.
+#
+# Each action is compiled on its own, so one that doesn't parse only fails itself. As
+# with page.evaluate, an injection that is an expression runs as one, and one that
+# evaluates to a function (e.g. "() => ...") has that function called.
+#
+# An action that only uses `document` for getElementById/querySelector gets a proxy
+# whose lookups remember the element they returned and reuse it while it is still
+# attached and still matches, so the DOM is only searched again after it has changed.
+# Any other use of `document` gets the real one, since a proxy can't be handed to
+# native APIs.
+
+REGISTRY_JS = """(() => {
+    if (window !== window.top) return;
+    const cache = new Map();
+    const lookup = (key, isValid, find) => {
+        const cached = cache.get(key);
+        if (cached && cached.isConnected && isValid(cached)) return cached;
+        const el = find();
+        if (el) cache.set(key, el); else cache.delete(key);
+        return el;
+    };
+    const cachedDocument = new Proxy(document, {
+        get(target, prop) {
+            if (prop === 'getElementById') {
+                return id => lookup('#id:' + id, el => el.id === id, () => target.getElementById(id));
+            }
+            if (prop === 'querySelector') {
+                return sel => lookup('sel:' + sel, el => el.matches(sel), () => target.querySelector(sel));
+            }
+            const value = Reflect.get(target, prop);
+            return typeof value === 'function' ? value.bind(target) : value;
+        }
+    });
+    const actions = {};
+    const define = (name, source, cached) => {
+        const doc = cached ? cachedDocument : document;
+        try {
+            const expression = new Function('document', 'return (' + source + '\\n)');
+            actions[name] = () => {
+                const value = expression(doc);
+                return typeof value === 'function' ? value() : value;
+            };
+            return;
+        } catch (e) {} // Statements rather than an expression
+        try {
+            const body = new Function('document', source);
+            actions[name] = () => body(doc);
+        } catch (e) {
+            const message = 'Action ' + name + ' does not compile: ' + e.message;
+            actions[name] = () => { throw new Error(message); };
+        }
+    };
+%(actions)s
+    window.%(run)s = name => {
+        const action = actions[name];
+        if (!action) throw new Error('Action ' + name + ' is not registered in this page');
+        const result = action();
+        if (!result || typeof result.then !== 'function') return result;
+        // An action that awaits something which never comes fails instead of holding up the worker
+        return Promise.race([result, new Promise((_, reject) => setTimeout(
+            () => reject(new Error('Action ' + name + ' timed out after %(timeout)d ms')), %(timeout)d
+        ))]);
+    };
+})()"""
+
+ACTION_JS = "    define(%(name)s, %(source)s, %(cached)s);"
+
+# `document` used for anything other than a cacheable lookup
+UNCACHED_DOCUMENT = re.compile(r'\bdocument\b(?!\s*\.\s*(?:getElementById|querySelector)\s*\()')
+
+# Name of the page function actions are called through
+RUN_NAME = '__mbtRun'
+
+# Longest an action returning a promise is waited on; under the watchdog's default stall_ms
+ACTION_TIMEOUT_MS = 4000
+
+def registry_script(actions):
+    """Init script registering every action of a system that has a js_injection."""
+    compiled = [
+        ACTION_JS % {
+            'name': json.dumps(name),
+            'source': json.dumps(action['js_injection']),
+            'cached': 'false' if UNCACHED_DOCUMENT.search(action['js_injection']) else 'true',
+        }
+        for name, action in actions.items()
+        if action.get('js_injection')
+    ]
+    return REGISTRY_JS % {'actions': '\n'.join(compiled), 'run': RUN_NAME, 'timeout': ACTION_TIMEOUT_MS}
+
+def invoke_js(action_name):
+    """Expression that runs a registered action by name."""
+    return f"window.{RUN_NAME}({json.dumps(action_name)})"
@@ -0,0 +1,186 @@
+import glob
+import json
+import os
+import queue
+import threading
+import time
+
+# Entries per index block. Each block remembers its offset, time span and systems,
+# so a query only reads the blocks that can match.
+BLOCK_SIZE = 256
+
+class Segment:
+    """One journal file and the sparse index of its blocks."""
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.blocks = [] # {'offset', 'count', 'min_at', 'max_at', 'systems'}
+
+    def add(self, offset, entry):
+        if not self.blocks or self.blocks[-1]['count'] >= BLOCK_SIZE:
+            self.blocks.append({'offset': offset, 'count': 0, 'min_at': entry['at'], 'max_at': entry['at'], 'systems': set()})
+        block = self.blocks[-1]
+        block['count'] += 1
+        block['min_at'] = min(block['min_at'], entry['at'])
+        block['max_at'] = max(block['max_at'], entry['at'])
+        block['systems'].add(entry.get('system'))
+
+class CommandJournal:
+    """
+    Append-only JSONL journal of every command, in rotating segment files under
+    `directory`. record() only hands the entry to a background writer, so a slow
+    disk never holds up a trigger; if the writer falls `queue_size` entries behind,
+    entries are dropped and counted instead.
+    """
+
+    def __init__(self, directory, max_bytes=10 * 1024 * 1024, max_segments=10, queue_size=10000):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.entries = queue.Queue(maxsize=queue_size)
+        self.lock = threading.Lock()
+        self.segments = [] # oldest first
+        self.written = 0
+        self.dropped = 0
+        self.file = None
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+        self.thread.start()
+
+    def record(self, entry):
+        """Queues an entry ({'at': epoch s, 'system': ..., ...}) for writing. Never blocks."""
+        try:
+            self.entries.put_nowait(entry)
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+
+    def close(self):
+        """Writes what is queued and closes the current segment."""
+        if self.thread.is_alive():
+            self.entries.put(None)
+            self.thread.join(timeout=5)
+
+    def _load_index(self):
+        """Indexes the segments left by earlier runs, so their commands can still be queried."""
+        for path in sorted(glob.glob(os.path.join(self.directory, 'commands-*.jsonl'))):
+            segment = Segment(path)
+            with open(path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        segment.add(offset, json.loads(line))
+                    except ValueError:
+                        pass # A line cut short by a crash
+                    offset += len(line)
+            segment.size = offset
+            self.segments.append(segment)
+
+    def _write_loop(self):
+        while True:
+            batch = [self.entries.get()]
+            try:
+                while len(batch) < 1000:
+                    batch.append(self.entries.get_nowait())
+            except queue.Empty:
+                pass
+
+            closing = None in batch
+            self._write([entry for entry in batch if entry is not None])
+            if closing:
+                if self.file:
+                    self.file.close()
+                return
+
+    def _write(self, batch):
+        if not batch:
+            return
+        written = []
+        try:
+            for entry in batch:
+                line = (json.dumps(entry, separators=(',', ':'), default=str) + '\n').encode()
+                segment = self._segment_for(len(line))
+                self.file.write(line)
+                written.append((segment, segment.size, entry))
+                segment.size += len(line)
+            self.file.flush()
+        except OSError as e:
+            print(f"Journal write failed: {e}")
+        # Indexed once on disk, so queries never read a half-written line
+        with self.lock:
+            for segment, offset, entry in written:
+                segment.add(offset, entry)
+            self.written += len(written)
+
+    def _segment_for(self, length):
+        """The segment to append to, starting a new one (and dropping the oldest) when it is full."""
+        segment = self.segments[-1] if self.segments and self.file else None
+        if segment is None or segment.size + length > self.max_bytes:
+            if self.file:
+                self.file.close()
+            # Named by start time (ms), so the file names sort oldest first
+            started = int(time.time() * 1000)
+            while os.path.exists(os.path.join(self.directory, f'commands-{started}.jsonl')):
+                started += 1
+            path = os.path.join(self.directory, f'commands-{started}.jsonl')
+            segment = Segment(path)
+            self.file = open(path, 'ab')
+            with self.lock:
+                self.segments.append(segment)
+                while len(self.segments) > self.max_segments:
+                    oldest = self.segments.pop(0)
+                    try: os.remove(oldest.path)
+                    except OSError: pass
+        return segment
+
+    def query(self, since=None, until=None, sys_id=None, action=None, limit=1000):
+        """
+        Entries with since <= at <= until (epoch s), optionally for one system and/or
+        abstract action, oldest first. At most `limit`, the most recent ones if more match.
+        """
+        since = since if since is not None else float('-inf')
+        until = until if until is not None else float('inf')
+        with self.lock:
+            # (path, offset, count) of every block that can hold a match
+            blocks = [
+                (segment.path, block['offset'], block['count'])
+                for segment in self.segments for block in segment.blocks
+                if block['max_at'] >= since and block['min_at'] <= until
+                and (sys_id is None or sys_id in block['systems'])
+            ]
+
+        matches = []
+        for path, offset, count in blocks:
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    for _ in range(count):
+                        line = f.readline()
+                        if not line:
+                            break
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue
+                        if (since <= entry['at'] <= until
+                                and (sys_id is None or entry.get('system') == sys_id)
+                                and (action is None or entry.get('action') == action)):
+                            matches.append(entry)
+            except OSError:
+                continue # Rotated away since the index was read
+        matches.sort(key=lambda entry: entry['at'])
+        return matches[-limit:] if limit else matches
+
+    def stats(self):
+        with self.lock:
+            return {
+                'written': self.written,
+                'dropped': self.dropped,
+                'queued': self.entries.qsize(),
+                'segments': len(self.segments),
+                'bytes': sum(segment.size for segment in self.segments),
+            }
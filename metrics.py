@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import deque
+
+# Stages a command passes through, in order. Each is a time.time() stamp on the trace dict.
+STAGES = ['received', 'enqueued', 'dequeued', 'eval_start', 'eval_end', 'emitted']
+
+# Spans derived from the stages: name -> (from stage, to stage)
+SPANS = {
+    'resolve': ('received', 'enqueued'),
+    'queue': ('enqueued', 'dequeued'),
+    'evaluate': ('eval_start', 'eval_end'),
+    'reply': ('eval_end', 'emitted'),
+    'total': ('received', 'emitted'),
+}
+
+QUANTILES = [0.5, 0.95, 0.99]
+
+def new_trace():
+    """Starts a trace for a command received now."""
+    return {'received': time.time()}
+
+def stamp(trace, stage):
+    """Records a stage on a trace. No-op for untraced commands."""
+    if trace is not None:
+        trace[stage] = time.time()
+
+class RollingHistogram:
+    """Keeps the most recent samples and reports percentiles over them."""
+
+    def __init__(self, window=1000):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            **{f'p{int(q * 100)}': self.percentile(q) for q in QUANTILES}
+        }
+
+class LatencyMetrics:
+    """Rolling latency histograms per span, keyed by system and by action."""
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.lock = threading.Lock()
+        self.by_system = {}
+        self.by_action = {}
+
+    def _histogram(self, table, span, key):
+        histogram = table.get((span, key))
+        if histogram is None:
+            histogram = table[(span, key)] = RollingHistogram(self.window)
+        return histogram
+
+    def record(self, sys_id, action_id, trace):
+        """Feeds a finished trace into the histograms. Spans with missing stages are skipped."""
+        with self.lock:
+            for span, (start, end) in SPANS.items():
+                if start in trace and end in trace:
+                    seconds = trace[end] - trace[start]
+                    self._histogram(self.by_system, span, sys_id).add(seconds)
+                    self._histogram(self.by_action, span, action_id).add(seconds)
+
+    def to_json(self):
+        with self.lock:
+            return {
+                'systems': self._table_json(self.by_system),
+                'actions': self._table_json(self.by_action),
+            }
+
+    def _table_json(self, table):
+        result = {}
+        for (span, key), histogram in table.items():
+            result.setdefault(key, {})[span] = histogram.summary()
+        return result
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for metric, label, table in [
+                ('mbt_system_latency_seconds', 'system', self.by_system),
+                ('mbt_action_latency_seconds', 'action', self.by_action),
+            ]:
+                lines.append(f'# HELP {metric} Command latency per {label} and span.')
+                lines.append(f'# TYPE {metric} summary')
+                for (span, key), histogram in sorted(table.items()):
+                    labels = f'{label}="{key}",span="{span}"'
+                    for q in QUANTILES:
+                        value = histogram.percentile(q)
+                        if value is not None:
+                            lines.append(f'{metric}{{{labels},quantile="{q}"}} {value:.6f}')
+                    lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+                    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
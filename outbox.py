@@ -0,0 +1,92 @@
+import threading
+import time
+import uuid
+from collections import deque
+
+# Kinds of per-system values the outbox carries, as keyed in each batch
+KINDS = ('status', 'state')
+
+class StatusOutbox:
+    """
+    Collects status and device state changes from any thread without blocking it,
+    and sends them from its own thread as numbered delta batches:
+
+        {'epoch': '...', 'seq': 42, 'status': {'camera1': 'ONLINE'}, 'state': {'camera2': 'RECORDING'}}
+
+    Changes to the same system within one window are coalesced to the last value.
+    Recent batches are kept so a reconnecting client can catch up from the last
+    seq it saw instead of asking the browser worker for everything. The epoch
+    changes with every server start, so seqs from a previous run aren't trusted.
+    """
+
+    def __init__(self, emit, window=0.05, history=500):
+        self.emit = emit
+        self.window = window
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.pending = {kind: {} for kind in KINDS}
+        self.current = {kind: {} for kind in KINDS}
+        self.batches = deque(maxlen=history)
+        self.seq = 0
+        self.epoch = uuid.uuid4().hex
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def put(self, kind, sys_id, value):
+        """Queues a change. Returns immediately."""
+        with self.lock:
+            self.pending[kind][sys_id] = value
+        self.wakeup.set()
+
+    def forget(self, sys_ids):
+        """Drops systems that no longer exist from the current values."""
+        with self.lock:
+            for values in list(self.current.values()) + list(self.pending.values()):
+                for sys_id in sys_ids:
+                    values.pop(sys_id, None)
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            # Let the rest of a burst (e.g. a restart of every system) land in this batch
+            time.sleep(self.window)
+            self.wakeup.clear()
+
+            with self.lock:
+                if not any(self.pending.values()):
+                    continue
+                self.seq += 1
+                batch = {'epoch': self.epoch, 'seq': self.seq}
+                for kind in KINDS:
+                    batch[kind] = self.pending[kind]
+                    self.current[kind].update(self.pending[kind])
+                    self.pending[kind] = {}
+                self.batches.append(batch)
+
+            try:
+                self.emit(batch)
+            except Exception as e:
+                print(f"Error sending status batch {batch['seq']}: {e}")
+
+    def sync(self, epoch=None, since=None):
+        """
+        What a client that last saw batch `since` of `epoch` needs to catch up: the
+        merged batches after it, or every current value ('full': True) when it comes
+        from another run or is older than the kept history.
+        """
+        with self.lock:
+            reply = {'epoch': self.epoch, 'seq': self.seq, 'full': False}
+            oldest = self.batches[0]['seq'] if self.batches else self.seq + 1
+            if epoch != self.epoch or not isinstance(since, int) or since > self.seq or since < oldest - 1:
+                reply['full'] = True
+                for kind in KINDS:
+                    reply[kind] = dict(self.current[kind])
+                return reply
+
+            for kind in KINDS:
+                reply[kind] = {}
+            for batch in self.batches:
+                if batch['seq'] > since:
+                    for kind in KINDS:
+                        reply[kind].update(batch[kind])
+            return reply
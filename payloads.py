@@ -0,0 +1,38 @@
+# Shape checks for command requests from the UI (Socket.IO) and REST, run before any
+# lookup so a malformed request is answered as a client error rather than raising.
+
+def _id_error(value, field, required=True):
+    if value is None and not required:
+        return None
+    if not isinstance(value, str):
+        return f"'{field}' must be a string"
+    return None
+
+def check_command(data):
+    """Why an execute_command request is malformed, or None if it is well formed."""
+    if not isinstance(data, dict):
+        return 'Request must be a JSON object'
+    return (_id_error(data.get('system_id'), 'system_id')
+            or _id_error(data.get('action_id'), 'action_id')
+            or _id_error(data.get('idempotency_key'), 'idempotency_key', required=False))
+
+def check_batch(data):
+    """
+    Why a batch request is malformed, or None if it is well formed. Accepts
+    { 'commands': [{ 'system_id', 'action_id' }, ...] } or { 'action_id', 'group' }.
+    """
+    if not isinstance(data, dict):
+        return 'Request must be a JSON object'
+    error = _id_error(data.get('idempotency_key'), 'idempotency_key', required=False)
+    if error:
+        return error
+    if 'commands' in data:
+        commands = data['commands']
+        if not isinstance(commands, list) or not all(isinstance(c, dict) for c in commands):
+            return "'commands' must be a list of { system_id, action_id } objects"
+        for command in commands:
+            error = _id_error(command.get('system_id'), 'system_id') or _id_error(command.get('action_id'), 'action_id')
+            if error:
+                return error
+        return None
+    return _id_error(data.get('action_id'), 'action_id') or _id_error(data.get('group'), 'group', required=False)
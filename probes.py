@@ -0,0 +1,78 @@
+import json
+
+# Device state probes come from the 'state_probe' block of a type in types.yaml.
+# Either a JS expression that evaluates to the state name:
+#
+#   state_probe:
+#       expression: "document.body.classList.contains('rec') ? 'RECORDING' : 'STANDBY'"
+#
+# or a selector whose attribute (or text, if no attribute) is matched against substrings:
+#
+#   state_probe:
+#       selector: "#BUTTON_REC_BUTTON"
+#       attribute: "class"
+#       states:
+#           RECORDING: "recording"
+#       default: "STANDBY"
+
+# Name of the binding pages report state changes through
+BINDING_NAME = '__mbtReportState'
+
+# Installed as an init script so it comes back on every reload. Re-reads the probe
+# whenever the DOM mutates and only calls out to us when the state changes.
+OBSERVER_JS = """(() => {
+    if (window !== window.top) return;
+    const read = () => { try { return String(%(read)s); } catch (e) { return 'UNKNOWN'; } };
+    let last = null;
+    const report = () => {
+        const state = read();
+        if (state !== last) {
+            last = state;
+            window.%(binding)s(state);
+        }
+    };
+    const start = () => {
+        report();
+        new MutationObserver(report).observe(document, { subtree: true, childList: true, attributes: true, characterData: true });
+    };
+    if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', start, { once: true });
+    else start();
+})()"""
+
+SELECTOR_READ_JS = """(() => {
+    const el = document.querySelector(%(selector)s);
+    if (!el) return 'UNKNOWN';
+    const value = %(attribute)s ? (el.getAttribute(%(attribute)s) || '') : el.textContent;
+    for (const [state, match] of Object.entries(%(states)s)) {
+        if (value.includes(match)) return state;
+    }
+    return %(default)s;
+})()"""
+
+def get_probe(sys_data):
+    return sys_data.get('state_probe')
+
+def confirms(probe, state):
+    """
+    True if the probe positively matched `state`, so an action may treat it as reached.
+    A selector probe's default (nothing matched) and UNKNOWN never are: a probe that
+    doesn't fit the device's page would otherwise always read as its default.
+    """
+    if not probe or state in (None, 'UNKNOWN'):
+        return False
+    if 'expression' in probe:
+        return True
+    return state in probe.get('states', {})
+
+def observer_script(probe):
+    """Init script that watches the page and reports the probe's state through the binding."""
+    if 'expression' in probe:
+        read = probe['expression']
+    else:
+        read = SELECTOR_READ_JS % {
+            'selector': json.dumps(probe['selector']),
+            'attribute': json.dumps(probe.get('attribute')),
+            'states': json.dumps(probe.get('states', {})),
+            'default': json.dumps(probe.get('default', 'UNKNOWN')),
+        }
+    return OBSERVER_JS % {'read': read, 'binding': BINDING_NAME}
@@ -0,0 +1,72 @@
+from fnmatch import fnmatch
+
+# Page profiles come from the 'profile' block of a type in types.yaml, e.g.
+#
+#   profile:
+#       viewport: {width: 800, height: 600}
+#       block_resources: [image, font, media]   # Playwright resource types
+#       allow_resources: [script, xhr, fetch]   # or: block every type not listed
+#       block_urls: ["*/analytics/*"]           # glob patterns on the full URL
+#       allow_urls: ["*/img/rec_*.png"]         # always let these through
+#       disable_animations: true
+
+DEFAULT_VIEWPORT = {'width': 1280, 'height': 720}
+
+# Injected at document start; the style is attached as soon as there is a root element.
+DISABLE_ANIMATIONS_JS = """(() => {
+    const style = document.createElement('style');
+    style.textContent = '*, *::before, *::after { animation: none !important; transition: none !important; caret-color: auto !important; }';
+    const attach = () => (document.head || document.documentElement).appendChild(style);
+    if (document.documentElement) attach();
+    else document.addEventListener('readystatechange', attach, { once: true });
+})()"""
+
+# CDP Performance.getMetrics names reported per context, and the keys they're reported as
+MEMORY_METRICS = {
+    'JSHeapUsedSize': 'js_heap_used_bytes',
+    'JSHeapTotalSize': 'js_heap_total_bytes',
+    'Nodes': 'dom_nodes',
+    'Documents': 'documents',
+    'Frames': 'frames',
+    'JSEventListeners': 'event_listeners',
+}
+
+def get_profile(sys_data):
+    return sys_data.get('profile') or {}
+
+def context_options(sys_data):
+    """Keyword arguments for browser.new_context for a system."""
+    profile = get_profile(sys_data)
+    options = {
+        'viewport': profile.get('viewport', DEFAULT_VIEWPORT),
+        'http_credentials': sys_data.get('browser_auth'),
+        # Actions are compiled in the page with new Function, which a CSP without unsafe-eval refuses
+        'bypass_csp': True,
+    }
+    if profile.get('disable_animations'):
+        options['reduced_motion'] = 'reduce'
+    return options
+
+def needs_routing(sys_data):
+    """True if the profile blocks anything, so requests have to be routed through us."""
+    profile = get_profile(sys_data)
+    return bool(profile.get('allow_resources') or profile.get('block_resources') or profile.get('block_urls'))
+
+def should_block(sys_data, resource_type, url):
+    """Routing decision for one request. Documents are never blocked."""
+    if resource_type == 'document':
+        return False
+    profile = get_profile(sys_data)
+    if any(fnmatch(url, pattern) for pattern in profile.get('allow_urls', [])):
+        return False
+    allowed = profile.get('allow_resources')
+    if allowed and resource_type not in allowed:
+        return True
+    if resource_type in profile.get('block_resources', []):
+        return True
+    return any(fnmatch(url, pattern) for pattern in profile.get('block_urls', []))
+
+def summarize_metrics(cdp_metrics):
+    """Turns a Performance.getMetrics reply into the memory report keys."""
+    values = {m['name']: m['value'] for m in cdp_metrics.get('metrics', [])}
+    return {key: values.get(name) for name, key in MEMORY_METRICS.items()}
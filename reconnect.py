@@ -0,0 +1,88 @@
+import random
+import threading
+import time
+
+# Statuses that mean a system has dropped and should be reconnected
+FAILED_STATUSES = ('ERROR', 'CLOSED', 'OFFLINE')
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+def backoff_delay(attempts, base_s, max_s):
+    """Exponential delay before the next attempt, with its upper half jittered so systems that dropped together don't retry together."""
+    delay = min(max_s, base_s * 2 ** attempts)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class ReconnectTracker:
+    """
+    Decides when dropped systems are retried. A system that fails is retried after
+    a jittered, exponentially growing delay. After `circuit_after` failed attempts
+    in a row its circuit opens: it is left alone for `circuit_open_s`, then given a
+    single attempt (half open) that either closes the circuit or opens it again.
+    Going ONLINE, however it happens, clears the system's state.
+    """
+
+    def __init__(self, enabled=True, base_s=1.0, max_s=30.0, circuit_after=8, circuit_open_s=300.0):
+        self.enabled = enabled
+        self.base_s = base_s
+        self.max_s = max_s
+        self.circuit_after = circuit_after
+        self.circuit_open_s = circuit_open_s
+        self.lock = threading.Lock()
+        self.systems = {} # sys_id -> {'attempts', 'next_retry_at', 'circuit', 'in_flight'}
+
+    def observe(self, sys_id, status):
+        """Feeds a status change in; schedules the next attempt on a failure."""
+        if not self.enabled:
+            return
+        with self.lock:
+            entry = self.systems.get(sys_id)
+            if status == 'ONLINE':
+                self.systems.pop(sys_id, None)
+                return
+            if status not in FAILED_STATUSES:
+                return
+            if entry is None:
+                entry = self.systems[sys_id] = {'attempts': 0, 'next_retry_at': None, 'circuit': CLOSED, 'in_flight': False}
+            elif not entry['in_flight']:
+                return # Same outage, already scheduled
+
+            entry['in_flight'] = False
+            now = time.time()
+            if entry['circuit'] == HALF_OPEN or entry['attempts'] >= self.circuit_after:
+                entry['circuit'] = OPEN
+                entry['next_retry_at'] = now + self.circuit_open_s
+            else:
+                entry['next_retry_at'] = now + backoff_delay(entry['attempts'], self.base_s, self.max_s)
+
+    def due(self, now=None):
+        """Systems whose next attempt is due and not already running."""
+        now = now or time.time()
+        with self.lock:
+            return [
+                sys_id for sys_id, entry in self.systems.items()
+                if not entry['in_flight'] and entry['next_retry_at'] <= now
+            ]
+
+    def attempt(self, sys_id):
+        """Marks an attempt as started."""
+        with self.lock:
+            entry = self.systems.get(sys_id)
+            if entry is None:
+                return
+            entry['attempts'] += 1
+            entry['in_flight'] = True
+            entry['next_retry_at'] = None
+            if entry['circuit'] == OPEN:
+                entry['circuit'] = HALF_OPEN
+
+    def forget(self, sys_id):
+        with self.lock:
+            self.systems.pop(sys_id, None)
+
+    def info(self, sys_id):
+        """A system's reconnect state for the status snapshot, or None when it isn't reconnecting."""
+        with self.lock:
+            entry = self.systems.get(sys_id)
+            if entry is None:
+                return None
+            return {'attempts': entry['attempts'], 'next_retry_at': entry['next_retry_at'], 'circuit': entry['circuit']}
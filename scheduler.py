@@ -0,0 +1,199 @@
+import itertools
+import queue
+import threading
+import time
+
+# Priority classes, lowest runs first. Triggers are what an operator is waiting on;
+# maintenance (restarts, config changes) can take seconds and is never urgent.
+TRIGGER, STATUS, MAINTENANCE = 0, 1, 2
+CLASS_NAMES = {TRIGGER: 'trigger', STATUS: 'status', MAINTENANCE: 'maintenance'}
+
+PRIORITIES = {
+    'execute': TRIGGER,
+    'fanout': TRIGGER,
+    'schedule': TRIGGER,
+    'memory': STATUS,
+    'restart': MAINTENANCE,
+    'reconfigure': MAINTENANCE,
+}
+
+# The close sentinel sorts after everything, so queued work still gets answered
+CLOSE = MAINTENANCE + 1
+
+def priority_of(cmd_type):
+    return PRIORITIES.get(cmd_type, MAINTENANCE)
+
+class SchedulerStats:
+    """Queue depth, held and dropped task counts per priority class."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.depth = {name: 0 for name in CLASS_NAMES.values()}
+        self.max_depth = {name: 0 for name in CLASS_NAMES.values()}
+        self.held = {name: 0 for name in CLASS_NAMES.values()}
+        self.dropped = {name: 0 for name in CLASS_NAMES.values()}
+
+    def queued(self, priority):
+        name = CLASS_NAMES[priority]
+        with self.lock:
+            self.depth[name] += 1
+            self.max_depth[name] = max(self.max_depth[name], self.depth[name])
+
+    def dequeued(self, priority):
+        with self.lock:
+            self.depth[CLASS_NAMES[priority]] -= 1
+
+    def set_held(self, priority, count):
+        with self.lock:
+            self.held[CLASS_NAMES[priority]] = count
+
+    def dropped_one(self, priority):
+        with self.lock:
+            self.dropped[CLASS_NAMES[priority]] += 1
+
+    def to_json(self):
+        with self.lock:
+            return {
+                name: {
+                    'depth': self.depth[name],
+                    'max_depth': self.max_depth[name],
+                    'held': self.held[name],
+                    'dropped': self.dropped[name],
+                }
+                for name in CLASS_NAMES.values()
+            }
+
+def merge_stats(stats_list):
+    """Sums several SchedulerStats.to_json() results, e.g. one per shard."""
+    merged = {}
+    for stats in stats_list:
+        for name, values in stats.items():
+            target = merged.setdefault(name, dict.fromkeys(values, 0))
+            for key, value in values.items():
+                target[key] = target.get(key, 0) + value
+    return merged
+
+def stats_to_prometheus(stats):
+    lines = []
+    for key, kind, help_text in [
+        ('depth', 'gauge', 'Worker tasks waiting to run, per priority class.'),
+        ('max_depth', 'gauge', 'Highest queue depth seen, per priority class.'),
+        ('held', 'gauge', 'Tasks held back until their system is free, per priority class.'),
+        ('dropped', 'counter', 'Tasks dropped because their deadline passed, per priority class.'),
+    ]:
+        metric = f'mbt_scheduler_{key}' if kind == 'gauge' else f'mbt_scheduler_{key}_total'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, values in sorted(stats.items()):
+            lines.append(f'{metric}{{class="{name}"}} {values[key]}')
+    return '\n'.join(lines) + '\n'
+
+class CommandScheduler:
+    """
+    Replaces the worker's FIFO. Tasks come out by priority class, then in the
+    order they were queued, and carry the deadline their caller stops waiting at,
+    so a command nobody is waiting for any more is dropped instead of run late.
+    Tasks for a system that is busy (e.g. still loading after a restart) can be
+    held and are released in order once it is free, without holding up others.
+    """
+
+    def __init__(self):
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.held = [] # (sys_id, item), oldest first
+        self.stats = SchedulerStats()
+
+    def put(self, cmd_type, task, timeout=None):
+        priority = priority_of(cmd_type)
+        deadline = time.time() + timeout if timeout else None
+        self.stats.queued(priority)
+        self.queue.put((priority, next(self.order), deadline, task))
+
+    def close(self):
+        self.queue.put((CLOSE, next(self.order), None, None))
+
+    def empty(self):
+        """True if no task is waiting to be taken (held tasks aside)."""
+        return self.queue.empty()
+
+    def get_nowait(self):
+        """Next (priority, order, deadline, task). Raises queue.Empty."""
+        item = self.queue.get_nowait()
+        if item[0] != CLOSE:
+            self.stats.dequeued(item[0])
+        return item
+
+    def expired(self, item):
+        """True (and counted as dropped) if the caller has stopped waiting for this task."""
+        deadline = item[2]
+        if deadline is not None and time.time() > deadline:
+            self.stats.dropped_one(item[0])
+            return True
+        return False
+
+    def hold(self, sys_id, item):
+        self.held.append((sys_id, item))
+        self._count_held()
+
+    def is_holding(self, sys_id):
+        return any(held_id == sys_id for held_id, _ in self.held)
+
+    def release(self, is_loading):
+        """
+        Takes the held items whose system has finished loading, keeping each system's
+        order, plus any whose deadline has passed so the caller can answer them as dropped.
+        is_loading must not count the held items themselves, or they would never leave.
+        """
+        ready = []
+        blocked = set()
+        now = time.time()
+        for entry in list(self.held):
+            sys_id, item = entry
+            deadline = item[2]
+            expired = deadline is not None and now > deadline
+            if not expired and (sys_id in blocked or is_loading(sys_id)):
+                blocked.add(sys_id)
+                continue
+            self.held.remove(entry)
+            ready.append(item)
+        if ready:
+            self._count_held()
+        return ready
+
+    def _count_held(self):
+        counts = {priority: 0 for priority in CLASS_NAMES}
+        for _, item in self.held:
+            counts[item[0]] += 1
+        for priority, count in counts.items():
+            self.stats.set_held(priority, count)
+
+class FireTime:
+    """
+    The shared instant (epoch ms) a scheduled batch fires at. It is only chosen once
+    the page clocks have been measured, so measuring doesn't eat into the lead time;
+    HTTP sends for the same batch wait on it. Set up front when the caller gave one,
+    or chosen by `arbiter(lead_ms)` when another process (the shards' parent) decides.
+    """
+
+    def __init__(self, fire_at=None, arbiter=None):
+        self.arbiter = arbiter
+        self.lock = threading.Lock()
+        self.chosen = threading.Event()
+        self.fire_at = fire_at
+        if fire_at is not None:
+            self.chosen.set()
+
+    def choose(self, lead_ms):
+        """Called once the clocks are measured. Returns the instant, picking now + lead_ms if nobody has yet."""
+        with self.lock:
+            if not self.chosen.is_set():
+                fire_at = self.arbiter(lead_ms) if self.arbiter else None
+                self.fire_at = fire_at if fire_at is not None else time.time() * 1000 + lead_ms
+                self.chosen.set()
+            return self.fire_at
+
+    def wait(self, timeout=None):
+        """The instant once chosen, or None if it wasn't within timeout."""
+        if not self.chosen.wait(timeout):
+            return None
+        return self.fire_at
@@ -0,0 +1,452 @@
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from config_loader import compile_config, diff_configs, replace_config
+from snapshot import StatusBoard
+from scheduler import merge_stats
+from watchdog import merge_reports
+
+# Playwright and the Flask threads don't survive fork, so shards always start fresh.
+mp = multiprocessing.get_context('spawn')
+
+# Put on a scheduled call's reply queue when its shard has measured its page clocks
+MEASURED = 'measured'
+
+def _portable(config):
+    """A config without its compiled tables, which are read-only mappings and don't pickle."""
+    return {key: value for key, value in config.items() if key != 'compiled'}
+
+def _compiled(config):
+    """A config sent by the parent, with its tables compiled again on this side."""
+    config['compiled'] = compile_config(config)
+    return config
+
+def _shard_main(shard_config, requests, events):
+    """
+    Entry point of a shard process: owns its own Chromium through a regular
+    BrowserManager and serves calls sent by the parent ShardedBrowserManager.
+    """
+    from browser import create_browser_manager
+    from scheduler import FireTime
+
+    def on_status_change(sys_id, status):
+        # Ship the error that came with this change, if any, for the parent's snapshot
+        snapshot = manager.status_board.current
+        error = snapshot.last_error.get(sys_id)
+        message = error['message'] if error and error['at'] == snapshot.changed_at.get(sys_id) else None
+        events.put(('status', sys_id, (status, message, snapshot.reconnect.get(sys_id))))
+
+    def on_state_change(sys_id, state):
+        events.put(('state', sys_id, state))
+
+    manager = create_browser_manager(_compiled(shard_config), status_callback=on_status_change, state_callback=on_state_change)
+    manager.start()
+
+    # Scheduled calls whose fire time the parent picks: request_id -> queue it arrives on
+    arming = {}
+
+    def arbiter_for(request_id):
+        """Tells the parent this shard's clocks are measured, then waits for the instant it picks."""
+        arming[request_id] = chosen = queue.Queue(maxsize=1)
+        def arbiter(lead_ms):
+            events.put(('measured', request_id, None))
+            try:
+                return chosen.get(timeout=10)
+            except queue.Empty:
+                return None # Parent never answered; fire on our own
+            finally:
+                arming.pop(request_id, None)
+        return arbiter
+
+    def serve(request_id, method, args, kwargs):
+        if kwargs.pop('await_fire_at', False):
+            kwargs['fire_at'] = FireTime(arbiter=arbiter_for(request_id))
+        if method == 'apply_config':
+            args = (_compiled(args[0]),)
+        try:
+            result = getattr(manager, method)(*args, **kwargs)
+        except Exception as e:
+            result = {'success': False, 'message': str(e)}
+        # Traces are stamped in this process, so ship them back with the result
+        traces = kwargs.get('traces') or {}
+        if kwargs.get('trace') is not None:
+            traces = {args[0]: kwargs['trace']}
+        events.put(('result', request_id, (result, traces)))
+
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id, method, args, _ = request
+        if method == 'fire_at':
+            chosen = arming.get(request_id)
+            if chosen:
+                chosen.put(args[0])
+            continue
+        # Each call gets its own thread so a long restart doesn't hold up triggers
+        threading.Thread(target=serve, args=request, daemon=True).start()
+
+    manager.close()
+
+class Shard:
+    """One worker process and its command channel."""
+
+    def __init__(self, index, sys_ids, config):
+        self.index = index
+        self.sys_ids = sys_ids
+        self.config = config
+        self.process = None
+        self.requests = None
+        self.events = None
+        self.pending = {}
+
+class ShardedBrowserManager:
+    """
+    Spreads systems across several processes, each with its own Chromium,
+    so a hung renderer or slow page only stalls the systems on its shard.
+    Same public API as BrowserManager.
+    """
+
+    def __init__(self, config, status_callback=None, state_callback=None):
+        self.config = config
+        self.status_callback = status_callback
+        self.state_callback = state_callback
+        self.device_states = {}
+        # Kept from the shards' status events, so reading it never waits on a shard
+        self.status_board = StatusBoard(config['compiled'].systems)
+        self.started = False
+        self.closing = False
+        self.request_ids = itertools.count()
+
+        # Deal systems out round-robin so each group is spread over the shards
+        shard_count = max(1, int(config.get('shards', 1)))
+        systems = config.get('resolved_systems', {})
+        sys_ids = [sys_id for group in systems.values() for sys_id in group['systems']]
+        self.shard_of = {sys_id: i % shard_count for i, sys_id in enumerate(sys_ids)}
+
+        self.shards = []
+        for index in range(shard_count):
+            owned = [sys_id for sys_id in sys_ids if self.shard_of[sys_id] == index]
+            self.shards.append(Shard(index, owned, self._shard_config(owned)))
+
+        self.monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+
+    def _shard_config(self, owned):
+        """A copy of the config that only resolves the systems this shard owns."""
+        shard_config = dict(self.config)
+        shard_config['shards'] = 1
+        shard_config['resolved_systems'] = {}
+        for group_key, group in self.config.get('resolved_systems', {}).items():
+            shard_config['resolved_systems'][group_key] = {
+                'name': group['name'],
+                'systems': {k: v for k, v in group['systems'].items() if k in owned}
+            }
+        shard_config['compiled'] = compile_config(shard_config)
+        return shard_config
+
+    def start(self):
+        """Starts every shard process."""
+        if not self.started:
+            for shard in self.shards:
+                self._spawn(shard)
+            self.monitor.start()
+            self.started = True
+
+    def _spawn(self, shard):
+        shard.requests = mp.Queue()
+        shard.events = mp.Queue()
+        shard.process = mp.Process(
+            target=_shard_main,
+            args=(_portable(shard.config), shard.requests, shard.events),
+            daemon=True
+        )
+        shard.process.start()
+        print(f"Started shard {shard.index} (PID: {shard.process.pid}) for {', '.join(shard.sys_ids)}")
+        threading.Thread(target=self._read_events, args=(shard, shard.events), daemon=True).start()
+
+    def _read_events(self, shard, events):
+        """Relays status changes and call results coming back from one shard process."""
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            kind, key, payload = event
+            if kind == 'status':
+                self._relay_status(key, *payload)
+            elif kind == 'state':
+                self.device_states[key] = payload
+                if self.state_callback:
+                    self.state_callback(key, payload)
+            elif kind == 'result':
+                reply = shard.pending.pop(key, None)
+                if reply:
+                    reply.put(payload)
+            elif kind == 'measured':
+                reply = shard.pending.get(key)
+                if reply:
+                    reply.put((MEASURED, key))
+
+    def _monitor_loop(self):
+        """Restarts a shard whose process died, leaving the others alone."""
+        while not self.closing:
+            time.sleep(2.0)
+            for shard in self.shards:
+                if self.closing or shard.process.is_alive():
+                    continue
+                print(f"Shard {shard.index} exited ({shard.process.exitcode}), restarting...")
+                for reply in list(shard.pending.values()):
+                    reply.put(None)
+                shard.pending.clear()
+                shard.events.put(None) # Stop the old reader
+                for sys_id in shard.sys_ids:
+                    self._relay_status(sys_id, 'ERROR', f'Shard {shard.index} exited ({shard.process.exitcode})')
+                self._spawn(shard)
+
+    def _relay_status(self, sys_id, status, error=None, reconnect=None):
+        """Publishes a status reported by (or for) a shard and notifies the callback."""
+        self.status_board.publish(lambda snapshot: snapshot.updated(sys_id, status, error).with_reconnect(sys_id, reconnect))
+        if self.status_callback:
+            self.status_callback(sys_id, status)
+
+    def _send(self, shard, method, *args, **kwargs):
+        """Sends a call to a shard. Returns the reply queue to wait on."""
+        request_id = next(self.request_ids)
+        reply = queue.Queue()
+        shard.pending[request_id] = reply
+        shard.requests.put((request_id, method, args, kwargs))
+        return reply
+
+    def _wait(self, reply, timeout, traces=None):
+        """Waits for a shard reply, merging the shard's trace stamps. Returns None on timeout."""
+        try:
+            payload = reply.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if payload is None:
+            return None
+        result, shard_traces = payload
+        for sys_id, stamps in shard_traces.items():
+            if traces and sys_id in traces:
+                traces[sys_id].update(stamps)
+        return result
+
+    def _wait_measured(self, reply, timeout):
+        """
+        Waits for a scheduled call's shard to report its clocks measured. Returns the
+        call's request id, or None if it answered outright (nothing to arm) or timed out.
+        """
+        try:
+            payload = reply.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if isinstance(payload, tuple) and payload[0] == MEASURED:
+            return payload[1]
+        reply.put(payload) # The call's result, left for _wait
+        return None
+
+    def _split(self, targets):
+        """Groups (sys_id, ...) targets by the shard that owns them."""
+        by_shard = {}
+        unknown = []
+        for target in targets:
+            index = self.shard_of.get(target[0])
+            if index is None:
+                unknown.append(target[0])
+            else:
+                by_shard.setdefault(index, []).append(target)
+        return by_shard, unknown
+
+    # Idempotency keys are checked in the shard that owns each system
+
+    def execute_command(self, sys_id, action_name, trace=None, idempotency_key=None):
+        if sys_id not in self.shard_of:
+            return {'success': False, 'message': 'System config not found'}
+        shard = self.shards[self.shard_of[sys_id]]
+        reply = self._send(shard, 'execute_command', sys_id, action_name, trace=trace, idempotency_key=idempotency_key)
+        result = self._wait(reply, 12, {sys_id: trace} if trace is not None else None)
+        if result is None:
+            return {'success': False, 'message': 'Timeout waiting for shard'}
+        return result
+
+    def execute_fanout(self, targets, traces=None, idempotency_key=None):
+        by_shard, unknown = self._split(targets)
+        results = {sys_id: {'success': False, 'message': 'System config not found'} for sys_id in unknown}
+        dispatched = {}
+
+        # Send to every shard first, then collect, so the shards dispatch in parallel
+        replies = []
+        for index, shard_targets in by_shard.items():
+            shard_traces = {t[0]: traces[t[0]] for t in shard_targets if traces and t[0] in traces}
+            replies.append((shard_targets, self._send(
+                self.shards[index], 'execute_fanout', shard_targets, traces=shard_traces, idempotency_key=idempotency_key
+            )))
+        for shard_targets, reply in replies:
+            result = self._wait(reply, 12, traces)
+            if result is None:
+                for sys_id, _ in shard_targets:
+                    results[sys_id] = {'success': False, 'message': 'Timeout waiting for shard'}
+                continue
+            results.update(result['results'])
+            dispatched.update(result['dispatched_at'])
+
+        skew_ms = 0.0
+        if dispatched:
+            skew_ms = max(dispatched.values()) - min(dispatched.values())
+        return {
+            'success': bool(results) and all(r['success'] for r in results.values()),
+            'results': results,
+            'dispatched_at': dispatched,
+            'skew_ms': skew_ms
+        }
+
+    def execute_scheduled(self, targets, lead_ms=500, traces=None, fire_at=None, idempotency_key=None):
+        by_shard, unknown = self._split(targets)
+        results = {sys_id: {'success': False, 'message': 'System config not found'} for sys_id in unknown}
+
+        # All shards fire at the same absolute instant. Unless given one, it is picked in
+        # two rounds: every shard measures its page clocks first, then all of them get
+        # an instant lead_ms after the slowest is done, so measuring doesn't eat the lead
+        await_fire_at = fire_at is None
+        replies = []
+        for index, shard_targets in by_shard.items():
+            shard_traces = {t[0]: traces[t[0]] for t in shard_targets if traces and t[0] in traces}
+            replies.append((index, shard_targets, self._send(
+                self.shards[index], 'execute_scheduled', shard_targets, lead_ms=lead_ms, traces=shard_traces,
+                fire_at=fire_at, await_fire_at=await_fire_at, idempotency_key=idempotency_key
+            )))
+        if await_fire_at:
+            deadline = time.time() + 10
+            measured = []
+            for index, _, reply in replies:
+                request_id = self._wait_measured(reply, max(0, deadline - time.time()))
+                if request_id is not None:
+                    measured.append((self.shards[index], request_id))
+            fire_at = time.time() * 1000 + lead_ms
+            for shard, request_id in measured:
+                shard.requests.put((request_id, 'fire_at', (fire_at,), {}))
+        for _, shard_targets, reply in replies:
+            result = self._wait(reply, 12 + lead_ms / 1000, traces)
+            if result is None:
+                for sys_id, _ in shard_targets:
+                    results[sys_id] = {'success': False, 'message': 'Timeout waiting for shard'}
+                continue
+            results.update(result['results'])
+
+        deviations = [r['deviation_ms'] for r in results.values() if 'deviation_ms' in r]
+        return {
+            'success': bool(results) and all(r['success'] for r in results.values()),
+            'results': results,
+            'fire_at': fire_at,
+            'skew_ms': max(deviations) - min(deviations) if deviations else 0.0,
+            'max_deviation_ms': max(abs(d) for d in deviations) if deviations else 0.0
+        }
+
+    def restart_system(self, sys_id):
+        if sys_id == 'all':
+            targets = self.shards
+        elif sys_id in self.shard_of:
+            targets = [self.shards[self.shard_of[sys_id]]]
+        else:
+            return {'success': False, 'message': 'System not found'}
+
+        replies = [self._send(shard, 'restart_system', sys_id) for shard in targets]
+        restarted = []
+        success = True
+        for reply in replies:
+            result = self._wait(reply, 32)
+            if result is None or not result.get('success'):
+                success = False
+                continue
+            restarted.extend(result.get('restarted', []))
+        if not success and not restarted:
+            return {'success': False, 'message': 'Timeout waiting for shard'}
+        return {'success': True, 'restarted': restarted}
+
+    def apply_config(self, new_config):
+        """
+        Switches to a reloaded config. Removed systems are dropped from their shard and
+        added ones dealt to the shard with the fewest systems; each shard then diffs its
+        own subset, so unchanged pages are left alone.
+        """
+        changes = diff_configs(self.config, new_config)
+        if changes['restart_keys']:
+            print(f"Warning: changes to {', '.join(changes['restart_keys'])} need a restart to take effect")
+        replace_config(self.config, new_config)
+
+        for sys_id in changes['removed']:
+            shard = self.shards[self.shard_of.pop(sys_id)]
+            shard.sys_ids.remove(sys_id)
+            self.device_states.pop(sys_id, None)
+        if changes['removed']:
+            self.status_board.publish(lambda snapshot: snapshot.without(set(changes['removed'])))
+        for sys_id in changes['added']:
+            shard = min(self.shards, key=lambda s: len(s.sys_ids))
+            shard.sys_ids.append(sys_id)
+            self.shard_of[sys_id] = shard.index
+            self.status_board.publish(lambda snapshot: snapshot.updated(sys_id, 'STOPPED'))
+
+        # Respawned shards start from shard.config, so keep it current too
+        replies = []
+        for shard in self.shards:
+            shard.config = self._shard_config(shard.sys_ids)
+            replies.append(self._send(shard, 'apply_config', _portable(shard.config)))
+        success = True
+        for reply in replies:
+            result = self._wait(reply, 12)
+            if result is None or not result.get('success'):
+                success = False
+        if not success:
+            return {'success': False, 'message': 'Timeout waiting for shard'}
+        return {
+            'success': True,
+            'added': list(changes['added']),
+            'removed': changes['removed'],
+            'navigated': list(changes['navigate']),
+            'reinitialized': list(changes['reinit']),
+            'restart_keys': changes['restart_keys']
+        }
+
+    def get_status(self):
+        return dict(self.status_board.current.statuses)
+
+    def get_scheduler_stats(self):
+        """Worker queue stats summed over the shards."""
+        replies = [self._send(shard, 'get_scheduler_stats') for shard in self.shards]
+        return merge_stats([stats for stats in (self._wait(reply, 6) for reply in replies) if stats])
+
+    def get_watchdog_report(self, stacks=True):
+        """Watchdog reports of the shards' workers, combined."""
+        replies = [self._send(shard, 'get_watchdog_report', stacks=stacks) for shard in self.shards]
+        return merge_reports([report for report in (self._wait(reply, 6) for reply in replies) if report])
+
+    def get_status_snapshot(self):
+        return self.status_board.current
+
+    def wait_status_change(self, version, timeout):
+        return self.status_board.wait(version, timeout)
+
+    def get_device_states(self):
+        return dict(self.device_states)
+
+    def get_memory_report(self):
+        replies = [self._send(shard, 'get_memory_report') for shard in self.shards]
+        report = {}
+        for reply in replies:
+            result = self._wait(reply, 12)
+            if result:
+                report.update(result)
+        return report
+
+    def _get_system_config(self, target_sys_id):
+        return self.config['compiled'].systems.get(target_sys_id)
+
+    def close(self):
+        self.closing = True
+        if self.started:
+            for shard in self.shards:
+                shard.requests.put(None)
+            for shard in self.shards:
+                shard.process.join(timeout=10)
+                shard.events.put(None)
@@ -0,0 +1,86 @@
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, replace
+
+@dataclass(frozen=True)
+class StatusSnapshot:
+    """
+    Status of every system at one version. Never modified once published; each
+    change produces a new snapshot, so readers can hold on to one without locking.
+    """
+    epoch: str = ''         # changes with every run, so versions from another run don't match
+    version: int = 0
+    statuses: dict = field(default_factory=dict)    # sys_id -> status
+    changed_at: dict = field(default_factory=dict)  # sys_id -> epoch s of the last status change
+    last_error: dict = field(default_factory=dict)  # sys_id -> {'message': ..., 'at': epoch s}
+    reconnect: dict = field(default_factory=dict)   # sys_id -> {'attempts', 'next_retry_at', 'circuit'}, while reconnecting
+
+    @property
+    def etag(self):
+        return f'"{self.epoch}-{self.version}"'
+
+    def updated(self, sys_id, status, error=None):
+        """The next snapshot, with a system's status and (optionally) the error that came with it."""
+        now = time.time()
+        statuses = self.statuses
+        changed_at = self.changed_at
+        if statuses.get(sys_id) != status:
+            statuses = {**statuses, sys_id: status}
+            changed_at = {**changed_at, sys_id: now}
+        last_error = self.last_error
+        if error:
+            last_error = {**last_error, sys_id: {'message': str(error), 'at': now}}
+        return replace(self, version=self.version + 1, statuses=statuses, changed_at=changed_at, last_error=last_error)
+
+    def with_reconnect(self, sys_id, info):
+        """The same version, with a system's reconnect state set (None clears it). Chained onto updated()."""
+        if self.reconnect.get(sys_id) == info:
+            return self
+        reconnect = {k: v for k, v in self.reconnect.items() if k != sys_id}
+        if info is not None:
+            reconnect[sys_id] = info
+        return replace(self, reconnect=reconnect)
+
+    def without(self, sys_ids):
+        """The next snapshot, with systems that no longer exist left out."""
+        def keep(values):
+            return {k: v for k, v in values.items() if k not in sys_ids}
+        return replace(
+            self, version=self.version + 1, statuses=keep(self.statuses),
+            changed_at=keep(self.changed_at), last_error=keep(self.last_error), reconnect=keep(self.reconnect)
+        )
+
+    def to_json(self):
+        return {
+            'version': self.version,
+            'statuses': self.statuses,
+            'changed_at': self.changed_at,
+            'last_error': self.last_error,
+            'reconnect': self.reconnect,
+        }
+
+class StatusBoard:
+    """
+    Holds the current StatusSnapshot. Reading `current` takes no lock: the
+    attribute is swapped for a new snapshot on every change. Writers are
+    serialized, and waiters are woken when the version moves on.
+    """
+
+    def __init__(self, sys_ids=()):
+        statuses = {sys_id: 'STOPPED' for sys_id in sys_ids}
+        self.current = StatusSnapshot(epoch=uuid.uuid4().hex[:12], statuses=statuses)
+        self.changed = threading.Condition()
+
+    def publish(self, change):
+        """Applies change(snapshot) -> snapshot and makes the result current."""
+        with self.changed:
+            self.current = change(self.current)
+            self.changed.notify_all()
+        return self.current
+
+    def wait(self, version, timeout):
+        """Waits until the version differs from `version`, or timeout. Returns the current snapshot."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.current.version != version, timeout)
+        return self.current
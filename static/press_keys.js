@@ -0,0 +1,24 @@
+// Idempotency keys for button presses. A press within doubleTapMs of the last one on
+// the same button is taken as a double tap and reuses its key, so the server answers
+// it with the first result instead of toggling the devices a second time. A later
+// press is a new command with a new key, even inside the server's dedup window, which
+// is only there for retries of the same key.
+function createPressKeys(doubleTapMs, now = Date.now) {
+    const lastPress = new Map(); // button scope -> { key, at } of its last press
+
+    function keyFor(scope) {
+        const at = now();
+        const press = lastPress.get(scope);
+        if (press && at - press.at < doubleTapMs) {
+            press.at = at; // a burst of taps stays one command
+            return press.key;
+        }
+        const key = `${at.toString(36)}-${Math.random().toString(36).slice(2)}`;
+        lastPress.set(scope, { key, at });
+        return key;
+    }
+
+    return { keyFor };
+}
+
+if (typeof module !== 'undefined') module.exports = { createPressKeys };
@@ -16,8 +16,9 @@ document.addEventListener('DOMContentLoaded', () => {
         statusDiv.classList.add('online');
         document.getElementById('disconnect-overlay').classList.remove('visible');
 
-        // Request initial system statuses
-        socket.emit('request_status');
+        // Catch up on statuses from the last batch seen (everything, the first time)
+        syncing = false;
+        requestSync();
     });
 
     socket.on('disconnect', () => {
@@ -27,31 +28,156 @@ document.addEventListener('DOMContentLoaded', () => {
         document.getElementById('disconnect-overlay').classList.add('visible');
     });
 
+    // Grid elements, looked up once per grid rather than on every message
+    const statusCells = new Map();   // sysId -> status cell
+    const actionCells = new Map();   // `${sysId}:${actionId}` -> action cell
+    const actionTargets = new Map(); // `${group}:${actionId}` (and `all:${actionId}`) -> action cells
+
+    function indexGrid() {
+        statusCells.clear();
+        actionCells.clear();
+        actionTargets.clear();
+        document.querySelectorAll('.system-status').forEach(el => {
+            statusCells.set(el.id.slice('status-'.length), el);
+        });
+        document.querySelectorAll('.action-cell').forEach(cell => {
+            const { system, group, action } = cell.dataset;
+            actionCells.set(`${system}:${action}`, cell);
+            for (const scope of [`${group}:${action}`, `all:${action}`]) {
+                if (!actionTargets.has(scope)) actionTargets.set(scope, []);
+                actionTargets.get(scope).push(cell);
+            }
+        });
+    }
+    indexGrid();
+
+    // Messages only record what changed; the DOM is updated once per animation frame
+    const dirtyStatuses = new Set();
+    let pendingResults = [];
+    let frameRequested = false;
+
+    function scheduleRender() {
+        if (frameRequested) return;
+        frameRequested = true;
+        requestAnimationFrame(render);
+    }
+
+    function render() {
+        frameRequested = false;
+        dirtyStatuses.forEach(paintStatus);
+        dirtyStatuses.clear();
+        const results = pendingResults;
+        pendingResults = [];
+        results.forEach(paintResult);
+    }
+
     // System Status Updates
+    const systemStatuses = {};
+    const deviceStates = {}; // RECORDING/STANDBY etc. from in-page state probes
+
     function updateSystemStatus(sysId, status) {
-        const el = document.getElementById(`status-${sysId}`);
+        // Kept even without a cell, for systems whose row a config reload is about to add
+        systemStatuses[sysId] = status;
+        dirtyStatuses.add(sysId);
+        scheduleRender();
+    }
+
+    function paintStatus(sysId) {
+        const el = statusCells.get(sysId);
         if (!el) return;
+        const status = systemStatuses[sysId];
+        const state = deviceStates[sysId];
+
+        let className = 'grid-cell system-status';
+        if (state) className += ` state-${state.toLowerCase()}`;
+        if (status === 'ONLINE' || status === 'RUNNING') className += ' status-online';
+        else if (status === 'OFFLINE' || status === 'CLOSED') className += ' status-offline';
+        else if (status === 'ERROR') className += ' status-error';
+        else if (status === 'CONNECTING') className += ' status-connecting';
+
+        // Untouched when nothing changed, so the browser has nothing to re-lay out
+        const text = state ? `${status} · ${state}` : status;
+        if (el.textContent !== text) el.textContent = text;
+        if (el.className !== className) el.className = className;
+    }
 
-        el.textContent = status;
-        el.className = 'grid-cell system-status'; // reset
+    // Statuses and device states arrive as numbered, coalesced delta batches.
+    // A gap in the numbering (or a reconnect) re-syncs from the last batch applied.
+    let statusEpoch = null; // server run the batch numbers belong to
+    let statusSeq = 0;      // last batch applied
+    let syncing = false;
+    let newestSeen = null;  // newest batch that arrived while a sync was in flight
 
-        if (status === 'ONLINE' || status === 'RUNNING') el.classList.add('status-online');
-        else if (status === 'OFFLINE' || status === 'CLOSED') el.classList.add('status-offline');
-        else if (status === 'ERROR') el.classList.add('status-error');
-        else if (status === 'CONNECTING') el.classList.add('status-connecting');
+    function requestSync() {
+        if (syncing) return;
+        syncing = true;
+        socket.emit('resync', { epoch: statusEpoch, seq: statusSeq });
     }
 
-    socket.on('status_update', (data) => {
-        updateSystemStatus(data.system_id, data.status);
+    function applyStatus(update) {
+        for (const [sysId, state] of Object.entries(update.state)) {
+            deviceStates[sysId] = state;
+        }
+        const changed = new Set([...Object.keys(update.status), ...Object.keys(update.state)]);
+        changed.forEach(sysId => {
+            updateSystemStatus(sysId, update.status[sysId] || systemStatuses[sysId] || 'ONLINE');
+        });
+        statusEpoch = update.epoch;
+        statusSeq = update.seq;
+    }
+
+    socket.on('status_batch', (batch) => {
+        if (syncing) {
+            newestSeen = batch;
+            return;
+        }
+        if (batch.epoch === statusEpoch && batch.seq <= statusSeq) return; // Already covered
+        if (batch.epoch === statusEpoch && batch.seq === statusSeq + 1) applyStatus(batch);
+        else requestSync();
+    });
+
+    socket.on('status_sync', (update) => {
+        syncing = false;
+        applyStatus(update);
+        if (newestSeen && newestSeen.epoch === update.epoch && newestSeen.seq > update.seq) {
+            requestSync();
+        }
+        newestSeen = null;
     });
 
-    socket.on('full_status_update', (statuses) => {
-        for (const [sysId, status] of Object.entries(statuses)) {
+    // Config reloads on the server replace the grid; statuses are then re-requested
+    socket.on('grid_update', (data) => {
+        document.querySelector('main').innerHTML = data.html;
+        indexGrid();
+        if (data.title) {
+            document.title = data.title;
+            document.querySelector('header h1').textContent = data.title;
+        }
+        // Repaint the fresh cells from what we already know
+        for (const [sysId, status] of Object.entries(systemStatuses)) {
             updateSystemStatus(sysId, status);
         }
     });
 
     // Command Execution
+    // Every press carries an idempotency key; only a double tap reuses one (press_keys.js)
+    const { keyFor } = createPressKeys(Number(document.body.dataset.doubleTapMs) || 400);
+
+    // Sends one batch for a group (or 'all') so every system fires in the same worker pass
+    function executeBatch(actionId, group, cells) {
+        if (cells.length === 0) return;
+        cells.forEach(cell => {
+            cell.classList.add('loading');
+            cell.classList.remove('success', 'error');
+        });
+
+        socket.emit('execute_batch', {
+            action_id: actionId,
+            group: group,
+            idempotency_key: keyFor(`batch:${group}:${actionId}`)
+        });
+    }
+
     document.body.addEventListener('click', (e) => {
         // Use event delegation
         if (!e.target.matches('button')) return;
@@ -63,9 +189,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const cell = btn.closest('.global-action');
             const actionId = cell.dataset.action;
 
-            // Find all action cells for this action
-            const targets = document.querySelectorAll(`.action-cell[data-action="${actionId}"] button`);
-            targets.forEach(t => t.click());
+            // All action cells for this action
+            executeBatch(actionId, 'all', actionTargets.get(`all:${actionId}`) || []);
             return;
         }
 
@@ -74,9 +199,8 @@ document.addEventListener('DOMContentLoaded', () => {
             const group = btn.dataset.group;
             const actionId = btn.dataset.action;
 
-            // Find all action cells for this group AND action
-            const targets = document.querySelectorAll(`.action-cell[data-group="${group}"][data-action="${actionId}"] button`);
-            targets.forEach(t => t.click());
+            // All action cells for this group AND action
+            executeBatch(actionId, group, actionTargets.get(`${group}:${actionId}`) || []);
             return;
         }
 
@@ -92,13 +216,19 @@ document.addEventListener('DOMContentLoaded', () => {
 
             socket.emit('execute_command', {
                 system_id: systemId,
-                action_id: actionId
+                action_id: actionId,
+                idempotency_key: keyFor(`system:${systemId}:${actionId}`)
             });
         }
     });
 
     // Handle Results
-    socket.on('command_result', (data) => {
+    function showResult(data) {
+        pendingResults.push(data);
+        scheduleRender();
+    }
+
+    function paintResult(data) {
         /*
         data = {
             system_id: 'camera1',
@@ -107,8 +237,7 @@ document.addEventListener('DOMContentLoaded', () => {
             message: '...'
         }
         */
-        const selector = `.action-cell[data-system="${data.system_id}"][data-action="${data.action_id}"]`;
-        const cell = document.querySelector(selector);
+        const cell = actionCells.get(`${data.system_id}:${data.action_id}`);
 
         if (cell) {
             cell.classList.remove('loading');
@@ -122,5 +251,19 @@ document.addEventListener('DOMContentLoaded', () => {
                 // Maybe show a toast or tooltip with the error message
             }
         }
+    }
+
+    socket.on('command_result', (data) => {
+        showResult(data);
+    });
+
+    socket.on('batch_result', (data) => {
+        data.results.forEach(showResult);
+
+        let summary = `Batch: skew ${data.skew_ms.toFixed(1)} ms`;
+        if (data.max_deviation_ms !== null && data.max_deviation_ms !== undefined) {
+            summary += `, max deviation ${data.max_deviation_ms.toFixed(1)} ms`;
+        }
+        console.log(summary);
     });
 });
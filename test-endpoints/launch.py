@@ -7,14 +7,19 @@ import yaml
 import platform
 import webbrowser
 from typing import Dict, List, Optional
+from virtual_device import VirtualDevice, wait_ready
 
 # Constants
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+READY_TIMEOUT = 15.0 # seconds to wait for an endpoint to answer after starting it
+FLEET_BASE_PORT = 9000
 
 class EndpointManager:
     def __init__(self):
         self.endpoints: Dict[str, Dict] = {}
         self.processes: Dict[str, subprocess.Popen] = {}
+        # Virtual devices served from this process, by port
+        self.fleet: Dict[int, VirtualDevice] = {}
         
     def discover_endpoints(self):
         """Finds all subdirectories with test-page.app.py and config.yaml"""
@@ -46,14 +51,18 @@ class EndpointManager:
             except Exception as e:
                 print(f"Error loading config for {dir_name}: {e}")
 
-    def start_endpoint(self, name: str):
+    def endpoint_url(self, name: str) -> str:
+        return f"http://localhost:{self.endpoints[name]['port']}"
+
+    def start_endpoint(self, name: str, wait: bool = True) -> bool:
+        """Starts an endpoint's process and, unless wait is False, waits until it answers HTTP."""
         if name not in self.endpoints:
             print(f"Endpoint '{name}' not found.")
-            return
+            return False
         
         if name in self.processes and self.processes[name].poll() is None:
             print(f"Endpoint '{name}' is already running.")
-            return
+            return False
 
         endpoint = self.endpoints[name]
         print(f"Starting {name} on port {endpoint['port']}...")
@@ -74,6 +83,29 @@ class EndpointManager:
             print(f"Started {name} (PID: {proc.pid})")
         except Exception as e:
             print(f"Failed to start {name}: {e}")
+            return False
+
+        if wait:
+            return self.wait_until_ready([name])
+        return True
+
+    def start_many(self, names: List[str]):
+        """Starts several endpoints at once, then waits for all of their readiness probes together."""
+        started = [name for name in names if self.start_endpoint(name, wait=False)]
+        self.wait_until_ready(started)
+
+    def wait_until_ready(self, names: List[str]) -> bool:
+        """Probes each endpoint over HTTP until it answers, instead of sleeping a fixed time."""
+        if not names:
+            return True
+        started = time.time()
+        urls = {self.endpoint_url(name): name for name in names}
+        not_ready = wait_ready(list(urls), timeout=READY_TIMEOUT, path='/')
+        for url in not_ready:
+            print(f"{urls[url]} did not become ready within {READY_TIMEOUT:.0f}s")
+        ready = len(names) - len(not_ready)
+        print(f"{ready}/{len(names)} endpoints ready in {time.time() - started:.1f}s")
+        return not not_ready
 
     def stop_endpoint(self, name: str):
         if name in self.processes:
@@ -105,9 +137,68 @@ class EndpointManager:
 
     def restart_endpoint(self, name: str):
         self.stop_endpoint(name)
-        time.sleep(1)
         self.start_endpoint(name)
 
+    def start_fleet(self, count: int, base_port: int = FLEET_BASE_PORT):
+        """
+        Serves `count` virtual cameras from this process on sequential ports, so large
+        configurations can be tested without a process (and reloader) per device.
+        """
+        started = []
+        for port in range(base_port, base_port + count):
+            if port in self.fleet:
+                continue
+            device = VirtualDevice(port)
+            try:
+                device.start()
+            except OSError as e:
+                print(f"Could not start virtual camera on port {port}: {e}")
+                continue
+            self.fleet[port] = device
+            started.append(device)
+
+        not_ready = wait_ready([device.url for device in started], timeout=READY_TIMEOUT)
+        print(f"Fleet: {len(started) - len(not_ready)} virtual cameras ready on ports {base_port}-{base_port + count - 1} ({len(self.fleet)} total)")
+
+    def stop_fleet(self):
+        for device in self.fleet.values():
+            device.stop()
+        print(f"Stopped {len(self.fleet)} virtual cameras")
+        self.fleet.clear()
+
+    def inject(self, latency_ms: float, failure_rate: float, target: Optional[str] = None, jitter_ms: float = 0):
+        """Sets injected latency and failure rate on one virtual camera (by port) or all of them."""
+        if target in (None, 'all'):
+            devices = list(self.fleet.values())
+        elif target.isdigit() and int(target) in self.fleet:
+            devices = [self.fleet[int(target)]]
+        else:
+            print(f"No virtual camera on port {target}.")
+            return
+        for device in devices:
+            device.inject(latency_ms=latency_ms, jitter_ms=jitter_ms, failure_rate=failure_rate)
+        print(f"Injected {latency_ms:.0f} ms (+{jitter_ms:.0f} ms jitter) latency, {failure_rate:.0%} failures on {len(devices)} virtual cameras")
+
+    def write_fleet_config(self, path: str):
+        """Writes the config.yaml systems and actions for the running fleet."""
+        config = {
+            'systems': {
+                'fleet': {
+                    'name': 'Virtual Fleet',
+                    'systems': {
+                        f'vcam{port}': {'type': 'venice2', 'name': device.name, 'url': device.url}
+                        for port, device in sorted(self.fleet.items())
+                    }
+                }
+            },
+            'actions': {
+                'record_toggle': {'name': 'Record Toggle', 'mode': 'fanout', 'mappings': {'venice2': 'toggle_record'}}
+            }
+        }
+        with open(path, 'w') as f:
+            yaml.safe_dump(config, f, sort_keys=False)
+        print(f"Wrote config for {len(self.fleet)} virtual cameras to {path}")
+
     def launch_browser(self, name: str):
         if name not in self.endpoints:
              print(f"Endpoint '{name}' not found.")
@@ -146,7 +237,6 @@ class EndpointManager:
         print("\n--- Endpoint Status ---")
         if not self.endpoints:
             print("No endpoints discovered.")
-            return
 
         for name, data in self.endpoints.items():
             status = "STOPPED"
@@ -156,6 +246,10 @@ class EndpointManager:
                 else:
                     status = "EXITED"
             print(f"{name: <15} Port: {data['port']: <6} Status: {status}")
+        if self.fleet:
+            ports = sorted(self.fleet)
+            faulty = [d for d in self.fleet.values() if d.latency_ms or d.failure_rate]
+            print(f"{'fleet': <15} Ports: {ports[0]}-{ports[-1]} ({len(ports)} virtual cameras, {len(faulty)} with injected faults)")
         print("-----------------------")
 
 def print_help():
@@ -166,6 +260,11 @@ Commands:
   stop [all|name]     - Stop specific endpoint or all
   restart [all|name]  - Restart specific endpoint or all
   browser [all|name]  - Open endpoint(s) in browser
+  fleet N [base_port] - Serve N virtual cameras from this process (default base port 9000)
+  fleet stop          - Stop the virtual cameras
+  fleet config [path] - Write config.yaml systems for the virtual cameras
+  inject MS RATE [all|port] [JITTER_MS]
+                      - Add MS latency and drop RATE (0-1) of requests on virtual cameras
   reload              - Rediscover endpoints from disk
   help                - Show this help message
   quit, exit          - Stop all and exit
@@ -194,6 +293,7 @@ def main():
             print("Stopping all processes...")
             for name in list(manager.processes.keys()):
                 manager.stop_endpoint(name)
+            manager.stop_fleet()
             break
             
         elif cmd in ["status", "list"]:
@@ -208,8 +308,7 @@ def main():
             
         elif cmd == "start":
             if arg == "all" or arg is None:
-                for name in manager.endpoints:
-                    manager.start_endpoint(name)
+                manager.start_many(list(manager.endpoints))
             else:
                 manager.start_endpoint(arg)
                 
@@ -232,6 +331,27 @@ def main():
             else:
                 manager.restart_endpoint(arg)
 
+        elif cmd == "fleet":
+            if arg == "stop":
+                manager.stop_fleet()
+            elif arg == "config":
+                manager.write_fleet_config(parts[2] if len(parts) > 2 else os.path.join(BASE_DIR, "fleet-config.yaml"))
+            elif arg and arg.isdigit():
+                base_port = int(parts[2]) if len(parts) > 2 else FLEET_BASE_PORT
+                manager.start_fleet(int(arg), base_port)
+            else:
+                print("Usage: fleet N [base_port] | fleet stop | fleet config [path]")
+
+        elif cmd == "inject":
+            try:
+                latency_ms = float(parts[1])
+                failure_rate = float(parts[2])
+                jitter_ms = float(parts[4]) if len(parts) > 4 else 0
+            except (IndexError, ValueError):
+                print("Usage: inject MS RATE [all|port] [JITTER_MS]")
+                continue
+            manager.inject(latency_ms, failure_rate, parts[3] if len(parts) > 3 else None, jitter_ms)
+
         elif cmd == "browser":
             if arg == "all" or arg is None:
                 for name in manager.endpoints:
@@ -0,0 +1,156 @@
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# A minimal stand-in for a camera web UI: one REC button with the same id and
+# 'recording' class as the VENICE 2 page, so the venice2 type in types.yaml
+# (actions and state probe) works against it unchanged.
+
+PAGE_HTML = """<!DOCTYPE html>
+<html>
+<head><title>%(name)s</title></head>
+<body>
+    <h1>%(name)s</h1>
+    <button id="BUTTON_REC_BUTTON" class="%(rec_class)s">REC</button>
+    <script>
+        const button = document.getElementById('BUTTON_REC_BUTTON');
+        button.addEventListener('click', () => {
+            button.classList.toggle('recording');
+            fetch('/api/record', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({recording: button.classList.contains('recording')})
+            });
+        });
+    </script>
+</body>
+</html>"""
+
+class DeviceHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass # Hundreds of devices would drown the console
+
+    def _send(self, status, body, content_type='text/html'):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _injected_failure(self):
+        """Applies the device's injected latency, then maybe drops the connection. True if dropped."""
+        device = self.server.device
+        delay_ms = device.latency_ms + random.uniform(0, device.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        if device.failure_rate and random.random() < device.failure_rate:
+            # No response at all, like a camera that dropped off the network mid-request
+            self.close_connection = True
+            return True
+        return False
+
+    def do_GET(self):
+        device = self.server.device
+        if self.path != '/health' and self._injected_failure():
+            return
+        if self.path == '/health':
+            self._send(200, 'ok', 'text/plain')
+        elif self.path == '/api/record':
+            self._send(200, json.dumps({'recording': device.recording}), 'application/json')
+        else:
+            self._send(200, PAGE_HTML % {'name': device.name, 'rec_class': 'recording' if device.recording else ''})
+
+    def do_POST(self):
+        device = self.server.device
+        if self._injected_failure():
+            return
+        if self.path != '/api/record':
+            self._send(404, 'not found', 'text/plain')
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            body = {}
+        if 'recording' in body:
+            device.recording = bool(body['recording'])
+        else:
+            device.recording = not device.recording # {"toggle": true} or no body
+        device.commands += 1
+        self._send(200, json.dumps({'recording': device.recording}), 'application/json')
+
+class VirtualDevice:
+    """One emulated camera served on its own port, from a thread of this process."""
+
+    def __init__(self, port, name=None, host='127.0.0.1'):
+        self.port = port
+        self.host = host
+        self.name = name or f"Virtual Camera {port}"
+        self.recording = False
+        self.commands = 0
+        # Fault injection, applied to every request except /health
+        self.latency_ms = 0
+        self.jitter_ms = 0
+        self.failure_rate = 0.0
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), DeviceHandler)
+        self.server.daemon_threads = True
+        self.server.device = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def inject(self, latency_ms=None, jitter_ms=None, failure_rate=None):
+        """Sets injected latency (ms, plus up to jitter_ms) and the fraction of requests to drop."""
+        if latency_ms is not None:
+            self.latency_ms = latency_ms
+        if jitter_ms is not None:
+            self.jitter_ms = jitter_ms
+        if failure_rate is not None:
+            self.failure_rate = failure_rate
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def start_fleet(base_port, count, host='127.0.0.1'):
+    """Starts `count` virtual devices on sequential ports from base_port."""
+    devices = []
+    for i in range(count):
+        device = VirtualDevice(base_port + i, host=host)
+        device.start()
+        devices.append(device)
+    return devices
+
+def wait_ready(urls, timeout=10.0, path='/health'):
+    """
+    Polls each url (at path) until it answers, as a readiness probe. Any HTTP reply
+    counts, since an app asking for auth is up. Returns the urls still not ready.
+    """
+    pending = list(urls)
+    deadline = time.time() + timeout
+    while pending and time.time() < deadline:
+        for url in list(pending):
+            try:
+                with urllib.request.urlopen(f"{url}{path}", timeout=1):
+                    pending.remove(url)
+            except urllib.error.HTTPError:
+                pending.remove(url)
+            except OSError:
+                pass
+        if pending:
+            time.sleep(0.1)
+    return pending
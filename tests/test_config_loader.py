@@ -0,0 +1,113 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config_loader import compile_config, diff_configs, replace_config
+
+def make_config(actions=None, type_actions=None):
+    """A resolved config with one venice2 camera, as load_config builds it."""
+    type_actions = type_actions or {
+        'toggle_record': {'js_injection': "document.getElementById('rec').click()"},
+        'stop_record': {'js_injection': "document.getElementById('rec').click()", 'target_state': 'STANDBY'},
+        'status': {'http': {'method': 'GET', 'path': '/status'}},
+    }
+    return {
+        'types': {'venice2': {'actions': type_actions}},
+        'resolved_systems': {
+            'cameras': {'name': 'Cameras', 'systems': {
+                'camera1': {'type': 'venice2', 'url': 'http://cam1', 'actions': type_actions},
+            }},
+        },
+        'actions': actions if actions is not None else {
+            'record_toggle': {'mappings': {'venice2': 'toggle_record'}},
+            'record_stop': {'mappings': {'venice2': 'stop_record'}},
+            'poll': {'mappings': {'venice2': 'status'}},
+        },
+    }
+
+def loaded(systems, **settings):
+    """A loaded config with these systems (sys_id -> overrides of camera1's data) and top-level settings."""
+    config = make_config()
+    camera = config['resolved_systems']['cameras']['systems']['camera1']
+    config['resolved_systems']['cameras']['systems'] = {
+        sys_id: {**camera, **overrides} for sys_id, overrides in systems.items()
+    }
+    config.update(settings)
+    config['compiled'] = compile_config(config)
+    return config
+
+class CompileConfigTest(unittest.TestCase):
+    def test_dispatch_carries_the_resolved_driver(self):
+        compiled = compile_config(make_config())
+        toggle = compiled.dispatch[('camera1', 'record_toggle')]
+        self.assertEqual(toggle.target_action, 'toggle_record')
+        self.assertEqual(toggle.js_code, 'window.__mbtRun("toggle_record")')
+        self.assertIsNone(toggle.http)
+        self.assertEqual(compiled.dispatch[('camera1', 'record_stop')].target_state, 'STANDBY')
+        self.assertEqual(compiled.dispatch[('camera1', 'poll')].http['path'], '/status')
+
+    def test_every_type_action_is_reachable_by_name(self):
+        compiled = compile_config(make_config(actions={}))
+        self.assertEqual(set(compiled.actions), {('camera1', 'toggle_record'), ('camera1', 'stop_record'), ('camera1', 'status')})
+        self.assertIsNone(compiled.actions[('camera1', 'toggle_record')].action_id)
+
+    def test_tables_are_read_only(self):
+        compiled = compile_config(make_config())
+        with self.assertRaises(TypeError):
+            compiled.dispatch[('camera1', 'other')] = None
+        with self.assertRaises(TypeError):
+            compiled.systems['camera2'] = {}
+        with self.assertRaises(TypeError):
+            compiled.dispatch[('camera1', 'poll')].http['path'] = '/other'
+        self.assertEqual(compiled.groups['cameras'], ('camera1',))
+
+    def test_mapping_to_an_undefined_action_warns(self):
+        compiled = compile_config(make_config(actions={'missing': {'mappings': {'venice2': 'nope'}}}))
+        self.assertNotIn(('camera1', 'missing'), compiled.dispatch)
+        self.assertTrue(any("'nope'" in warning for warning in compiled.warnings))
+
+    def test_http_action_without_path_or_with_a_bad_method_is_rejected(self):
+        compiled = compile_config(make_config(
+            actions={'poll': {'mappings': {'venice2': 'status'}}, 'wipe': {'mappings': {'venice2': 'wipe'}}},
+            type_actions={'status': {'http': {'method': 'GET'}}, 'wipe': {'http': {'method': 'NUKE', 'path': '/'}}}
+        ))
+        self.assertIsNone(compiled.actions[('camera1', 'status')].http)
+        self.assertNotIn(('camera1', 'poll'), compiled.dispatch)
+        self.assertNotIn(('camera1', 'wipe'), compiled.dispatch)
+        self.assertTrue(any("'status'" in w and 'no path' in w for w in compiled.warnings))
+        self.assertTrue(any("'wipe'" in w and 'NUKE' in w for w in compiled.warnings))
+
+class DiffConfigsTest(unittest.TestCase):
+    def test_changes_are_sorted_by_what_the_page_needs(self):
+        old = loaded({
+            'camera1': {}, 'camera2': {}, 'camera3': {}, 'camera4': {}, 'camera5': {},
+        }, port=5000)
+        new = loaded({
+            'camera1': {},
+            'camera2': {'name': 'A camera'},
+            'camera3': {'path': '/live'},
+            'camera4': {'browser_auth': {'username': 'admin', 'password': 'new'}},
+            'camera6': {},
+        }, port=5001)
+        changes = diff_configs(old, new)
+        self.assertEqual(list(changes['added']), ['camera6'])
+        self.assertEqual(changes['removed'], ['camera5'])
+        self.assertEqual(list(changes['navigate']), ['camera3'])
+        self.assertEqual(list(changes['reinit']), ['camera4'])
+        self.assertEqual(changes['restart_keys'], ['port'])
+
+    def test_unchanged_config_has_no_changes(self):
+        changes = diff_configs(loaded({'camera1': {}}), loaded({'camera1': {}}))
+        self.assertEqual(changes, {'added': {}, 'removed': [], 'navigate': {}, 'reinit': {}, 'restart_keys': []})
+
+    def test_replace_takes_the_new_keys_and_drops_stale_ones(self):
+        config = loaded({'camera1': {}}, stale=True)
+        new = loaded({'camera2': {}})
+        replace_config(config, new)
+        self.assertIs(config['compiled'], new['compiled'])
+        self.assertEqual(config, new)
+        self.assertNotIn('stale', config)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from injections import invoke_js, registry_script
+
+# Runs a registry against a stand-in page and prints each action's result or error
+PAGE_SCRIPT = """
+const button = { id: 'rec', isConnected: true, matches: () => true };
+let lookups = 0;
+global.window = global;
+global.window.top = global;
+global.document = {
+    title: 'VENICE',
+    getElementById(id) { lookups++; return id === 'rec' ? button : null; },
+    querySelector(sel) { lookups++; return button; },
+};
+%s;
+const results = {};
+for (const [name, call] of Object.entries(%s)) {
+    try { results[name] = eval(call); } catch (e) { results[name] = 'error: ' + e.message; }
+}
+results.lookups = lookups;
+console.log(JSON.stringify(results));
+"""
+
+@unittest.skipUnless(shutil.which('node'), 'needs node')
+class RegistryTest(unittest.TestCase):
+    def results(self, injections):
+        actions = {name: {'js_injection': code} for name, code in injections.items()}
+        calls = {name: invoke_js(name) for name in injections}
+        script = PAGE_SCRIPT % (registry_script(actions), json.dumps(calls))
+        output = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout
+        return json.loads(output)
+
+    def test_statements_expressions_and_functions(self):
+        results = self.results({
+            'body': "const el = document.getElementById('rec'); return el.id;",
+            'expression': 'document.title',
+            'function': '() => document.title + "!"',
+        })
+        self.assertEqual(results['body'], 'rec')
+        self.assertEqual(results['expression'], 'VENICE')
+        self.assertEqual(results['function'], 'VENICE!')
+
+    def test_bad_action_fails_alone(self):
+        results = self.results({'broken': 'return (;', 'fine': 'return 1;'})
+        self.assertTrue(results['broken'].startswith('error: Action broken does not compile'))
+        self.assertEqual(results['fine'], 1)
+
+    def test_lookups_are_cached(self):
+        results = self.results({'press': "document.getElementById('rec'); return document.getElementById('rec').id;"})
+        self.assertEqual(results['press'], 'rec')
+        self.assertEqual(results['lookups'], 1)
+
+    def test_other_document_use_gets_the_real_document(self):
+        results = self.results({'title': "document.getElementById('rec'); return document.getElementById('rec') && document === window.document;"})
+        self.assertIs(results['title'], True)
+        self.assertEqual(results['lookups'], 2)
+
+if __name__ == '__main__':
+    unittest.main()
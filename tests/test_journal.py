@@ -0,0 +1,72 @@
+import glob
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import journal
+from journal import CommandJournal
+
+def entry(n, system='camera1', action='start_record'):
+    return {'at': 1000.0 + n, 'system': system, 'action': action, 'n': n}
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.directory = self.tmp.name
+
+    def write(self, entries, **options):
+        """Journals the entries and closes, so everything is on disk."""
+        command_journal = CommandJournal(self.directory, **options)
+        command_journal.start()
+        for e in entries:
+            command_journal.record(e)
+        command_journal.close()
+        return command_journal
+
+    def segment_files(self):
+        return glob.glob(os.path.join(self.directory, 'commands-*.jsonl'))
+
+    def test_query_filters(self):
+        command_journal = self.write([
+            entry(0), entry(1, system='camera2'), entry(2, action='stop_record'), entry(3),
+        ])
+        self.assertEqual([e['n'] for e in command_journal.query()], [0, 1, 2, 3])
+        self.assertEqual([e['n'] for e in command_journal.query(sys_id='camera2')], [1])
+        self.assertEqual([e['n'] for e in command_journal.query(action='stop_record')], [2])
+        self.assertEqual([e['n'] for e in command_journal.query(since=1001, until=1002)], [1, 2])
+        # Over the limit, the most recent ones
+        self.assertEqual([e['n'] for e in command_journal.query(limit=2)], [2, 3])
+
+    def test_query_across_blocks(self):
+        original = journal.BLOCK_SIZE
+        journal.BLOCK_SIZE = 4
+        self.addCleanup(setattr, journal, 'BLOCK_SIZE', original)
+        command_journal = self.write([entry(n, system=f'camera{n % 3}') for n in range(20)])
+        self.assertGreater(len(command_journal.segments[0].blocks), 1)
+        self.assertEqual([e['n'] for e in command_journal.query(sys_id='camera1')], [1, 4, 7, 10, 13, 16, 19])
+        self.assertEqual([e['n'] for e in command_journal.query(since=1009, until=1011)], [9, 10, 11])
+
+    def test_rotation_drops_oldest_segments(self):
+        line_bytes = len(b'{"at":1000.0,"system":"camera1","action":"start_record","n":0}\n')
+        command_journal = self.write([entry(n) for n in range(10)], max_bytes=line_bytes * 2, max_segments=3)
+        self.assertEqual(len(self.segment_files()), 3)
+        self.assertEqual(command_journal.stats()['written'], 10)
+        # Only what the kept segments hold is still there
+        self.assertEqual([e['n'] for e in command_journal.query()], [4, 5, 6, 7, 8, 9])
+
+    def test_earlier_runs_are_indexed_on_start(self):
+        self.write([entry(0), entry(1, system='camera2')])
+        # A line cut short by a crash
+        with open(self.segment_files()[0], 'ab') as f:
+            f.write(b'{"at":1002.0,"sys')
+        command_journal = CommandJournal(self.directory)
+        command_journal.start()
+        self.addCleanup(command_journal.close)
+        self.assertEqual([e['n'] for e in command_journal.query()], [0, 1])
+        self.assertEqual([e['n'] for e in command_journal.query(sys_id='camera2')], [1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outbox import StatusOutbox
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.arrived = threading.Event()
+        self.outbox = StatusOutbox(self.emit, window=0.01, history=3)
+
+    def emit(self, batch):
+        self.sent.append(batch)
+        self.arrived.set()
+
+    def send(self, kind, sys_id, value):
+        """Puts one change and waits for the batch carrying it."""
+        self.arrived.clear()
+        self.outbox.put(kind, sys_id, value)
+        self.assertTrue(self.arrived.wait(2))
+        return self.sent[-1]
+
+    def test_burst_is_coalesced_into_one_batch(self):
+        self.arrived.clear()
+        self.outbox.put('status', 'camera1', 'OFFLINE')
+        self.outbox.put('status', 'camera1', 'ONLINE')
+        self.outbox.put('state', 'camera2', 'RECORDING')
+        self.assertTrue(self.arrived.wait(2))
+        batch = self.sent[0]
+        self.assertEqual(batch['seq'], 1)
+        self.assertEqual(batch['status'], {'camera1': 'ONLINE'})
+        self.assertEqual(batch['state'], {'camera2': 'RECORDING'})
+
+    def test_resync_merges_batches_after_seq(self):
+        first = self.send('status', 'camera1', 'ONLINE')
+        self.send('status', 'camera2', 'ONLINE')
+        self.send('status', 'camera1', 'ERROR')
+        reply = self.outbox.sync(first['epoch'], first['seq'])
+        self.assertFalse(reply['full'])
+        self.assertEqual(reply['seq'], 3)
+        self.assertEqual(reply['status'], {'camera2': 'ONLINE', 'camera1': 'ERROR'})
+
+    def test_up_to_date_client_gets_nothing(self):
+        batch = self.send('status', 'camera1', 'ONLINE')
+        reply = self.outbox.sync(batch['epoch'], batch['seq'])
+        self.assertFalse(reply['full'])
+        self.assertEqual(reply['status'], {})
+
+    def test_full_resync(self):
+        batch = self.send('status', 'camera1', 'ONLINE')
+        for sys_id in ('camera2', 'camera3', 'camera4', 'camera5'):
+            self.send('status', sys_id, 'ONLINE')
+        everything = {f'camera{n}': 'ONLINE' for n in range(1, 6)}
+        cases = {
+            'other run': ('old-epoch', batch['seq']),
+            'older than history': (batch['epoch'], batch['seq']),
+            'ahead of server': (batch['epoch'], 99),
+            'no seq': (batch['epoch'], None),
+            'bad seq': (batch['epoch'], '3'),
+        }
+        for case, (epoch, since) in cases.items():
+            with self.subTest(case):
+                reply = self.outbox.sync(epoch, since)
+                self.assertTrue(reply['full'])
+                self.assertEqual(reply['status'], everything)
+
+if __name__ == '__main__':
+    unittest.main()
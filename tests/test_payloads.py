@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from payloads import check_batch, check_command
+
+class CheckCommandTest(unittest.TestCase):
+    def test_well_formed(self):
+        self.assertIsNone(check_command({'system_id': 'camera1', 'action_id': 'record_toggle'}))
+        self.assertIsNone(check_command({'system_id': 'camera1', 'action_id': 'record_toggle', 'idempotency_key': 'k'}))
+
+    def test_not_an_object(self):
+        self.assertEqual(check_command(['camera1']), 'Request must be a JSON object')
+        self.assertEqual(check_command(None), 'Request must be a JSON object')
+
+    def test_ids_must_be_strings(self):
+        self.assertIn('system_id', check_command({'system_id': ['camera1'], 'action_id': 'record_toggle'}))
+        self.assertIn('action_id', check_command({'system_id': 'camera1', 'action_id': {'a': 1}}))
+        self.assertIn('action_id', check_command({'system_id': 'camera1'}))
+        self.assertIn('idempotency_key', check_command({'system_id': 'camera1', 'action_id': 'a', 'idempotency_key': 5}))
+
+class CheckBatchTest(unittest.TestCase):
+    def test_well_formed(self):
+        self.assertIsNone(check_batch({'action_id': 'record_toggle'}))
+        self.assertIsNone(check_batch({'action_id': 'record_toggle', 'group': 'cameras'}))
+        self.assertIsNone(check_batch({'commands': [{'system_id': 'camera1', 'action_id': 'record_toggle'}]}))
+
+    def test_json_list_body(self):
+        self.assertEqual(check_batch([{'system_id': 'camera1'}]), 'Request must be a JSON object')
+
+    def test_commands_must_be_a_list_of_objects(self):
+        self.assertIn('commands', check_batch({'commands': 'camera1'}))
+        self.assertIn('commands', check_batch({'commands': {'system_id': 'camera1'}}))
+        self.assertIn('commands', check_batch({'commands': ['camera1']}))
+
+    def test_unhashable_ids(self):
+        self.assertIn('system_id', check_batch({'commands': [{'system_id': ['camera1'], 'action_id': 'a'}]}))
+        self.assertIn('action_id', check_batch({'action_id': ['record_toggle']}))
+        self.assertIn('group', check_batch({'action_id': 'record_toggle', 'group': {'cameras': 1}}))
+
+if __name__ == '__main__':
+    unittest.main()
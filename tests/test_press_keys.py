@@ -0,0 +1,61 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from idempotency import DedupWindow
+
+# Presses at these times (ms) on one button, with a 400 ms double tap window
+PRESS_SCRIPT = """
+const { createPressKeys } = require(%r);
+let clock = 0;
+const keys = createPressKeys(400, () => clock);
+const pressed = [];
+for (const at of %s) {
+    clock = at;
+    pressed.push(keys.keyFor('batch:all:record_toggle'));
+}
+pressed.push(keys.keyFor('batch:cameras:record_toggle'));
+console.log(JSON.stringify(pressed));
+"""
+
+@unittest.skipUnless(shutil.which('node'), 'needs node')
+class PressKeysTest(unittest.TestCase):
+    def keys_for(self, times):
+        script = PRESS_SCRIPT % (os.path.join(ROOT, 'static', 'press_keys.js'), json.dumps(times))
+        output = subprocess.run(['node', '-e', script], capture_output=True, text=True, check=True).stdout
+        return json.loads(output)
+
+    def test_double_tap_reuses_the_key(self):
+        first, second, other_button = self.keys_for([1000, 1250])
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other_button)
+
+    def test_deliberate_second_press_gets_a_new_key(self):
+        # e.g. stopping a take started by mistake, well inside the server's dedup window
+        first, second, _ = self.keys_for([1000, 3000])
+        self.assertNotEqual(first, second)
+
+class DedupWindowTest(unittest.TestCase):
+    def test_retry_of_a_key_is_deduplicated_new_key_is_not(self):
+        window = DedupWindow(5.0)
+        first, fresh = window.claim('press-1')
+        self.assertTrue(fresh)
+        entry, fresh = window.claim('press-1')
+        self.assertIs(entry, first)
+        self.assertFalse(fresh)
+        self.assertTrue(window.claim('press-2')[1])
+
+    def test_key_expires_after_the_window(self):
+        window = DedupWindow(0.01)
+        window.claim('press-1')
+        time.sleep(0.02)
+        self.assertTrue(window.claim('press-1')[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import probes
+
+SELECTOR_PROBE = {
+    'selector': '#BUTTON_REC_BUTTON', 'attribute': 'class',
+    'states': {'RECORDING': 'recording'}, 'default': 'STANDBY'
+}
+
+class ConfirmsTest(unittest.TestCase):
+    def test_matched_state_is_confirmed(self):
+        self.assertTrue(probes.confirms(SELECTOR_PROBE, 'RECORDING'))
+
+    def test_default_and_unknown_are_not(self):
+        self.assertFalse(probes.confirms(SELECTOR_PROBE, 'STANDBY'))
+        self.assertFalse(probes.confirms(SELECTOR_PROBE, 'UNKNOWN'))
+        self.assertFalse(probes.confirms(SELECTOR_PROBE, None))
+
+    def test_without_a_probe_nothing_is(self):
+        self.assertFalse(probes.confirms(None, 'RECORDING'))
+
+    def test_expression_probe_states_are_confirmed_unless_unknown(self):
+        probe = {'expression': "document.body.classList.contains('rec') ? 'RECORDING' : 'STANDBY'"}
+        self.assertTrue(probes.confirms(probe, 'STANDBY'))
+        self.assertFalse(probes.confirms(probe, 'UNKNOWN'))
+
+if __name__ == '__main__':
+    unittest.main()
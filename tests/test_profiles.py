@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from profiles import needs_routing, should_block
+
+def system(**profile):
+    return {'profile': profile}
+
+class ShouldBlockTest(unittest.TestCase):
+    def test_block_resources(self):
+        sys_data = system(block_resources=['image', 'font'])
+        self.assertTrue(should_block(sys_data, 'image', 'http://cam/logo.png'))
+        self.assertFalse(should_block(sys_data, 'script', 'http://cam/app.js'))
+
+    def test_allow_resources_blocks_everything_else(self):
+        sys_data = system(allow_resources=['script', 'xhr'])
+        self.assertTrue(needs_routing(sys_data))
+        self.assertFalse(should_block(sys_data, 'script', 'http://cam/app.js'))
+        self.assertFalse(should_block(sys_data, 'xhr', 'http://cam/api/status'))
+        self.assertTrue(should_block(sys_data, 'stylesheet', 'http://cam/app.css'))
+        self.assertTrue(should_block(sys_data, 'other', 'http://cam/beacon'))
+
+    def test_documents_and_allowed_urls_always_load(self):
+        sys_data = system(allow_resources=['script'], allow_urls=['*/img/rec_*.png'])
+        self.assertFalse(should_block(sys_data, 'document', 'http://cam/'))
+        self.assertFalse(should_block(sys_data, 'image', 'http://cam/img/rec_on.png'))
+        self.assertTrue(should_block(sys_data, 'image', 'http://cam/img/logo.png'))
+
+    def test_no_profile_routes_nothing(self):
+        self.assertFalse(needs_routing({}))
+        self.assertFalse(should_block({}, 'image', 'http://cam/logo.png'))
+
+if __name__ == '__main__':
+    unittest.main()
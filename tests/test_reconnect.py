@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from reconnect import CLOSED, HALF_OPEN, OPEN, ReconnectTracker, backoff_delay
+
+class BackoffTest(unittest.TestCase):
+    def test_grows_with_jitter_and_caps(self):
+        for attempts, full in [(0, 1.0), (1, 2.0), (3, 8.0), (10, 30.0)]:
+            for _ in range(50):
+                delay = backoff_delay(attempts, 1.0, 30.0)
+                self.assertGreaterEqual(delay, full / 2)
+                self.assertLessEqual(delay, full)
+
+class ReconnectTrackerTest(unittest.TestCase):
+    def fail_attempt(self, tracker, sys_id='camera1'):
+        """Runs the system's next attempt as if it failed, whenever it is scheduled."""
+        self.assertEqual(tracker.due(now=time.time() + 10_000), [sys_id])
+        tracker.attempt(sys_id)
+        tracker.observe(sys_id, 'ERROR')
+
+    def test_failure_schedules_a_retry(self):
+        tracker = ReconnectTracker(base_s=1.0)
+        tracker.observe('camera1', 'ERROR')
+        self.assertEqual(tracker.due(), [])
+        self.assertEqual(tracker.due(now=time.time() + 2), ['camera1'])
+        tracker.attempt('camera1')
+        # Not due again while the attempt runs
+        self.assertEqual(tracker.due(now=time.time() + 10_000), [])
+        self.assertIsNone(tracker.info('camera1')['next_retry_at'])
+
+    def test_same_outage_is_scheduled_once(self):
+        tracker = ReconnectTracker()
+        tracker.observe('camera1', 'ERROR')
+        scheduled = tracker.info('camera1')
+        tracker.observe('camera1', 'CLOSED')
+        self.assertEqual(tracker.info('camera1'), scheduled)
+
+    def test_online_clears(self):
+        tracker = ReconnectTracker()
+        tracker.observe('camera1', 'ERROR')
+        self.fail_attempt(tracker)
+        tracker.observe('camera1', 'ONLINE')
+        self.assertIsNone(tracker.info('camera1'))
+        self.assertEqual(tracker.due(now=time.time() + 10_000), [])
+
+    def test_other_statuses_are_ignored(self):
+        tracker = ReconnectTracker()
+        tracker.observe('camera1', 'STOPPED')
+        self.assertIsNone(tracker.info('camera1'))
+
+    def test_circuit_opens_then_half_opens(self):
+        tracker = ReconnectTracker(base_s=0.1, max_s=1.0, circuit_after=3, circuit_open_s=300.0)
+        tracker.observe('camera1', 'ERROR')
+        for _ in range(2):
+            self.fail_attempt(tracker)
+            self.assertEqual(tracker.info('camera1')['circuit'], CLOSED)
+        self.fail_attempt(tracker)
+        info = tracker.info('camera1')
+        self.assertEqual(info['circuit'], OPEN)
+        self.assertGreaterEqual(info['next_retry_at'], time.time() + 290)
+
+        tracker.attempt('camera1')
+        self.assertEqual(tracker.info('camera1')['circuit'], HALF_OPEN)
+        # The single half-open attempt failing opens the circuit again
+        tracker.observe('camera1', 'ERROR')
+        self.assertEqual(tracker.info('camera1')['circuit'], OPEN)
+
+        tracker.attempt('camera1')
+        tracker.observe('camera1', 'ONLINE')
+        self.assertIsNone(tracker.info('camera1'))
+
+    def test_disabled_tracks_nothing(self):
+        tracker = ReconnectTracker(enabled=False)
+        tracker.observe('camera1', 'ERROR')
+        self.assertEqual(tracker.due(now=time.time() + 10_000), [])
+
+if __name__ == '__main__':
+    unittest.main()
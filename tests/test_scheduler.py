@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import threading
+from scheduler import CommandScheduler, FireTime
+
+def take(scheduler):
+    return scheduler.get_nowait()
+
+class HoldReleaseTest(unittest.TestCase):
+    def test_held_command_is_released_once_loaded(self):
+        scheduler = CommandScheduler()
+        loading = {'cam1'}
+        scheduler.put('execute', 'first', timeout=10)
+        scheduler.put('execute', 'second', timeout=10)
+        scheduler.hold('cam1', take(scheduler))
+        scheduler.hold('cam1', take(scheduler))
+
+        self.assertEqual(scheduler.release(lambda sys_id: sys_id in loading), [])
+        self.assertTrue(scheduler.is_holding('cam1'))
+
+        loading.clear()
+        released = scheduler.release(lambda sys_id: sys_id in loading)
+        self.assertEqual([item[3] for item in released], ['first', 'second'])
+        self.assertFalse(scheduler.is_holding('cam1'))
+        self.assertEqual(scheduler.stats.to_json()['trigger']['held'], 0)
+
+    def test_other_systems_are_not_blocked(self):
+        scheduler = CommandScheduler()
+        scheduler.put('execute', 'cam1 task', timeout=10)
+        scheduler.put('execute', 'cam2 task', timeout=10)
+        scheduler.hold('cam1', take(scheduler))
+        scheduler.hold('cam2', take(scheduler))
+
+        released = scheduler.release(lambda sys_id: sys_id == 'cam1')
+        self.assertEqual([item[3] for item in released], ['cam2 task'])
+        self.assertTrue(scheduler.is_holding('cam1'))
+
+    def test_expired_held_command_is_released_to_be_dropped(self):
+        scheduler = CommandScheduler()
+        scheduler.put('execute', 'late', timeout=0.01)
+        scheduler.hold('cam1', take(scheduler))
+        time.sleep(0.02)
+
+        released = scheduler.release(lambda sys_id: True)
+        self.assertEqual([item[3] for item in released], ['late'])
+        self.assertTrue(scheduler.expired(released[0]))
+        self.assertEqual(scheduler.stats.to_json()['trigger']['dropped'], 1)
+        self.assertFalse(scheduler.is_holding('cam1'))
+
+class FireTimeTest(unittest.TestCase):
+    def test_chosen_once_when_measured(self):
+        fire_time = FireTime()
+        self.assertIsNone(fire_time.wait(0))
+        before = time.time() * 1000
+        fire_at = fire_time.choose(500)
+        self.assertGreaterEqual(fire_at, before + 500)
+        self.assertEqual(fire_time.choose(1000), fire_at)
+        self.assertEqual(fire_time.wait(0), fire_at)
+
+    def test_given_instant_is_kept(self):
+        fire_time = FireTime(1234.0)
+        self.assertEqual(fire_time.choose(500), 1234.0)
+
+    def test_arbiter_picks_and_waiters_see_it(self):
+        seen = []
+        fire_time = FireTime(arbiter=lambda lead_ms: 42.0 + lead_ms)
+        waiter = threading.Thread(target=lambda: seen.append(fire_time.wait(5)))
+        waiter.start()
+        self.assertEqual(fire_time.choose(8), 50.0)
+        waiter.join()
+        self.assertEqual(seen, [50.0])
+
+    def test_silent_arbiter_falls_back_to_lead(self):
+        fire_time = FireTime(arbiter=lambda lead_ms: None)
+        self.assertGreater(fire_time.choose(500), time.time() * 1000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snapshot import StatusBoard
+
+class SnapshotTest(unittest.TestCase):
+    def test_etag_follows_version(self):
+        board = StatusBoard(['camera1'])
+        before = board.current
+        after = board.publish(lambda s: s.updated('camera1', 'ONLINE'))
+        self.assertNotEqual(before.etag, after.etag)
+        self.assertEqual(after.etag, board.current.etag)
+        # A published snapshot is never changed under a reader holding it
+        self.assertEqual(before.statuses, {'camera1': 'STOPPED'})
+        self.assertEqual(after.statuses, {'camera1': 'ONLINE'})
+
+    def test_etag_differs_between_runs(self):
+        self.assertNotEqual(StatusBoard().current.etag, StatusBoard().current.etag)
+
+    def test_error_without_status_change_keeps_changed_at(self):
+        board = StatusBoard(['camera1'])
+        first = board.publish(lambda s: s.updated('camera1', 'ERROR', error='timeout'))
+        second = board.publish(lambda s: s.updated('camera1', 'ERROR', error='timeout again'))
+        self.assertEqual(first.changed_at, second.changed_at)
+        self.assertEqual(second.last_error['camera1']['message'], 'timeout again')
+        self.assertNotEqual(first.etag, second.etag)
+
+    def test_long_poll_wakes_on_change(self):
+        board = StatusBoard(['camera1'])
+        version = board.current.version
+        timer = threading.Timer(0.05, board.publish, [lambda s: s.updated('camera1', 'ONLINE')])
+        timer.start()
+        started = time.monotonic()
+        snapshot = board.wait(version, timeout=5)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(snapshot.statuses['camera1'], 'ONLINE')
+
+    def test_long_poll_times_out_unchanged(self):
+        board = StatusBoard(['camera1'])
+        before = board.current
+        snapshot = board.wait(before.version, timeout=0.05)
+        self.assertEqual(snapshot.etag, before.etag)
+
+    def test_removed_systems_are_dropped(self):
+        board = StatusBoard(['camera1', 'camera2'])
+        board.publish(lambda s: s.updated('camera2', 'ERROR', error='gone').with_reconnect('camera2', {'attempts': 1}))
+        snapshot = board.publish(lambda s: s.without({'camera2'}))
+        self.assertEqual(snapshot.statuses, {'camera1': 'STOPPED'})
+        self.assertEqual(snapshot.last_error, {})
+        self.assertEqual(snapshot.reconnect, {})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import itertools
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from metrics import RollingHistogram
+
+def _summary_ms(histogram):
+    summary = histogram.summary()
+    return {
+        key: (round(value * 1000, 3) if value is not None and key != 'count' else value)
+        for key, value in summary.items()
+    }
+
+class Watchdog:
+    """
+    Watches the browser worker from outside it. The worker marks every pass of its
+    loop (beat) and every task it runs (begin/end); a monitor thread notices when a
+    task, or the loop itself, has gone past stall_s and captures the worker's stack
+    at that moment, along with the systems the task was working on.
+    """
+
+    def __init__(self, stall_s=5.0, beat_s=0.1, on_stall=None, history=20):
+        self.stall_s = stall_s
+        self.beat_s = beat_s # how long a pass of the loop takes when idle
+        self.on_stall = on_stall
+        self.lock = threading.Lock()
+        self.thread = None
+        self.loop_lag = RollingHistogram()
+        self.task_durations = {} # kind -> RollingHistogram, seconds
+        self.running = {}        # token -> task dict
+        self.tokens = itertools.count()
+        self.last_beat = None
+        self.loop_stalled = False
+        self.stalls = deque(maxlen=history)
+        self.stall_count = 0
+        self.stopped = threading.Event()
+        self.monitor = threading.Thread(target=self._monitor_loop, daemon=True)
+
+    def watch(self, thread):
+        """Starts watching the worker thread."""
+        self.thread = thread
+        if not self.monitor.is_alive():
+            self.monitor.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def beat(self):
+        """Marks a pass of the worker loop. Anything past beat_s since the last one is lag."""
+        now = time.time()
+        with self.lock:
+            if self.last_beat is not None:
+                self.loop_lag.add(max(0.0, now - self.last_beat - self.beat_s))
+            self.last_beat = now
+            self.loop_stalled = False
+
+    def begin(self, kind, sys_ids=(), task=None):
+        """
+        Marks the start of a task on the given systems. task: the asyncio task running
+        it, whose stack is captured instead of the thread's. Returns a token for end().
+        """
+        token = next(self.tokens)
+        with self.lock:
+            self.running[token] = {
+                'kind': kind, 'sys_ids': list(sys_ids), 'system': None,
+                'started': time.time(), 'task': task, 'stall': None
+            }
+        return token
+
+    def at(self, token, sys_id):
+        """Notes which system a multi-system task is working on right now."""
+        with self.lock:
+            if token in self.running:
+                self.running[token]['system'] = sys_id
+
+    def end(self, token):
+        """Marks a task finished. Returns its stall record if it stalled, else None."""
+        now = time.time()
+        with self.lock:
+            running = self.running.pop(token, None)
+            if running is None:
+                return None
+            histogram = self.task_durations.get(running['kind'])
+            if histogram is None:
+                histogram = self.task_durations[running['kind']] = RollingHistogram()
+            histogram.add(now - running['started'])
+            if running['stall']:
+                running['stall']['finished_after_s'] = round(now - running['started'], 3)
+            return running['stall']
+
+    def _monitor_loop(self):
+        while not self.stopped.wait(min(1.0, self.stall_s / 4)):
+            self.check()
+
+    def check(self):
+        """Records a stall for every task (or a loop pass) that has just gone past stall_s."""
+        now = time.time()
+        stalls = []
+        with self.lock:
+            for running in self.running.values():
+                if running['stall'] is None and now - running['started'] > self.stall_s:
+                    system = running['system']
+                    if system is None and len(running['sys_ids']) == 1:
+                        system = running['sys_ids'][0]
+                    running['stall'] = {
+                        'kind': running['kind'], 'sys_ids': running['sys_ids'], 'system': system,
+                        'started_at': running['started'], 'stalled_for_s': round(now - running['started'], 3),
+                        'finished_after_s': None, 'recycled': False
+                    }
+                    stalls.append((running['stall'], running['task']))
+            # A stuck task already accounts for the loop not coming round
+            if (not self.running and not self.loop_stalled and self.last_beat is not None
+                    and now - self.last_beat > self.stall_s):
+                self.loop_stalled = True
+                stalls.append(({
+                    'kind': 'loop', 'sys_ids': [], 'system': None,
+                    'started_at': self.last_beat, 'stalled_for_s': round(now - self.last_beat, 3),
+                    'finished_after_s': None, 'recycled': False
+                }, None))
+
+        for stall, task in stalls:
+            stall['stack'] = self._stack(task)
+            with self.lock:
+                self.stalls.append(stall)
+                self.stall_count += 1
+            if self.on_stall:
+                try:
+                    self.on_stall(stall)
+                except Exception as e:
+                    print(f"Watchdog: stall handler failed: {e}")
+
+    def _stack(self, task):
+        """Formatted stack of the asyncio task if given, else of the worker thread."""
+        if task is not None:
+            frames = task.get_stack()
+            return ''.join(traceback.format_list(traceback.StackSummary.extract((f, f.f_lineno) for f in frames)))
+        frame = sys._current_frames().get(self.thread.ident) if self.thread else None
+        if frame is None:
+            return ''
+        return ''.join(traceback.format_stack(frame))
+
+    def report(self, stacks=True):
+        """Loop lag and task durations (ms), what is running now, and recent stalls, oldest first."""
+        now = time.time()
+        with self.lock:
+            return {
+                'stall_ms': self.stall_s * 1000,
+                'loop_lag_ms': _summary_ms(self.loop_lag),
+                'last_beat_ago_ms': round((now - self.last_beat) * 1000, 1) if self.last_beat else None,
+                'tasks_ms': {kind: _summary_ms(h) for kind, h in self.task_durations.items()},
+                'running': [
+                    {'kind': r['kind'], 'sys_ids': r['sys_ids'], 'system': r['system'],
+                     'running_ms': round((now - r['started']) * 1000, 1)}
+                    for r in self.running.values()
+                ],
+                'stall_count': self.stall_count,
+                'stalls': [
+                    stall if stacks else {k: v for k, v in stall.items() if k != 'stack'}
+                    for stall in self.stalls
+                ],
+            }
+
+def merge_reports(reports):
+    """
+    Combines Watchdog.report() results, e.g. one per shard. Running tasks and stalls
+    are concatenated; for loop lag and each task kind, the worst shard's is kept.
+    """
+    def worse(a, b):
+        return b if (b.get('p99') or 0) > (a.get('p99') or 0) else a
+
+    merged = {'stall_ms': None, 'loop_lag_ms': {}, 'last_beat_ago_ms': None, 'tasks_ms': {},
+              'running': [], 'stall_count': 0, 'stalls': []}
+    for report in reports:
+        merged['stall_ms'] = report['stall_ms']
+        merged['loop_lag_ms'] = worse(merged['loop_lag_ms'], report['loop_lag_ms'])
+        merged['last_beat_ago_ms'] = max(merged['last_beat_ago_ms'] or 0, report['last_beat_ago_ms'] or 0)
+        for kind, summary in report['tasks_ms'].items():
+            merged['tasks_ms'][kind] = worse(merged['tasks_ms'].get(kind, {}), summary)
+        merged['running'].extend(report['running'])
+        merged['stall_count'] += report['stall_count']
+        merged['stalls'].extend(report['stalls'])
+    merged['stalls'].sort(key=lambda stall: stall['started_at'])
+    return merged
+
+def report_to_prometheus(report):
+    lines = [
+        '# HELP mbt_worker_loop_lag_seconds Delay of the browser worker loop past its idle pass.',
+        '# TYPE mbt_worker_loop_lag_seconds summary',
+    ]
+    for key, quantile in [('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99')]:
+        value = report['loop_lag_ms'].get(key)
+        if value is not None:
+            lines.append(f'mbt_worker_loop_lag_seconds{{quantile="{quantile}"}} {value / 1000:.6f}')
+    lines.append('# HELP mbt_worker_stalls_total Worker tasks or loop passes that ran past the stall threshold.')
+    lines.append('# TYPE mbt_worker_stalls_total counter')
+    lines.append(f'mbt_worker_stalls_total {report["stall_count"]}')
+    return '\n'.join(lines) + '\n'